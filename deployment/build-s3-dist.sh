@@ -100,32 +100,41 @@ echo "--------------------------------------------------------------------------
 echo "cd $source_dir"
 cd $source_dir
 
-echo "zip -q -r9 $build_dist_dir/create-athena-views-lambda.zip . -i create-athena-views-lambda.py"
-zip -q -r9 $build_dist_dir/create-athena-views-lambda.zip . -i create-athena-views-lambda.py
+echo "zip -q -r9 $build_dist_dir/compact-ta-data-lambda.zip . -i compact-ta-data-lambda.py client_factory.py data_layout.py pii_masking.py"
+zip -q -r9 $build_dist_dir/compact-ta-data-lambda.zip . -i compact-ta-data-lambda.py client_factory.py data_layout.py pii_masking.py
 
-echo "zip -q -r9 $build_dist_dir/extract-ta-data-lambda.zip . -i extract-ta-data-lambda.py"
-zip -q -r9 $build_dist_dir/extract-ta-data-lambda.zip . -i extract-ta-data-lambda.py
+echo "zip -q -r9 $build_dist_dir/create-athena-views-lambda.zip . -i create-athena-views-lambda.py client_factory.py glue_catalog.py pii_masking.py"
+zip -q -r9 $build_dist_dir/create-athena-views-lambda.zip . -i create-athena-views-lambda.py client_factory.py glue_catalog.py pii_masking.py
 
-echo "zip -q -r9 $build_dist_dir/ extract-tag-data-lambda.zip  extract-tag-data-lambda.py"
-zip -q -r9 $build_dist_dir/extract-tag-data-lambda.zip . -i  extract-tag-data-lambda.py
+echo "zip -q -r9 $build_dist_dir/enrich-ta-data-lambda.zip . -i enrich-ta-data-lambda.py client_factory.py data_layout.py glue_catalog.py pii_masking.py"
+zip -q -r9 $build_dist_dir/enrich-ta-data-lambda.zip . -i enrich-ta-data-lambda.py client_factory.py data_layout.py glue_catalog.py pii_masking.py
 
-echo "zip -q -r9 $build_dist_dir/get-accounts-info-lambda.zip . -i get-accounts-info-lambda.py"
-zip -q -r9 $build_dist_dir/get-accounts-info-lambda.zip . -i get-accounts-info-lambda.py
+echo "zip -q -r9 $build_dist_dir/extract-ta-data-lambda.zip . -i extract-ta-data-lambda.py client_factory.py credential_cache.py glue_catalog.py refresh_planner.py phase_metrics.py pii_masking.py s3_writer.py"
+zip -q -r9 $build_dist_dir/extract-ta-data-lambda.zip . -i extract-ta-data-lambda.py client_factory.py credential_cache.py glue_catalog.py refresh_planner.py phase_metrics.py pii_masking.py s3_writer.py
 
-echo "zip -q -r9 $build_dist_dir/get-ta-checks-lambda.zip . -i get-ta-checks-lambda.py"
-zip -q -r9 $build_dist_dir/get-ta-checks-lambda.zip . -i get-ta-checks-lambda.py
+echo "zip -q -r9 $build_dist_dir/extract-tag-data-lambda.zip . -i extract-tag-data-lambda.py client_factory.py credential_cache.py glue_catalog.py phase_metrics.py pii_masking.py s3_writer.py"
+zip -q -r9 $build_dist_dir/extract-tag-data-lambda.zip . -i extract-tag-data-lambda.py client_factory.py credential_cache.py glue_catalog.py phase_metrics.py pii_masking.py s3_writer.py
 
-echo "zip -q -r9 $build_dist_dir/get-tags-lambda.zip . -i get-tags-lambda.py"
-zip -q -r9 $build_dist_dir/get-tags-lambda.zip . -i get-tags-lambda.py
+echo "zip -q -r9 $build_dist_dir/get-accounts-info-lambda.zip . -i get-accounts-info-lambda.py client_factory.py glue_catalog.py phase_metrics.py pii_masking.py"
+zip -q -r9 $build_dist_dir/get-accounts-info-lambda.zip . -i get-accounts-info-lambda.py client_factory.py glue_catalog.py phase_metrics.py pii_masking.py
 
-echo "zip -q -r9 $build_dist_dir/refresh-ta-check-lambda.zip . -i refresh-ta-check-lambda.py"
-zip -q -r9 $build_dist_dir/refresh-ta-check-lambda.zip . -i refresh-ta-check-lambda.py
+echo "zip -q -r9 $build_dist_dir/get-ta-checks-lambda.zip . -i get-ta-checks-lambda.py client_factory.py phase_metrics.py pii_masking.py"
+zip -q -r9 $build_dist_dir/get-ta-checks-lambda.zip . -i get-ta-checks-lambda.py client_factory.py phase_metrics.py pii_masking.py
 
-echo "zip -q -r9 $build_dist_dir/start-crawler-lambda.zip . -i start-crawler-lambda.py"
-zip -q -r9 $build_dist_dir/start-crawler-lambda.zip . -i start-crawler-lambda.py
+echo "zip -q -r9 $build_dist_dir/get-tags-lambda.zip . -i get-tags-lambda.py client_factory.py phase_metrics.py pii_masking.py"
+zip -q -r9 $build_dist_dir/get-tags-lambda.zip . -i get-tags-lambda.py client_factory.py phase_metrics.py pii_masking.py
 
-echo "zip -q -r9 $build_dist_dir/verify-ta-check-status-lambda.zip . -i verify-ta-check-status-lambda.py"
-zip -q -r9 $build_dist_dir/verify-ta-check-status-lambda.zip . -i verify-ta-check-status-lambda.py
+echo "zip -q -r9 $build_dist_dir/refresh-ta-check-lambda.zip . -i refresh-ta-check-lambda.py client_factory.py credential_cache.py refresh_planner.py phase_metrics.py pii_masking.py"
+zip -q -r9 $build_dist_dir/refresh-ta-check-lambda.zip . -i refresh-ta-check-lambda.py client_factory.py credential_cache.py refresh_planner.py phase_metrics.py pii_masking.py
+
+echo "zip -q -r9 $build_dist_dir/rollup-ta-data-lambda.zip . -i rollup-ta-data-lambda.py client_factory.py data_layout.py glue_catalog.py pii_masking.py"
+zip -q -r9 $build_dist_dir/rollup-ta-data-lambda.zip . -i rollup-ta-data-lambda.py client_factory.py data_layout.py glue_catalog.py pii_masking.py
+
+echo "zip -q -r9 $build_dist_dir/start-crawler-lambda.zip . -i start-crawler-lambda.py client_factory.py pii_masking.py"
+zip -q -r9 $build_dist_dir/start-crawler-lambda.zip . -i start-crawler-lambda.py client_factory.py pii_masking.py
+
+echo "zip -q -r9 $build_dist_dir/verify-ta-check-status-lambda.zip . -i verify-ta-check-status-lambda.py client_factory.py credential_cache.py phase_metrics.py pii_masking.py"
+zip -q -r9 $build_dist_dir/verify-ta-check-status-lambda.zip . -i verify-ta-check-status-lambda.py client_factory.py credential_cache.py phase_metrics.py pii_masking.py
 
 echo "zip -q -r9 $build_dist_dir/solution-helper.zip . -i solution-helper.py"
 zip -q -r9 $build_dist_dir/solution-helper.zip . -i solution-helper.py
@@ -0,0 +1,24 @@
+#!/bin/bash
+#
+# This assumes all of the OS-level configuration has been completed and git repo has already been cloned
+#
+# This script should be run from the repo's deployment directory
+# cd deployment
+# ./run-benchmarks.sh [--sizes 10,1000] [--only genericTAParse,tags,accounts] [--update-baselines]
+#
+# The benchmarks run offline against stubbed AWS clients and need boto3
+# (and pyarrow for --output-format Parquet). The run fails when a case is
+# slower or uses more memory than source/benchmark/baselines.json allows.
+#
+
+# Get reference for all important folders
+template_dir="$PWD"
+source_dir="$template_dir/../source"
+
+echo "Running benchmarks"
+echo "cd $source_dir/benchmark"
+cd $source_dir/benchmark
+python3 run_benchmarks.py "$@"
+status=$?
+echo "Completed benchmarks"
+exit $status
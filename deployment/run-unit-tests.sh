@@ -15,5 +15,6 @@ source_dir="$template_dir/../source"
 echo "Running unit tests"
 echo "cd ../source"
 cd ../source
-echo "No unit tests to run, so sad ..."
-echo "Completed unit tests"
\ No newline at end of file
+echo "python3 -m unittest discover -s tests -t ."
+python3 -m unittest discover -s tests -t . || exit 1
+echo "Completed unit tests"
@@ -0,0 +1,212 @@
+######################################################################################################################
+#  Copyright 2019 Amazon.com, Inc. or its affiliates. All Rights Reserved.                                           #
+#                                                                                                                    #
+#  Licensed under the Apache License Version 2.0 (the "License"). You may not use this file except in compliance     #
+#  with the License. A copy of the License is located at                                                             #
+#                                                                                                                    #
+#      http://www.apache.org/licenses/                                                                               #
+#                                                                                                                    #
+#  or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES #
+#  OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific language governing permissions    #
+#  and limitations under the License.                                                                                #
+######################################################################################################################
+
+"""
+run_benchmarks
+Offline benchmarks of the extract & account listing paths.
+
+The Lambda modules are loaded unchanged with client_factory.getClient replaced
+by the stubs module, and fed synthetic payloads from ta_generator:
+genericTAParse    one check result per Header_/Schema_ check & size
+tags              getTagInfo + write2csv for one account & region
+accounts          list_accounts_from_organizations, list_accounts_from_file
+                  (plain & gzip) and batch_accounts
+For each case the best wall time of --repeat runs is reported with the row
+rate, then one more run under tracemalloc gives the peak traced memory and
+the memory still allocated afterwards (container caches, leaks). Results are compared
+with baselines.json; a case slower than --time-tolerance or using more
+memory than --memory-tolerance fails the run. Timings are machine specific,
+so record baselines (--update-baselines) on the machine that checks them.
+
+Usage: python run_benchmarks.py [--sizes 10,1000] [--only genericTAParse]
+"""
+import argparse,gc,gzip,importlib.util,json,logging,os,sys,time,tracemalloc
+
+benchmarkDir=os.path.dirname(os.path.abspath(__file__))
+sourceDir=os.path.dirname(benchmarkDir)
+sys.path.insert(0,sourceDir)
+sys.path.insert(0,benchmarkDir)
+
+import stubs,ta_generator
+
+baselinesPath=os.path.join(benchmarkDir,'baselines.json')
+accountId='123456789012'
+tagKeys=['CostCenter','Owner','Environment']
+resourceTypes=['ec2:instance','ec2:volume']
+
+def setEnvironment(args):
+    os.environ.update(ta_generator.getTemplateEnvironment('ExtractTAData'))
+    os.environ.update({'S3BucketName':'benchmark-bucket','MASK_PII':'true',
+        'LOG_LEVEL':args.log_level,'IAMRoleName':'benchmark-role',
+        'OutputFormat':args.output_format,'CustomerKeys':','.join(tagKeys),
+        'BUCKET_NAME':'benchmark-bucket','AWS_REGION':'us-east-1'})
+    for key in ('PartitionLayout','PartitionDiscovery','IncrementalMode'):
+        os.environ.pop(key,None)
+
+def loadLambda(fileName):
+    spec=importlib.util.spec_from_file_location(fileName[:-3].replace('-','_'),
+        os.path.join(sourceDir,fileName))
+    module=importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+#Run fn repeat times for the best wall time, then once more under tracemalloc
+def measure(fn,repeat):
+    best=None
+    for _ in range(repeat):
+        gc.collect()
+        start=time.perf_counter()
+        fn()
+        elapsed=time.perf_counter()-start
+        best=elapsed if best is None else min(best,elapsed)
+    gc.collect()
+    tracemalloc.start()
+    result=fn()
+    del result
+    gc.collect()
+    retained,peak=tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best,peak,retained
+
+def repeatFor(size,repeat):
+    return max(1,repeat if size <= 1000 else repeat//3 if size <= 10000 else 1)
+
+def taCases(sizes,repeat):
+    extract=loadLambda('extract-ta-data-lambda.py')
+    clients=stubs.clients
+    environment=dict(os.environ)
+    for checkId in ta_generator.getChecks(environment):
+        for size in sizes:
+            clients.support.results={checkId:ta_generator.checkResult(checkId,
+                environment,size,seed=size)}
+            fn=lambda: extract.genericTAParse(clients.support,checkId,accountId,
+                'Benchmark Account','benchmark@example.com','en','05-07-2020',
+                '2020-05-07 09:00:00','Benchmark Check','cost_optimizing')
+            yield 'genericTAParse/'+checkId+'/'+str(size),size,fn,repeatFor(size,repeat)
+    clients.support.results={}
+
+def tagCases(sizes,repeat):
+    tags=loadLambda('extract-tag-data-lambda.py')
+    header=['Date','DateTime','AccountId','AccountName','AccountEmail','RegionName',
+        'ResourceType','ResourceArn','ResourceId']+tagKeys
+    for size in sizes:
+        stubs.clients.tagging.pages=ta_generator.tagPages(accountId,'us-east-1',
+            size,tagKeys,seed=size)
+        def fn():
+            tagInfo=tags.getTagInfo(accountId,'us-east-1',resourceTypes,tagKeys,
+                '05-07-2020','2020-05-07 09:00:00','Benchmark Account',
+                'benchmark@example.com')
+            for resourceType in resourceTypes:
+                tags.write2csv(tagInfo[resourceType],resourceType+'.csv',header,'Tags/')
+        yield 'tags/'+str(size),size,fn,repeatFor(size,repeat)
+    stubs.clients.tagging.pages=[]
+
+def accountCases(sizes,repeat):
+    accounts=loadLambda('get-accounts-info-lambda.py')
+    for size in sizes:
+        stubs.clients.organizations.pages=ta_generator.accountPages(size)
+        yield ('accounts/organizations/'+str(size),size,
+            accounts.list_accounts_from_organizations,repeatFor(size,repeat))
+        body=ta_generator.accountFile(size)
+        for objectName,data in (('accounts.csv',body),('accounts.csv.gz',gzip.compress(body))):
+            stubs.clients.s3.objects[objectName]=data
+            def fn(objectName=objectName):
+                os.environ['OBJECT_NAME']=objectName
+                return accounts.list_accounts_from_file()
+            yield 'accounts/file/'+objectName+'/'+str(size),size,fn,repeatFor(size,repeat)
+        parsed=accounts.list_accounts_from_file()['accounts']
+        yield ('accounts/batch/'+str(size),size,
+            lambda: accounts.batch_accounts(parsed,32768),repeatFor(size,repeat))
+    stubs.clients.organizations.pages=[]
+    stubs.clients.s3.objects={}
+
+suites={'genericTAParse':taCases,'tags':tagCases,'accounts':accountCases}
+
+#Cases worse than the baseline by more than the tolerances
+def compare(results,baselines,timeTolerance,memoryTolerance):
+    regressions=[]
+    for name,result in results.items():
+        baseline=baselines.get(name)
+        if baseline is None:
+            continue
+        #Sub-millisecond cases are too noisy for a relative time check
+        if result['Seconds'] > max(baseline['Seconds']*(1+timeTolerance),
+                baseline['Seconds']+0.001):
+            regressions.append(name+': '+str(result['Seconds'])+'s, baseline '+
+                str(baseline['Seconds'])+'s')
+        if result['PeakKiB'] > baseline['PeakKiB']*(1+memoryTolerance):
+            regressions.append(name+': '+str(result['PeakKiB'])+' KiB peak, baseline '+
+                str(baseline['PeakKiB'])+' KiB')
+    return regressions
+
+def main(argv=None):
+    parser=argparse.ArgumentParser(description='Offline benchmarks of the '+
+        'Trusted Advisor Explorer extract paths')
+    parser.add_argument('--sizes',default='10,1000,10000,100000',
+        help='flagged resources, tagged resources & accounts per case')
+    parser.add_argument('--only',default=','.join(suites),
+        help='comma separated suites: '+', '.join(suites))
+    parser.add_argument('--repeat',type=int,default=5)
+    parser.add_argument('--log-level',default='ERROR',
+        help='LOG_LEVEL of the Lambdas; INFO measures the logging overhead')
+    parser.add_argument('--output-format',default='CSV',choices=['CSV','Parquet'])
+    parser.add_argument('--time-tolerance',type=float,default=0.5)
+    parser.add_argument('--memory-tolerance',type=float,default=0.2)
+    parser.add_argument('--baselines',default=baselinesPath)
+    parser.add_argument('--update-baselines',action='store_true')
+    args=parser.parse_args(argv)
+    sizes=[int(x) for x in args.sizes.split(',')]
+    setEnvironment(args)
+    stubs.install()
+    #Log records are formatted & written, as they would be to CloudWatch
+    handler=logging.StreamHandler(open(os.devnull,'w'))
+    handler.setFormatter(logging.Formatter('[%(levelname)s] %(asctime)s %(message)s'))
+    logging.getLogger().addHandler(handler)
+    results={}
+    print('%-52s %10s %12s %10s %11s %8s' % ('Case','Seconds','Rows/s','PeakKiB',
+        'RetainedKiB','Calls'))
+    for suite in args.only.split(','):
+        for name,rows,fn,repeat in suites[suite](sizes,args.repeat):
+            stubs.calls.clear()
+            seconds,peak,retained=measure(fn,repeat)
+            results[name]={'Seconds':round(seconds,6),
+                'RowsPerSecond':int(rows/seconds) if seconds > 0 else 0,
+                'PeakKiB':round(peak/1024,1),'RetainedKiB':round(retained/1024,1),
+                'Calls':sum(stubs.calls.values())//(repeat+1)}
+            print('%-52s %10.4f %12d %10.1f %11.1f %8d' % (name,seconds,
+                results[name]['RowsPerSecond'],results[name]['PeakKiB'],
+                results[name]['RetainedKiB'],
+                results[name]['Calls']))
+    if args.update_baselines:
+        baselines={}
+        if os.path.exists(args.baselines):
+            with open(args.baselines) as f:
+                baselines=json.load(f)
+        baselines.update(results)
+        with open(args.baselines,'w') as f:
+            json.dump(baselines,f,indent=2,sort_keys=True)
+            f.write('\n')
+        print('Updated '+args.baselines)
+        return 0
+    if not os.path.exists(args.baselines):
+        print('No baselines at '+args.baselines+'; run with --update-baselines')
+        return 0
+    with open(args.baselines) as f:
+        regressions=compare(results,json.load(f),args.time_tolerance,
+            args.memory_tolerance)
+    for regression in regressions:
+        print('REGRESSION '+regression)
+    return 1 if regressions else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,449 @@
+######################################################################################################################
+#  Copyright 2019 Amazon.com, Inc. or its affiliates. All Rights Reserved.                                           #
+#                                                                                                                    #
+#  Licensed under the Apache License Version 2.0 (the "License"). You may not use this file except in compliance     #
+#  with the License. A copy of the License is located at                                                             #
+#                                                                                                                    #
+#      http://www.apache.org/licenses/                                                                               #
+#                                                                                                                    #
+#  or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES #
+#  OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific language governing permissions    #
+#  and limitations under the License.                                                                                #
+######################################################################################################################
+
+"""
+sim_backends
+Simulated time and AWS stand-ins for the pipeline simulator.
+
+Lambda code runs unchanged on a simulated clock: time.time/time.sleep,
+datetime.now/utcnow, ThreadPoolExecutor and as_completed of the loaded
+modules are replaced by the objects below. Pool tasks run one after the other
+in the calling thread but are placed on max_workers simulated workers, so a
+pool of 8 workers takes as long as its slowest worker and not the sum of its
+tasks. CPU time spent in the Lambda code is added to the clock (scaled by
+Clock.cpuScale).
+
+Every API call waits its modelled latency. Calls above the modelled rate of a
+service (per second, per account for the member account services) are
+throttled and retried like botocore's legacy retry mode (5 attempts,
+exponential backoff with jitter); the last throttle raises ThrottlingException.
+"""
+import io,json,random,time,zlib
+from collections import Counter
+from concurrent.futures import Future
+from datetime import datetime,timedelta,timezone
+from botocore.exceptions import ClientError
+import ta_generator
+
+#Latency (seconds) & rate (calls per second) per service; Operations overrides
+#the latency of single operations. Scope "Account" limits each member account
+#separately, "Hub" limits the solution account.
+defaultModel={
+    'sts':{'Latency':0.1,'Rate':100,'Scope':'Hub'},
+    'support':{'Latency':0.3,'Rate':10,'Scope':'Account',
+        'Operations':{'describe_trusted_advisor_check_result':0.6,
+            'describe_trusted_advisor_checks':0.5}},
+    'resourcegroupstaggingapi':{'Latency':0.25,'Rate':5,'Scope':'Account'},
+    'organizations':{'Latency':0.2,'Rate':2,'Scope':'Hub'},
+    'stepfunctions':{'Latency':0.05,'Rate':300,'Scope':'Hub'},
+    's3':{'Latency':0.03,'Rate':3500,'Scope':'Hub'},
+    'glue':{'Latency':0.1,'Rate':50,'Scope':'Hub'},
+    'ec2':{'Latency':0.1,'Rate':20,'Scope':'Hub'},
+    #Trusted Advisor refreshes: enqueued for EnqueueSeconds, done after
+    #RefreshSeconds, refreshable again after CooldownSeconds
+    'refresh':{'EnqueueSeconds':5,'RefreshSeconds':60,'CooldownSeconds':300},
+    #Lambda: account concurrency, cold start & time added per invocation
+    'lambda':{'Concurrency':1000,'ColdStartSeconds':0.5,'InvokeSeconds':0.02}}
+
+class Clock(object):
+    def __init__(self,cpuScale=1.0):
+        self.cpuScale=cpuScale
+        self.epoch=time.time()
+        self.now=0.0
+        self.mark=None
+
+    #Run Lambda code from simulated time at
+    def start(self,at):
+        self.now=at
+        self.mark=time.perf_counter()
+
+    def stop(self):
+        self.sync()
+        self.mark=None
+        return self.now
+
+    #Add the CPU time spent since the last call
+    def sync(self):
+        if self.mark is not None:
+            mark=time.perf_counter()
+            self.now+=(mark-self.mark)*self.cpuScale
+            self.mark=mark
+        return self.now
+
+    def advance(self,seconds):
+        self.sync()
+        self.now+=seconds
+
+clock=Clock()
+
+class SimTime(object):
+    def time(self):
+        return clock.epoch+clock.sync()
+
+    def sleep(self,seconds):
+        clock.advance(seconds)
+
+    def __getattr__(self,name):
+        return getattr(time,name)
+
+class SimDatetime(datetime):
+    @classmethod
+    def now(cls,tz=None):
+        return cls.fromtimestamp(clock.epoch+clock.sync(),tz)
+
+    @classmethod
+    def utcnow(cls):
+        return cls.utcfromtimestamp(clock.epoch+clock.sync())
+
+class Executor(object):
+    def __init__(self,max_workers=None,**kwargs):
+        self.workers=[clock.sync()]*(max_workers or 8)
+        self.futures=[]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,*args):
+        self.shutdown()
+        return False
+
+    def submit(self,fn,*args,**kwargs):
+        now=clock.sync()
+        worker=min(range(len(self.workers)),key=self.workers.__getitem__)
+        clock.now=max(now,self.workers[worker])
+        future=Future()
+        try:
+            future.set_result(fn(*args,**kwargs))
+        except Exception as e:
+            future.set_exception(e)
+        future.end=clock.sync()
+        self.workers[worker]=future.end
+        clock.now=now
+        self.futures.append(future)
+        return future
+
+    def map(self,fn,*iterables):
+        futures=[self.submit(fn,*args) for args in zip(*iterables)]
+        def results():
+            for future in futures:
+                wait(future)
+                yield future.result()
+        return results()
+
+    def shutdown(self,wait=True,**kwargs):
+        if wait and self.futures:
+            clock.now=max(clock.sync(),max(x.end for x in self.futures))
+
+def wait(future):
+    clock.now=max(clock.sync(),future.end)
+
+def as_completed(futures,timeout=None):
+    for future in sorted(futures,key=lambda x:x.end):
+        wait(future)
+        yield future
+
+def clientError(code,operation,message=''):
+    return ClientError({'Error':{'Code':code,'Message':message or code}},operation)
+
+#Counts, latency & throttling of the API calls of every service
+class Backend(object):
+    def __init__(self,model,seed=0):
+        self.model=model
+        self.random=random.Random(seed)
+        self.calls=Counter()
+        self.throttles=Counter()
+        self.windows=Counter()
+
+    def call(self,service,operation,account):
+        model=self.model[service]
+        latency=model.get('Operations',{}).get(operation,model['Latency'])
+        scope=account if model.get('Scope') == 'Account' else 'hub'
+        name=service+'.'+operation
+        for attempt in range(1,6):
+            self.calls[name]+=1
+            clock.advance(latency)
+            window=(service,scope,int(clock.now))
+            self.windows[window]+=1
+            if self.windows[window] <= model['Rate']:
+                return
+            self.throttles[name]+=1
+            if attempt < 5:
+                clock.advance(self.random.random()*2**(attempt-1))
+        raise clientError('ThrottlingException',operation,'Rate exceeded')
+
+class Paginator(object):
+    def __init__(self,client,operation,pages):
+        self.client=client
+        self.operation=operation
+        self.pages=pages
+
+    def paginate(self,**kwargs):
+        for page in self.pages(**kwargs):
+            self.client.call(self.operation)
+            yield page
+
+class Client(object):
+    service=None
+
+    def __init__(self,world,region,account):
+        self.world=world
+        self.region=region or 'us-east-1'
+        self.account=account
+
+    def call(self,operation):
+        self.world.backend.call(self.service,operation,self.account)
+
+class STS(Client):
+    service='sts'
+
+    def assume_role(self,RoleArn,RoleSessionName,**kwargs):
+        self.call('assume_role')
+        accountId=RoleArn.split(':')[4]
+        return {'Credentials':{'AccessKeyId':'ASIA'+accountId,
+            'SecretAccessKey':'secret','SessionToken':'token',
+            'Expiration':SimDatetime.now(timezone.utc)+timedelta(hours=1)}}
+
+class S3(Client):
+    service='s3'
+
+    def put_object(self,Bucket,Key,Body=b'',**kwargs):
+        self.call('put_object')
+        self.world.objects[(Bucket,Key)]=(Body.encode('utf-8') if isinstance(Body,str)
+            else bytes(Body),SimDatetime.now(timezone.utc))
+        return {}
+
+    def get_object(self,Bucket,Key,**kwargs):
+        self.call('get_object')
+        if (Bucket,Key) not in self.world.objects:
+            raise clientError('NoSuchKey','GetObject')
+        return {'Body':io.BytesIO(self.world.objects[(Bucket,Key)][0])}
+
+    def delete_object(self,Bucket,Key,**kwargs):
+        self.call('delete_object')
+        self.world.objects.pop((Bucket,Key),None)
+        return {}
+
+    def delete_objects(self,Bucket,Delete,**kwargs):
+        self.call('delete_objects')
+        for x in Delete['Objects']:
+            self.world.objects.pop((Bucket,x['Key']),None)
+        return {}
+
+    def create_multipart_upload(self,Bucket,Key,**kwargs):
+        self.call('create_multipart_upload')
+        self.world.uploads[(Bucket,Key)]=[]
+        return {'UploadId':Key}
+
+    def upload_part(self,Bucket,Key,PartNumber,UploadId,Body,**kwargs):
+        self.call('upload_part')
+        self.world.uploads[(Bucket,Key)].append(Body)
+        return {'ETag':'"'+str(PartNumber)+'"'}
+
+    def complete_multipart_upload(self,Bucket,Key,**kwargs):
+        self.call('complete_multipart_upload')
+        self.world.objects[(Bucket,Key)]=(b''.join(self.world.uploads.pop((Bucket,Key))),
+            SimDatetime.now(timezone.utc))
+        return {}
+
+    def abort_multipart_upload(self,Bucket,Key,**kwargs):
+        self.call('abort_multipart_upload')
+        self.world.uploads.pop((Bucket,Key),None)
+        return {}
+
+    def listPages(self,Bucket,Prefix='',Delimiter=None,**kwargs):
+        keys=sorted(key for bucket,key in self.world.objects
+            if bucket == Bucket and key.startswith(Prefix))
+        contents=[]
+        prefixes=[]
+        for key in keys:
+            rest=key[len(Prefix):]
+            if Delimiter and Delimiter in rest:
+                prefix=Prefix+rest.split(Delimiter)[0]+Delimiter
+                if not prefixes or prefixes[-1] != prefix:
+                    prefixes.append(prefix)
+                continue
+            body,modified=self.world.objects[(Bucket,key)]
+            contents.append({'Key':key,'Size':len(body),'LastModified':modified})
+        for i in range(0,max(len(contents),1),1000):
+            yield {'Contents':contents[i:i+1000],
+                'CommonPrefixes':[{'Prefix':x} for x in prefixes] if i == 0 else []}
+
+    def get_paginator(self,operation):
+        return Paginator(self,operation,self.listPages)
+
+class Support(Client):
+    service='support'
+
+    def refreshState(self,checkId):
+        model=self.world.model['refresh']
+        startedAt=self.world.refreshes.get((self.account,checkId))
+        if startedAt is None:
+            return 'none',0,clock.now-86400
+        elapsed=clock.now-startedAt
+        wait=max(0,model['CooldownSeconds']-elapsed)*1000
+        if elapsed < model['EnqueueSeconds']:
+            return 'enqueued',wait,None
+        if elapsed < model['RefreshSeconds']:
+            return 'processing',wait,None
+        return 'success',wait,startedAt+model['RefreshSeconds']
+
+    def describe_trusted_advisor_checks(self,language,**kwargs):
+        self.call('describe_trusted_advisor_checks')
+        return {'checks':[{'id':checkId,'name':'Check '+checkId,
+            'category':'cost_optimizing','description':'','metadata':[]}
+            for checkId in self.world.checkIds]}
+
+    def describe_trusted_advisor_check_result(self,checkId,language,**kwargs):
+        self.call('describe_trusted_advisor_check_result')
+        return self.world.checkResult(checkId)
+
+    def describe_trusted_advisor_check_summaries(self,checkIds,**kwargs):
+        self.call('describe_trusted_advisor_check_summaries')
+        summaries=[]
+        for checkId in checkIds:
+            refreshedAt=self.refreshState(checkId)[2]
+            if refreshedAt is None:
+                refreshedAt=clock.now-86400
+            summaries.append({'checkId':checkId,'timestamp':datetime.utcfromtimestamp(
+                clock.epoch+refreshedAt).strftime('%Y-%m-%dT%H:%M:%SZ'),'status':'warning'})
+        return {'summaries':summaries}
+
+    def describe_trusted_advisor_check_refresh_statuses(self,checkIds,**kwargs):
+        self.call('describe_trusted_advisor_check_refresh_statuses')
+        statuses=[]
+        for checkId in checkIds:
+            status,wait,_=self.refreshState(checkId)
+            statuses.append({'checkId':checkId,'status':status,
+                'millisUntilNextRefreshable':int(wait)})
+        return {'statuses':statuses}
+
+    def refresh_trusted_advisor_check(self,checkId,**kwargs):
+        self.call('refresh_trusted_advisor_check')
+        status,wait,_=self.refreshState(checkId)
+        if status in ('enqueued','processing') or wait > 0:
+            raise clientError('InvalidParameterValueException','RefreshTrustedAdvisorCheck',
+                'Check '+checkId+' is not refreshable yet')
+        self.world.refreshes[(self.account,checkId)]=clock.now
+        status,wait,_=self.refreshState(checkId)
+        return {'status':{'checkId':checkId,'status':status,
+            'millisUntilNextRefreshable':int(wait)}}
+
+class Tagging(Client):
+    service='resourcegroupstaggingapi'
+
+    def get_paginator(self,operation):
+        return Paginator(self,operation,lambda **kwargs: ta_generator.tagPages(
+            self.account,self.region,self.world.taggedResources,
+            self.world.tagKeys,seed=zlib.crc32((self.account+self.region).encode('utf-8'))))
+
+class Organizations(Client):
+    service='organizations'
+
+    def get_paginator(self,operation):
+        return Paginator(self,operation,lambda **kwargs: ta_generator.accountPages(
+            self.world.accounts))
+
+class StepFunctions(Client):
+    service='stepfunctions'
+
+    def start_execution(self,stateMachineArn,input='{}',**kwargs):
+        self.call('start_execution')
+        executionArn=self.world.startExecution(stateMachineArn,json.loads(input))
+        return {'executionArn':executionArn,'startDate':SimDatetime.now(timezone.utc),
+            'ResponseMetadata':{'HTTPStatusCode':200}}
+
+class EC2(Client):
+    service='ec2'
+
+    def describe_regions(self,**kwargs):
+        self.call('describe_regions')
+        return {'Regions':[{'RegionName':x} for x in self.world.regions]}
+
+class GlueExceptions(object):
+    class EntityNotFoundException(ClientError): pass
+
+class Glue(Client):
+    service='glue'
+    exceptions=GlueExceptions
+
+    def get_table(self,DatabaseName,Name,**kwargs):
+        self.call('get_table')
+        if (DatabaseName,Name) not in self.world.tables:
+            raise GlueExceptions.EntityNotFoundException(
+                {'Error':{'Code':'EntityNotFoundException','Message':Name}},'GetTable')
+        return {'Table':self.world.tables[(DatabaseName,Name)]}
+
+    def create_table(self,DatabaseName,TableInput,**kwargs):
+        self.call('create_table')
+        self.world.tables[(DatabaseName,TableInput['Name'])]=TableInput
+        return {}
+
+    def update_table(self,DatabaseName,TableInput,**kwargs):
+        self.call('update_table')
+        self.world.tables[(DatabaseName,TableInput['Name'])]=TableInput
+        return {}
+
+    def tablePages(self,DatabaseName,**kwargs):
+        tables=[dict(x,Name=name) for (database,name),x in sorted(self.world.tables.items())
+            if database == DatabaseName]
+        for i in range(0,max(len(tables),1),100):
+            yield {'TableList':tables[i:i+100]}
+
+    def get_paginator(self,operation):
+        return Paginator(self,operation,self.tablePages)
+
+    def batch_create_partition(self,DatabaseName,TableName,PartitionInputList,**kwargs):
+        self.call('batch_create_partition')
+        errors=[]
+        for partition in PartitionInputList:
+            key=(DatabaseName,TableName,tuple(partition['Values']))
+            if key in self.world.partitions:
+                errors.append({'PartitionValues':partition['Values'],'ErrorDetail':
+                    {'ErrorCode':'AlreadyExistsException','ErrorMessage':'Partition already exists.'}})
+            self.world.partitions.add(key)
+        return {'Errors':errors}
+
+clientTypes={'sts':STS,'s3':S3,'support':Support,'resourcegroupstaggingapi':Tagging,
+    'organizations':Organizations,'stepfunctions':StepFunctions,'ec2':EC2,'glue':Glue}
+
+#State of the simulated AWS accounts, shared by all clients
+class World(object):
+    def __init__(self,model,environment,accounts,flaggedResources,taggedResources,
+            tagKeys,regions,seed=0):
+        self.model=model
+        self.backend=Backend(model,seed)
+        self.environment=environment
+        self.checkIds=ta_generator.getChecks(environment)
+        self.accounts=accounts
+        self.flaggedResources=flaggedResources
+        self.taggedResources=taggedResources
+        self.tagKeys=tagKeys
+        self.regions=regions
+        self.objects={}
+        self.uploads={}
+        self.tables={}
+        self.partitions=set()
+        self.refreshes={}
+        self.results={}
+        self.startExecution=None
+
+    def checkResult(self,checkId):
+        if checkId not in self.results:
+            self.results[checkId]=ta_generator.checkResult(checkId,self.environment,
+                self.flaggedResources)
+        return self.results[checkId]
+
+    #client_factory.getClient replacement; role credentials carry the account
+    def getClient(self,service,region=None,credentials=None):
+        account=credentials['AccessKeyId'][4:] if credentials else 'hub'
+        return clientTypes[service](self,region,account)
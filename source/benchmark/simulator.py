@@ -0,0 +1,659 @@
+######################################################################################################################
+#  Copyright 2019 Amazon.com, Inc. or its affiliates. All Rights Reserved.                                           #
+#                                                                                                                    #
+#  Licensed under the Apache License Version 2.0 (the "License"). You may not use this file except in compliance     #
+#  with the License. A copy of the License is located at                                                             #
+#                                                                                                                    #
+#      http://www.apache.org/licenses/                                                                               #
+#                                                                                                                    #
+#  or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES #
+#  OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific language governing permissions    #
+#  and limitations under the License.                                                                                #
+######################################################################################################################
+
+"""
+simulator
+Runs the Step Functions flow of the main template in process, on simulated
+time, against the stand-ins of sim_backends.
+
+The template is resolved with its parameter defaults (or --parameter
+overrides): every Lambda gets the environment and timeout the stack would
+give it, and the state machines are interpreted from their definitions. The
+run starts with the accounts Lambda, as the ReportSchedule rule does, and
+follows every start_execution call it leads to (MapOrganizations, MapTACheck,
+the tag Maps). Supported states: Task (Lambda, with Parameters & Retry), Choice, Wait,
+Pass, Succeed, Fail and Map (inline or distributed with an S3 JSON
+ItemReader). Map iterations run MaxConcurrency at a time; inline Maps
+without MaxConcurrency run --inline-map-concurrency at a time. The account
+Lambda concurrency limit raises Lambda.TooManyRequestsException, and a Task
+or Map result larger than 256 KiB raises States.DataLimitExceeded before
+ResultPath & OutputPath are applied.
+
+Each Lambda function is one warm container: its module state (client and
+credential caches, check catalog) is shared by all of its invocations.
+
+The report gives the simulated wall time, executions, Lambda invocations,
+API calls & throttles per operation, and the critical path: the chain of
+states that ended last, each with the state that made it start.
+
+Usage: python simulator.py --accounts 100 [--parameter ExtractionMode=Account]
+"""
+import argparse,copy,heapq,importlib.util,json,logging,os,sys,time
+from collections import Counter
+
+benchmarkDir=os.path.dirname(os.path.abspath(__file__))
+sourceDir=os.path.dirname(benchmarkDir)
+sys.path.insert(0,sourceDir)
+sys.path.insert(0,benchmarkDir)
+
+import sim_backends,ta_generator
+from sim_backends import clock
+
+sharedModules=['client_factory','pii_masking','phase_metrics','credential_cache','glue_catalog','refresh_planner']
+accountId='000000000000'
+region='us-east-1'
+
+#Values for the parameters without a default
+parameterDefaults={'CrossAccountRoleName':'TAExplorerMemberRole',
+    'InterestedTagKeys':'CostCenter,Owner,Environment','SNSEmail':'ops@example.com'}
+
+noValue=object()
+
+class Template(object):
+    def __init__(self,template,parameters):
+        self.template=template
+        self.parameters={k:str(v.get('Default',parameterDefaults.get(k,'')))
+            for k,v in template['Parameters'].items()}
+        self.parameters.update(parameters)
+        self.conditions={}
+
+    def condition(self,name):
+        if name not in self.conditions:
+            self.conditions[name]=self.resolve(self.template['Conditions'][name])
+        return self.conditions[name]
+
+    def isEnabled(self,resource):
+        return 'Condition' not in resource or self.condition(resource['Condition'])
+
+    def ref(self,name):
+        if name in self.parameters:
+            return self.parameters[name]
+        if name == 'AWS::NoValue':
+            return noValue
+        pseudo={'AWS::Region':region,'AWS::AccountId':accountId,'AWS::Partition':'aws',
+            'AWS::StackName':'ta-explorer','AWS::URLSuffix':'amazonaws.com'}
+        if name in pseudo:
+            return pseudo[name]
+        resourceType=self.template['Resources'][name]['Type']
+        if resourceType == 'AWS::StepFunctions::StateMachine':
+            return 'arn:aws:states:'+region+':'+accountId+':stateMachine:'+name
+        return name.lower()
+
+    def getAtt(self,name,attribute):
+        resourceType=self.template['Resources'][name]['Type']
+        if resourceType == 'AWS::Lambda::Function' and attribute == 'Arn':
+            return 'arn:aws:lambda:'+region+':'+accountId+':function:'+name
+        return 'arn:aws:'+resourceType.split('::')[1].lower()+':'+region+':'+\
+            accountId+':'+name+('' if attribute == 'Arn' else '/'+attribute)
+
+    def resolve(self,x):
+        if isinstance(x,list):
+            return [y for y in (self.resolve(y) for y in x) if y is not noValue]
+        if not isinstance(x,dict):
+            return x
+        if len(x) != 1:
+            return {k:v for k,v in ((k,self.resolve(v)) for k,v in x.items())
+                if v is not noValue}
+        key,value=list(x.items())[0]
+        if key == 'Ref':
+            return self.ref(value)
+        if key == 'Fn::GetAtt':
+            return self.getAtt(*value)
+        if key == 'Fn::Join':
+            return value[0].join(str(y) for y in self.resolve(value[1]))
+        if key == 'Fn::If':
+            return self.resolve(value[1] if self.condition(value[0]) else value[2])
+        if key == 'Fn::Equals':
+            return str(self.resolve(value[0])) == str(self.resolve(value[1]))
+        if key == 'Fn::Not':
+            return not self.resolve(value[0])
+        if key == 'Fn::And':
+            return all(self.resolve(y) for y in value)
+        if key == 'Fn::Or':
+            return any(self.resolve(y) for y in value)
+        if key == 'Condition':
+            return self.condition(value)
+        if key == 'Fn::FindInMap':
+            return self.template['Mappings'][value[0]][value[1]][value[2]]
+        if key == 'Fn::Select':
+            return self.resolve(value[1])[int(value[0])]
+        if key == 'Fn::Split':
+            return self.resolve(value[1]).split(value[0])
+        value=self.resolve(value)
+        return {key:value} if value is not noValue else noValue
+
+    def functions(self):
+        for name,resource in self.template['Resources'].items():
+            if resource['Type'] == 'AWS::Lambda::Function' and self.isEnabled(resource):
+                yield name,self.resolve(resource['Properties'])
+
+    def stateMachines(self):
+        for name,resource in self.template['Resources'].items():
+            if resource['Type'] == 'AWS::StepFunctions::StateMachine' and self.isEnabled(resource):
+                yield self.ref(name),name,json.loads(self.resolve(
+                    resource['Properties']['DefinitionString']))
+
+class Context(object):
+    def __init__(self,function,timeout):
+        self.function_name=function
+        self.aws_request_id='simulated'
+        self.deadline=clock.now+timeout
+
+    def get_remaining_time_in_millis(self):
+        return int(max(0,self.deadline-clock.sync())*1000)
+
+class TaskFailed(Exception):
+    def __init__(self,error,span):
+        Exception.__init__(self,error)
+        self.error=error
+        self.span=span
+
+def loadModule(name,path):
+    spec=importlib.util.spec_from_file_location(name,path)
+    module=importlib.util.module_from_spec(spec)
+    sys.modules[name]=module
+    spec.loader.exec_module(module)
+    return module
+
+#Patch time, datetime & thread pools of a loaded module with the simulated ones
+def simulate(module):
+    if getattr(module,'time',None) is time:
+        module.time=sim_backends.SimTime()
+    if getattr(module,'datetime',None) is sim_backends.datetime:
+        module.datetime=sim_backends.SimDatetime
+    if hasattr(module,'ThreadPoolExecutor'):
+        module.ThreadPoolExecutor=sim_backends.Executor
+    if hasattr(module,'as_completed'):
+        module.as_completed=sim_backends.as_completed
+
+class Function(object):
+    def __init__(self,simulation,name,properties):
+        self.simulation=simulation
+        self.name=name
+        self.timeout=int(properties.get('Timeout',3))
+        self.environment={k:str(v).lower() if isinstance(v,bool) else str(v)
+            for k,v in properties.get('Environment',{}).get('Variables',{}).items()}
+        self.environment.update(simulation.overrides)
+        fileName,self.handlerName=properties['Handler'].rsplit('.',1)
+        self.path=os.path.join(sourceDir,fileName+'.py')
+        self.handler=None
+        self.containers=[]
+        self.invocations=0
+        self.errors=Counter()
+        self.durations=[]
+
+    #Load the handler with its own copies of the shared modules
+    def load(self):
+        self.simulation.setEnvironment(self)
+        saved={name:sys.modules.pop(name,None) for name in sharedModules}
+        try:
+            modules=[loadModule('client_factory',os.path.join(sourceDir,'client_factory.py'))]
+            modules[0].getClient=self.simulation.world.getClient
+            for name in sharedModules[1:]:
+                modules.append(loadModule(name,os.path.join(sourceDir,name+'.py')))
+            modules.append(loadModule('sim_'+self.name,self.path))
+        finally:
+            for name,module in saved.items():
+                if module is None:
+                    sys.modules.pop(name,None)
+                else:
+                    sys.modules[name]=module
+        for module in modules:
+            simulate(module)
+        self.handler=getattr(modules[-1],self.handlerName)
+
+    #Run the handler at simulated time at; returns (error, output, duration)
+    def invoke(self,event,at):
+        model=self.simulation.world.model['lambda']
+        running=self.simulation.running
+        while running and running[0] <= at:
+            heapq.heappop(running)
+        if len(running) >= model['Concurrency']:
+            self.errors['Lambda.TooManyRequestsException']+=1
+            return 'Lambda.TooManyRequestsException',None,model['InvokeSeconds']
+        self.invocations+=1
+        clock.start(at)
+        self.simulation.setEnvironment(self)
+        if self.handler is None:
+            self.load()
+        #A container is reused when one is idle, otherwise a cold one starts
+        start=model['InvokeSeconds']
+        if not self.containers or self.containers[0] > at:
+            start+=model['ColdStartSeconds']
+        else:
+            heapq.heappop(self.containers)
+        clock.start(at+start)
+        error=None
+        output=None
+        try:
+            output=json.loads(json.dumps(self.handler(copy.deepcopy(event),
+                Context(self.name,self.timeout)),default=str))
+        except Exception as e:
+            error=type(e).__name__
+        end=clock.stop()
+        if end-at > self.timeout:
+            error='Sandbox.Timedout'
+            end=at+self.timeout
+        if error:
+            self.errors[error]+=1
+        heapq.heappush(self.containers,end)
+        heapq.heappush(running,end)
+        self.durations.append(end-at)
+        return error,output,end-at
+
+class Span(object):
+    def __init__(self,execution,state,start,cause):
+        self.execution=execution
+        self.state=state
+        self.start=start
+        self.end=start
+        self.cause=cause
+        self.attempts=0
+        self.error=None
+
+class Process(object):
+    def __init__(self,generator):
+        self.generator=generator
+        self.done=False
+        self.cancelled=False
+        self.result=None
+        self.error=None
+        self.waiters=[]
+
+#Discrete event loop; processes are generators yielding ('sleep', seconds)
+#or ('first', processes), which resumes with the first one to finish
+class Simulation(object):
+    def __init__(self,template,overrides,inlineMapConcurrency=40):
+        self.world=None
+        self.overrides=overrides
+        self.inlineMapConcurrency=inlineMapConcurrency
+        self.baseEnvironment=dict(os.environ)
+        self.functions={}
+        for name,properties in template.functions():
+            function=Function(self,name,properties)
+            self.functions[template.getAtt(name,'Arn')]=function
+            self.functions[name]=function
+        self.stateMachines={arn:(name,definition) for arn,name,definition
+            in template.stateMachines()}
+        self.queue=[]
+        self.sequence=0
+        self.now=0.0
+        self.running=[]
+        self.spans=[]
+        self.executions=Counter()
+        self.failedExecutions=Counter()
+        self.currentSpan=None
+
+    def attach(self,world):
+        self.world=world
+        world.startExecution=self.startExecution
+
+    def setEnvironment(self,function):
+        os.environ.clear()
+        os.environ.update(self.baseEnvironment)
+        os.environ.update(function.environment)
+        os.environ['AWS_LAMBDA_FUNCTION_NAME']=function.name
+
+    def schedule(self,at,callback):
+        self.sequence+=1
+        heapq.heappush(self.queue,(at,self.sequence,callback))
+
+    def spawn(self,generator,at):
+        process=Process(generator)
+        self.schedule(at,lambda: self.step(process,None))
+        return process
+
+    def step(self,process,value,error=None):
+        if process.cancelled:
+            process.generator.close()
+            return self.finish(process,None,None)
+        try:
+            if error is not None:
+                command=process.generator.throw(error)
+            else:
+                command=process.generator.send(value)
+        except StopIteration as e:
+            return self.finish(process,e.value,None)
+        except TaskFailed as e:
+            return self.finish(process,None,e)
+        if command[0] == 'sleep':
+            self.schedule(self.now+command[1],lambda: self.step(process,None))
+        else:
+            resumed=[]
+            def resume(child):
+                if not resumed:
+                    resumed.append(child)
+                    self.schedule(self.now,lambda: self.step(process,child))
+            done=[x for x in command[1] if x.done]
+            if done:
+                resume(done[0])
+            else:
+                for child in command[1]:
+                    child.waiters.append(resume)
+
+    def finish(self,process,result,error):
+        process.done=True
+        process.result=result
+        process.error=error
+        for waiter in process.waiters:
+            waiter(process)
+
+    def run(self):
+        while self.queue:
+            at,_,callback=heapq.heappop(self.queue)
+            self.now=at
+            callback()
+
+    #sfn.start_execution: the execution starts when the calling Lambda made the call
+    def startExecution(self,arn,data):
+        name,definition=self.stateMachines[arn]
+        self.executions[name]+=1
+        execution=name+'#'+str(self.executions[name])
+        cause=self.currentSpan
+        def run():
+            try:
+                yield from self.runStates(definition,data,execution,cause)
+            except TaskFailed:
+                self.failedExecutions[name]+=1
+        self.spawn(run(),clock.sync())
+        return 'arn:aws:states:'+region+':'+accountId+':execution:'+name+':'+\
+            str(self.executions[name])
+
+    def runStates(self,definition,data,execution,cause):
+        name=definition['StartAt']
+        while True:
+            state=definition['States'][name]
+            stateType=state['Type']
+            if stateType == 'Task':
+                data,cause=yield from self.runTask(state,data,execution,name,cause)
+            elif stateType == 'Map':
+                data,cause=yield from self.runMap(state,data,execution,name,cause)
+            elif stateType == 'Wait':
+                span=self.newSpan(execution,name,cause)
+                seconds=state.get('Seconds',getPath(data,state.get('SecondsPath','$.x')) or 0)
+                yield ('sleep',float(seconds))
+                span.end=self.now
+                cause=span
+            elif stateType == 'Pass':
+                data=applyResultPath(state,data,state.get('Result',data))
+            elif stateType == 'Fail':
+                span=self.newSpan(execution,name,cause)
+                span.error=state.get('Error','States.Fail')
+                raise TaskFailed(span.error,span)
+            elif stateType == 'Choice':
+                name=choose(state,data)
+                continue
+            if stateType in ('Task','Map','Pass','Succeed'):
+                data=applyOutputPath(state,data)
+            if stateType == 'Succeed' or state.get('End'):
+                return data,cause
+            name=state['Next']
+
+    def newSpan(self,execution,state,cause):
+        span=Span(execution,state,self.now,cause)
+        self.spans.append(span)
+        return span
+
+    def runTask(self,state,data,execution,name,cause):
+        function=self.functions[state['Resource']]
+        span=self.newSpan(execution,name,cause)
+        retries=Counter()
+        event=applyParameters(state['Parameters'],data) if 'Parameters' in state else data
+        while True:
+            span.attempts+=1
+            self.currentSpan=span
+            error,output,duration=function.invoke(event,self.now)
+            self.currentSpan=None
+            yield ('sleep',duration)
+            if error is None:
+                break
+            retrier=None
+            for i,x in enumerate(state.get('Retry',[])):
+                if error in x['ErrorEquals'] or 'States.ALL' in x['ErrorEquals']:
+                    retrier=i
+                    break
+            if retrier is None or retries[retrier] >= state['Retry'][retrier].get('MaxAttempts',3):
+                span.end=self.now
+                span.error=error
+                raise TaskFailed(error,span)
+            x=state['Retry'][retrier]
+            yield ('sleep',x.get('IntervalSeconds',1)*x.get('BackoffRate',2.0)**retries[retrier])
+            retries[retrier]+=1
+        span.end=self.now
+        checkPayload(output,span)
+        return applyResultPath(state,data,output),span
+
+    def runMap(self,state,data,execution,name,cause):
+        span=self.newSpan(execution,name,cause)
+        if 'ItemReader' in state:
+            parameters={k[:-2]:getPath(data,v) for k,v in
+                state['ItemReader']['Parameters'].items() if k.endswith('.$')}
+            body=self.world.objects[(parameters['Bucket'],parameters['Key'])][0]
+            items=json.loads(body)
+        else:
+            items=getPath(data,state.get('ItemsPath','$'))
+        processor=state.get('ItemProcessor',state.get('Iterator'))
+        distributed=processor.get('ProcessorConfig',{}).get('Mode') == 'DISTRIBUTED'
+        concurrency=state.get('MaxConcurrency',0) or (10000 if distributed
+            else self.inlineMapConcurrency)
+        results=[None]*len(items)
+        pending=list(enumerate(items))
+        running={}
+        #An iteration starts after the state before the Map, or after the
+        #iteration that freed its slot
+        last=cause
+        while pending or running:
+            while pending and len(running) < concurrency:
+                index,item=pending.pop(0)
+                process=self.spawn(self.runIteration(processor,item,
+                    execution+'/'+name+'['+str(index)+']',last),self.now)
+                running[process]=index
+            finished=yield ('first',list(running))
+            index=running.pop(finished)
+            if finished.error is not None:
+                #A failed iteration stops the other iterations & the Map
+                for process in running:
+                    process.cancelled=True
+                span.end=self.now
+                span.error=finished.error.error
+                raise TaskFailed(finished.error.error,finished.error.span)
+            results[index],last=finished.result
+        span.end=self.now
+        checkPayload(results,span)
+        return applyResultPath(state,data,results),last
+
+    def runIteration(self,processor,item,execution,cause):
+        return (yield from self.runStates(processor,item,execution,cause))
+
+    #The accounts Lambda, as started by the ReportSchedule rule
+    def start(self,functionName):
+        def run():
+            yield from self.runTask({'Resource':functionName},{},'ReportSchedule',
+                functionName,None)
+        self.spawn(run(),0.0)
+
+    #Chain of spans leading to the one that ended last
+    def criticalPath(self):
+        if not self.spans:
+            return []
+        #The last span ending at the end, rather than the Map holding it
+        span=max(enumerate(self.spans),key=lambda x:(x[1].end,x[0]))[1]
+        path=[]
+        while span is not None:
+            path.append(span)
+            span=span.cause
+        return list(reversed(path))
+
+def getPath(data,path):
+    if path is None:
+        return None
+    value=data
+    for key in path.lstrip('$').split('.'):
+        if key == '':
+            continue
+        if not isinstance(value,dict) or key not in value:
+            return None
+        value=value[key]
+    return value
+
+def applyParameters(parameters,data):
+    return {k[:-2] if k.endswith('.$') else k: getPath(data,v) if k.endswith('.$') else v
+        for k,v in parameters.items()}
+
+def applyResultPath(state,data,result):
+    if 'ResultPath' not in state or state['ResultPath'] == '$':
+        return result
+    if state['ResultPath'] is None:
+        return data
+    data=copy.deepcopy(data)
+    keys=state['ResultPath'].lstrip('$.').split('.')
+    target=data
+    for key in keys[:-1]:
+        target=target.setdefault(key,{})
+    target[keys[-1]]=result
+    return data
+
+def applyOutputPath(state,data):
+    if 'OutputPath' not in state:
+        return data
+    if state['OutputPath'] is None:
+        return {}
+    return getPath(data,state['OutputPath'])
+
+#Step Functions payload limit of state inputs & results
+payloadLimitBytes=262144
+
+def checkPayload(result,span):
+    if len(json.dumps(result,default=str).encode('utf-8')) > payloadLimitBytes:
+        span.error='States.DataLimitExceeded'
+        raise TaskFailed(span.error,span)
+
+comparisons={'StringEquals':lambda x,y: x == y,'BooleanEquals':lambda x,y: x is y,
+    'NumericEquals':lambda x,y: x == y,'NumericGreaterThan':lambda x,y: x > y,
+    'NumericLessThan':lambda x,y: x < y}
+
+def isMatch(rule,data):
+    if 'And' in rule:
+        return all(isMatch(x,data) for x in rule['And'])
+    if 'Or' in rule:
+        return any(isMatch(x,data) for x in rule['Or'])
+    if 'Not' in rule:
+        return not isMatch(rule['Not'],data)
+    value=getPath(data,rule['Variable'])
+    if 'IsPresent' in rule:
+        return (value is not None) == rule['IsPresent']
+    for name,compare in comparisons.items():
+        if name in rule:
+            return value is not None and compare(value,rule[name])
+    raise NotImplementedError('Unsupported Choice rule '+json.dumps(rule))
+
+def choose(state,data):
+    for rule in state.get('Choices',[]):
+        if isMatch(rule,data):
+            return rule['Next']
+    return state['Default']
+
+def formatTime(seconds):
+    return '%d:%02d:%05.2f' % (seconds//3600,seconds%3600//60,seconds%60)
+
+def report(simulation,world,output):
+    result={'WallTimeInSec':round(max([x.end for x in simulation.spans]+[0]),2),
+        'Executions':dict(simulation.executions),
+        'FailedExecutions':dict(simulation.failedExecutions),
+        'Lambda':{},'ApiCalls':dict(world.backend.calls),
+        'Throttles':dict(world.backend.throttles),'CriticalPath':[]}
+    for name,function in sorted(simulation.functions.items()):
+        if name.startswith('arn:') or function.invocations == 0:
+            continue
+        result['Lambda'][name]={'Invocations':function.invocations,
+            'Errors':dict(function.errors),
+            'AverageDurationInSec':round(sum(function.durations)/len(function.durations),3),
+            'MaxDurationInSec':round(max(function.durations),3)}
+    for span in simulation.criticalPath():
+        result['CriticalPath'].append({'Execution':span.execution,'State':span.state,
+            'Start':round(span.start,2),'End':round(span.end,2),
+            'Attempts':span.attempts,'Error':span.error})
+    if output == 'json':
+        print(json.dumps(result,indent=2,sort_keys=True))
+        return result
+    print('Simulated wall time: '+formatTime(result['WallTimeInSec']))
+    print('\nExecutions')
+    for name,count in sorted(result['Executions'].items()):
+        print('  %-40s %8d %8d failed' % (name,count,result['FailedExecutions'].get(name,0)))
+    print('\nLambda invocations')
+    for name,x in result['Lambda'].items():
+        print('  %-40s %8d  avg %8.3fs  max %8.3fs  %s' % (name,x['Invocations'],
+            x['AverageDurationInSec'],x['MaxDurationInSec'],
+            ', '.join(k+' '+str(v) for k,v in sorted(x['Errors'].items()))))
+    print('\nAPI calls')
+    for name,count in sorted(result['ApiCalls'].items()):
+        print('  %-60s %8d %8d throttled' % (name,count,result['Throttles'].get(name,0)))
+    print('\nCritical path')
+    for x in result['CriticalPath']:
+        print('  %s - %s  %-60s %-28s %s' % (formatTime(x['Start']),formatTime(x['End']),
+            x['Execution'][:60],x['State'][:28],
+            (str(x['Attempts'])+' attempts ' if x['Attempts'] > 1 else '')+(x['Error'] or '')))
+    return result
+
+def main(argv=None):
+    parser=argparse.ArgumentParser(description='Simulate the Trusted Advisor Explorer '+
+        'Step Functions flow on local AWS stand-ins')
+    parser.add_argument('--accounts',type=int,default=10)
+    parser.add_argument('--flagged-resources',type=int,default=50,
+        help='flagged resources per check result')
+    parser.add_argument('--tagged-resources',type=int,default=100,
+        help='tagged resources per account & region')
+    parser.add_argument('--regions',type=int,default=len(ta_generator.regions))
+    parser.add_argument('--parameter',action='append',default=[],
+        help='template parameter override, Key=Value')
+    parser.add_argument('--model',help='JSON file merged into sim_backends.defaultModel')
+    parser.add_argument('--inline-map-concurrency',type=int,default=40)
+    parser.add_argument('--cpu-scale',type=float,default=1.0,
+        help='factor applied to the CPU time of the Lambda code; 0 ignores it')
+    parser.add_argument('--seed',type=int,default=0)
+    parser.add_argument('--output',default='text',choices=['text','json'])
+    args=parser.parse_args(argv)
+    with open(os.path.join(sourceDir,'..','deployment',
+            'aws-trusted-advisor-explorer.template')) as f:
+        template=Template(json.load(f),dict(x.split('=',1) for x in args.parameter))
+    model=copy.deepcopy(sim_backends.defaultModel)
+    if args.model:
+        with open(args.model) as f:
+            for service,values in json.load(f).items():
+                model.setdefault(service,{}).update(values)
+    clock.cpuScale=args.cpu_scale
+    regions=(ta_generator.regions*(args.regions//len(ta_generator.regions)+1))[:args.regions]
+    regions=[x if i < len(ta_generator.regions) else x+'-'+str(i) for i,x in enumerate(regions)]
+    #No metrics are sent & the account file is served from the stand-in S3
+    overrides={'AnonymousUsage':'No','UUID':'simulated','AWS_REGION':region}
+    simulation=Simulation(template,overrides,args.inline_map_concurrency)
+    world=sim_backends.World(model,simulation.functions['ExtractTAData'].environment,
+        args.accounts,args.flagged_resources,args.tagged_resources,
+        template.parameters['InterestedTagKeys'].split(','),regions,args.seed)
+    simulation.attach(world)
+    accounts=simulation.functions['GetAccountsLambda']
+    world.objects[(accounts.environment['BUCKET_NAME'],accounts.environment['OBJECT_NAME'])]=(
+        ta_generator.accountFile(args.accounts),None)
+    logging.getLogger().addHandler(logging.StreamHandler(open(os.devnull,'w')))
+    started=time.time()
+    simulation.start('GetAccountsLambda')
+    simulation.run()
+    os.environ.clear()
+    os.environ.update(simulation.baseEnvironment)
+    result=report(simulation,world,args.output)
+    if args.output == 'text':
+        print('\nSimulated in '+str(round(time.time()-started,1))+' seconds')
+    return 1 if result['FailedExecutions'] else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,109 @@
+######################################################################################################################
+#  Copyright 2019 Amazon.com, Inc. or its affiliates. All Rights Reserved.                                           #
+#                                                                                                                    #
+#  Licensed under the Apache License Version 2.0 (the "License"). You may not use this file except in compliance     #
+#  with the License. A copy of the License is located at                                                             #
+#                                                                                                                    #
+#      http://www.apache.org/licenses/                                                                               #
+#                                                                                                                    #
+#  or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES #
+#  OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific language governing permissions    #
+#  and limitations under the License.                                                                                #
+######################################################################################################################
+
+"""
+stubs
+In-memory stand-ins for the boto3 clients used by the benchmarked Lambdas.
+
+install() replaces client_factory.getClient, so the Lambda modules run
+unchanged against these clients. Written bodies are counted and dropped so
+that the measured memory is the Lambda's own. Every call is counted in calls.
+"""
+import io
+from collections import Counter
+from datetime import datetime,timedelta,timezone
+
+calls=Counter()
+
+class Paginator(object):
+    def __init__(self,operation,pages):
+        self.operation=operation
+        self.pages=pages
+
+    def paginate(self,**kwargs):
+        for page in self.pages:
+            calls[self.operation]+=1
+            yield page
+
+class S3(object):
+    def __init__(self):
+        self.objects={}
+        self.bytesWritten=0
+
+    def put_object(self,Bucket,Key,Body=b'',**kwargs):
+        calls['put_object']+=1
+        self.bytesWritten+=len(Body)
+        return {}
+
+    def create_multipart_upload(self,Bucket,Key,**kwargs):
+        calls['create_multipart_upload']+=1
+        return {'UploadId':'upload'}
+
+    def upload_part(self,Bucket,Key,PartNumber,UploadId,Body):
+        calls['upload_part']+=1
+        self.bytesWritten+=len(Body)
+        return {'ETag':'"%d"' % PartNumber}
+
+    def complete_multipart_upload(self,**kwargs):
+        calls['complete_multipart_upload']+=1
+        return {}
+
+    def abort_multipart_upload(self,**kwargs):
+        calls['abort_multipart_upload']+=1
+        return {}
+
+    def get_object(self,Bucket,Key):
+        calls['get_object']+=1
+        return {'Body':io.BytesIO(self.objects[Key])}
+
+class Support(object):
+    def __init__(self,results):
+        self.results=results
+
+    def describe_trusted_advisor_check_result(self,checkId,language):
+        calls['describe_trusted_advisor_check_result']+=1
+        return self.results[checkId]
+
+class STS(object):
+    def assume_role(self,RoleArn,RoleSessionName):
+        calls['assume_role']+=1
+        return {'Credentials':{'AccessKeyId':'AKIA'+RoleArn.split(':')[4],
+            'SecretAccessKey':'secret','SessionToken':'token',
+            'Expiration':datetime.now(timezone.utc)+timedelta(hours=1)}}
+
+class Paginated(object):
+    def __init__(self,pages):
+        self.pages=pages
+
+    def get_paginator(self,operation):
+        return Paginator(operation,self.pages)
+
+class Clients(object):
+    def __init__(self):
+        self.s3=S3()
+        self.support=Support({})
+        self.tagging=Paginated([])
+        self.organizations=Paginated([])
+        self.byService={'s3':self.s3,'support':self.support,'sts':STS(),
+            'resourcegroupstaggingapi':self.tagging,
+            'organizations':self.organizations,'stepfunctions':object()}
+
+    def getClient(self,service,region=None,credentials=None):
+        return self.byService[service]
+
+clients=Clients()
+
+def install():
+    import client_factory
+    client_factory.getClient=clients.getClient
+    return clients
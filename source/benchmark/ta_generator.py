@@ -0,0 +1,159 @@
+######################################################################################################################
+#  Copyright 2019 Amazon.com, Inc. or its affiliates. All Rights Reserved.                                           #
+#                                                                                                                    #
+#  Licensed under the Apache License Version 2.0 (the "License"). You may not use this file except in compliance     #
+#  with the License. A copy of the License is located at                                                             #
+#                                                                                                                    #
+#      http://www.apache.org/licenses/                                                                               #
+#                                                                                                                    #
+#  or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES #
+#  OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific language governing permissions    #
+#  and limitations under the License.                                                                                #
+######################################################################################################################
+
+"""
+ta_generator
+Synthetic Trusted Advisor payloads for the benchmark suite.
+
+describe_trusted_advisor_check_result results are generated for every check
+with Header_<checkId>/Schema_<checkId> variables in the ExtractTAData
+function of the main template. Metadata values follow the formats Trusted
+Advisor returns for each column (amounts like "$1,234.56", percentages,
+"14 days", ISO timestamps, ids), so parsing and normalization run on realistic
+input. Output is deterministic for a given seed.
+"""
+import json,os,random
+
+templatePath=os.path.join(os.path.dirname(os.path.abspath(__file__)),'..','..',
+    'deployment','aws-trusted-advisor-explorer.template')
+
+regions=['us-east-1','us-east-2','us-west-2','eu-west-1','eu-central-1','ap-southeast-2']
+instanceTypes=['t3.micro','m5.large','m5.2xlarge','c5.xlarge','r5.4xlarge','db.m5.large']
+
+#Environment of the extract Lambdas (Header_*, Schema_* & plain values)
+def getTemplateEnvironment(functionName='ExtractTAData'):
+    with open(templatePath) as f:
+        template=json.load(f)
+    variables=template['Resources'][functionName]['Properties']['Environment']['Variables']
+    return {k:v for k,v in variables.items() if isinstance(v,str)}
+
+def getChecks(environment):
+    return sorted(k[len('Header_'):] for k in environment
+        if k.startswith('Header_') and 'Schema_'+k[len('Header_'):] in environment)
+
+#Value of one metadata column, chosen from the column name
+def columnValue(column,i,rnd):
+    name=column.lower()
+    if name == 'status':
+        return rnd.choice(['Yellow','Red'])
+    if name == 'region':
+        return rnd.choice(regions)
+    if name in ('az','zone'):
+        return rnd.choice(regions)+rnd.choice('abc')
+    if name == 'instance id':
+        return 'i-%017x' % i
+    if name == 'volume id':
+        return 'vol-%017x' % i
+    if name == 'snapshot id':
+        return 'snap-%017x' % i
+    if name == 'reserved instance id':
+        return '%08x-%04x-4000-8000-%012x' % (i,i%65536,i)
+    if name == 'instance type':
+        return rnd.choice(instanceTypes)
+    if name == 'platform':
+        return rnd.choice(['Linux/UNIX','Windows','Red Hat Enterprise Linux'])
+    if name == 'ip address':
+        return '10.%d.%d.%d' % (i//65536%256,i//256%256,i%256)
+    if name == 'hosted zone id':
+        return 'Z%013X' % i
+    if name == 'multi-az':
+        return rnd.choice(['Yes','No'])
+    if name == 'reason':
+        return rnd.choice(['Low utilization, no connections','Idle','Underutilized, consider downsizing'])
+    if 'expiration date' in name:
+        return '2026-%02d-%02dT00:00:00.000Z' % (rnd.randint(1,12),rnd.randint(1,28))
+    if name.startswith('day'):
+        return '%.1f%%  %.2fMB' % (rnd.uniform(0,10),rnd.uniform(0,5))
+    if 'cost' in name or 'savings' in name:
+        return '${:,.2f}'.format(rnd.uniform(1,25000))
+    if 'network i/o' in name:
+        return '%.2fMB' % rnd.uniform(0,5)
+    if 'utilization' in name or 'percent' in name:
+        return '%.1f%%' % rnd.uniform(0,100)
+    if 'days' in name:
+        return '%d days' % rnd.randint(1,14)
+    if 'months' in name or 'years' in name:
+        return str(rnd.randint(1,36))
+    if 'number' in name or 'count' in name or 'size' in name or 'gb' in name or 'age' in name:
+        return str(rnd.randint(1,2048))
+    if name.endswith('name'):
+        return '%s-%d' % (name.split()[0],i)
+    if name == 'cluster':
+        return 'redshift-%d' % i
+    return '%s-%d' % (name.replace(' ','-'),i)
+
+#describe_trusted_advisor_check_result response with flaggedResources resources;
+#about 5% of them are "ok" and are filtered out by the extractor
+def checkResult(checkId,environment,flaggedResources,seed=0):
+    rnd=random.Random(seed)
+    header=environment['Header_'+checkId].split(',')
+    schema=environment['Schema_'+checkId].split(',')
+    width=max([int(x)+1 for x in schema if x.isdigit()]+[0])
+    resources=[]
+    for i in range(0,flaggedResources):
+        metadata=[None]*width
+        resource={'status':rnd.choice(['warning']*12+['error']*7+['ok']),
+            'region':rnd.choice(regions),'resourceId':'%040x' % i,
+            'isSuppressed':False,'metadata':metadata}
+        for column,key in zip(header,schema):
+            if key.isdigit():
+                metadata[int(key)]=columnValue(column,i,rnd)
+        resources.append(resource)
+    return {'ResponseMetadata':{'HTTPStatusCode':200},
+        'result':{'checkId':checkId,'timestamp':'2020-05-07T09:00:00Z','status':'warning',
+            'resourcesSummary':{'resourcesProcessed':flaggedResources*2,
+                'resourcesFlagged':flaggedResources,'resourcesIgnored':0,'resourcesSuppressed':0},
+            'categorySpecificSummary':{'costOptimizing':{
+                'estimatedMonthlySavings':round(rnd.uniform(0,100000),2),
+                'estimatedPercentMonthlySavings':round(rnd.uniform(0,60),2)}},
+            'flaggedResources':resources}}
+
+#get_resources pages (100 resources each) of tagged EC2 instances & volumes
+def tagPages(accountId,region,resources,tagKeys,seed=0,pageSize=100):
+    rnd=random.Random(seed)
+    pages=[]
+    for start in range(0,resources,pageSize):
+        mappings=[]
+        for i in range(start,min(start+pageSize,resources)):
+            if i % 2 == 0:
+                arn='arn:aws:ec2:%s:%s:instance/i-%017x' % (region,accountId,i)
+            else:
+                arn='arn:aws:ec2:%s:%s:volume/vol-%017x' % (region,accountId,i)
+            tags=[{'Key':key,'Value':'%s-%d' % (key,rnd.randint(0,50))} for key in tagKeys]
+            tags.append({'Key':'Name','Value':'resource-%d' % i})
+            mappings.append({'ResourceARN':arn,'Tags':tags})
+        pages.append({'ResourceTagMappingList':mappings})
+    return pages
+
+#organizations list_accounts pages (20 accounts each, the API maximum)
+def accountPages(accounts,pageSize=20):
+    pages=[]
+    for start in range(0,accounts,pageSize):
+        pages.append({'Accounts':[{'Id':'%012d' % (100000000000+i),
+            'Name':'Account %d, Business Unit %d' % (i,i%40),
+            'Email':'aws-account-%d@example.com' % i,
+            'Status':'SUSPENDED' if i % 50 == 49 else 'ACTIVE'}
+            for i in range(start,min(start+pageSize,accounts))]})
+    return pages
+
+#FILE_OVERRIDE account file with a header, ~1% invalid & ~1% duplicate rows
+def accountFile(accounts):
+    lines=['AccountId,AccountName,AccountEmail']
+    for i in range(0,accounts):
+        if i % 100 == 98:
+            lines.append('not-an-id,Broken %d,broken@example.com' % i)
+            continue
+        n=i-1 if i % 100 == 99 else i
+        lines.append('%012d,"Account %d, Business Unit %d",aws-account-%d@example.com' % (
+            100000000000+n,n,n%40,n))
+    return ('\n'.join(lines)+'\n').encode('utf-8')
@@ -0,0 +1,68 @@
+######################################################################################################################
+#  Copyright 2019 Amazon.com, Inc. or its affiliates. All Rights Reserved.                                           #
+#                                                                                                                    #
+#  Licensed under the Apache License Version 2.0 (the "License"). You may not use this file except in compliance     #
+#  with the License. A copy of the License is located at                                                             #
+#                                                                                                                    #
+#      http://www.apache.org/licenses/                                                                               #
+#                                                                                                                    #
+#  or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES #
+#  OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific language governing permissions    #
+#  and limitations under the License.                                                                                #
+######################################################################################################################
+
+"""
+client_factory
+Shared by all of the Lambda functions that call AWS APIs.
+
+Clients are created once per (service, region, credentials) and kept for the
+life of the Lambda container, so warm invocations reuse their connection pools
+instead of building a new client and repeating the TLS handshake. Settings:
+ClientMaxPoolConnections (connections per client, default 10),
+ClientTcpKeepAlive (default true) and ClientCacheSize (clients kept, default 64).
+"""
+import boto3,logging,os,threading
+from collections import OrderedDict
+from botocore.config import Config
+
+logger = logging.getLogger()
+
+lock = threading.Lock()
+clients = OrderedDict()
+sessions = {}
+
+config = Config(
+    max_pool_connections=int(os.environ.get('ClientMaxPoolConnections', '10')),
+    tcp_keepalive=os.environ.get('ClientTcpKeepAlive', 'true').lower() == 'true')
+
+def getSession(credentials):
+    key = credentials['AccessKeyId'] if credentials else None
+    if key not in sessions:
+        if credentials:
+            sessions[key] = boto3.session.Session(
+                aws_access_key_id=credentials['AccessKeyId'],
+                aws_secret_access_key=credentials['SecretAccessKey'],
+                aws_session_token=credentials['SessionToken'])
+        else:
+            sessions[key] = boto3.session.Session()
+    return sessions[key]
+
+#Return a warm client; credentials is the 'Credentials' block of an
+#sts.assume_role response, or None for the Lambda's own role
+def getClient(service, region=None, credentials=None):
+    key = (service, region, credentials['AccessKeyId'] if credentials else None)
+    #boto3 sessions are not thread safe, so clients are built under the lock
+    with lock:
+        if key in clients:
+            clients.move_to_end(key)
+            return clients[key]
+        logger.info("Creating boto3 client: "+service+","+str(region))
+        client = getSession(credentials).client(service, region_name=region,
+            config=config)
+        clients[key] = client
+        if len(clients) > int(os.environ.get('ClientCacheSize', '64')):
+            evicted = clients.popitem(last=False)[0]
+            if evicted[2] is not None and not any(
+                    x[2] == evicted[2] for x in clients):
+                sessions.pop(evicted[2], None)
+        return client
@@ -0,0 +1,240 @@
+######################################################################################################################
+#  Copyright 2019 Amazon.com, Inc. or its affiliates. All Rights Reserved.                                           #
+#                                                                                                                    #
+#  Licensed under the Apache License Version 2.0 (the "License"). You may not use this file except in compliance     #
+#  with the License. A copy of the License is located at                                                             #
+#                                                                                                                    #
+#      http://www.apache.org/licenses/                                                                               #
+#                                                                                                                    #
+#  or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES #
+#  OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific language governing permissions    #
+#  and limitations under the License.                                                                                #
+######################################################################################################################
+
+"""
+compactTAData
+Input:
+Optional {"Date": "YYYY-MM-DD"}; defaults to the Date of the latest pipeline
+run (Runs/latest.json), then to today (UTC).
+
+Output:
+Number of directories & fragments compacted.
+
+Description:
+Merges the day's per (account, check) Summary & Details files of every
+TA-Reports directory into one gzip CSV (or Parquet) file per directory and
+header, then deletes (Compaction=Delete) or archives under Archive/
+(Compaction=Archive) the fragments. The merged file is written under a hidden
+"_" name, a journal listing the fragments is saved under Compaction/, and only
+then is the file revealed and the fragments removed, so an interrupted run is
+finished by the next one. With IncrementalMode the manifests pointing at a
+merged Details fragment are pointed at the merged file before the fragment is
+removed. Hidden files without a journal, left by a run
+interrupted before it saved its journal, are removed once they are older
+than the longest Lambda run. Directories holding only compacted files are left
+untouched, which makes re-runs on a compacted day a no-op. When CrawlerName is
+set (legacy layout) the TA crawler is started afterwards; with the Hive layout
+the Lambda runs on GlueCrawlerSchedule instead.
+"""
+import io,json,logging,os,time,zlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime,timezone
+from botocore.exceptions import ClientError
+import client_factory,data_layout
+from pii_masking import sanitize_string
+
+class AWSTrustedAdvisorExplorerGenericException(Exception): pass
+
+s3Client = client_factory.getClient('s3')
+glueClient = client_factory.getClient('glue')
+
+#Logger block
+logger = logging.getLogger()
+if "LOG_LEVEL" in os.environ:
+    numeric_level = getattr(logging, os.environ['LOG_LEVEL'].upper(), None)
+    if not isinstance(numeric_level, int):
+        raise ValueError('Invalid log level %s' % loglevel)
+    logger.setLevel(level=numeric_level)
+
+compactedPrefix='compacted_'
+#Hidden files without a journal older than the Lambda maximum run time
+#can not belong to a running compaction
+orphanAgeInSec=900
+
+#Directories holding one day of Summary/Details files
+def getDayPrefixes(day):
+    return [x for category in data_layout.listPrefixes('TA-Reports/')
+        for table in data_layout.listPrefixes(category)
+        for x in data_layout.getDayPrefixes(table,day)]
+
+def isFragment(prefix,key):
+    name=key[len(prefix):]
+    return (name.endswith('.csv') or name.endswith('.parquet')) and \
+        not name.startswith('_') and not name.startswith(compactedPrefix)
+
+def deleteKeys(keys):
+    for i in range(0,len(keys),1000):
+        s3Client.delete_objects(Bucket=os.environ['S3BucketName'],Delete={'Quiet':True,
+            'Objects':[{'Key':key} for key in keys[i:i+1000]]})
+
+def getObject(key):
+    return s3Client.get_object(Bucket=os.environ['S3BucketName'],
+        Key=key)['Body'].read()
+
+def putObject(key,body):
+    s3Client.put_object(Bucket=os.environ['S3BucketName'],Key=key,Body=body,
+        ACL='bucket-owner-full-control')
+
+#Merge CSV fragments into one gzip stream per distinct header line; returns
+#(merged file, fragments merged into it) pairs
+def mergeCsv(fragments):
+    groups={}
+    with ThreadPoolExecutor(max_workers=int(os.environ.get('CompactionWorkers','16'))) as executor:
+        for key,body in zip(fragments,executor.map(getObject,fragments)):
+            header,_,rows=body.partition(b'\n')
+            if header not in groups:
+                compressor=zlib.compressobj(9,zlib.DEFLATED,31)
+                groups[header]=(compressor,[compressor.compress(header+b'\n')],[])
+            compressor,output,keys=groups[header]
+            keys.append(key)
+            if rows:
+                output.append(compressor.compress(
+                    rows if rows.endswith(b'\n') else rows+b'\n'))
+    return [(b''.join(output)+compressor.flush(),keys)
+        for compressor,output,keys in groups.values()]
+
+#Merge Parquet fragments into one snappy file per distinct schema
+def mergeParquet(fragments):
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise AWSTrustedAdvisorExplorerGenericException(
+            "pyarrow is required to compact Parquet files")
+    groups={}
+    with ThreadPoolExecutor(max_workers=int(os.environ.get('CompactionWorkers','16'))) as executor:
+        for key,body in zip(fragments,executor.map(getObject,fragments)):
+            table=pq.read_table(io.BytesIO(body))
+            groups.setdefault(table.schema.to_string(),[]).append((key,table))
+    outputs=[]
+    for group in groups.values():
+        buffer=io.BytesIO()
+        pq.write_table(pa.concat_tables([table for _,table in group]),buffer,
+            compression='snappy')
+        outputs.append((buffer.getvalue(),[key for key,_ in group]))
+    return outputs
+
+#IncrementalMode: point the manifests (see extract-ta-data-lambda.py) of the
+#merged Details fragments at the compacted file before the fragments go
+def updateManifest(key,outputKey):
+    if '/check_' not in key:
+        return
+    checkId,accountId=key.rsplit('/',1)[1].split('_')[:2]
+    manifestKey='Manifests/'+checkId+'/'+accountId+'.json'
+    manifest=data_layout.getJson(manifestKey)
+    if manifest != None and manifest.get('DetailsKey') == key:
+        manifest['DetailsKey']=outputKey
+        putObject(manifestKey,json.dumps(manifest).encode('utf-8'))
+
+def updateManifests(journal):
+    moves=[(key,output['Key']) for output in journal['Outputs']
+        for key in output.get('Fragments',[])]
+    with ThreadPoolExecutor(max_workers=int(os.environ.get('CompactionWorkers','16'))) as executor:
+        list(executor.map(lambda x: updateManifest(*x),moves))
+
+#Reveal the merged files and remove the fragments listed in the journal;
+#every step can be repeated, so an interrupted compaction is finished later
+def finishCompaction(journalKey,journal):
+    bucketName=os.environ['S3BucketName']
+    for output in journal['Outputs']:
+        try:
+            s3Client.copy_object(Bucket=bucketName,Key=output['Key'],
+                CopySource={'Bucket':bucketName,'Key':output['HiddenKey']},
+                ACL='bucket-owner-full-control')
+            s3Client.delete_object(Bucket=bucketName,Key=output['HiddenKey'])
+        except ClientError as e:
+            if e.response['Error']['Code'] not in ('NoSuchKey','404'):
+                raise
+    if os.environ.get('IncrementalMode','false').lower() == 'true':
+        updateManifests(journal)
+    fragments=journal['Fragments']
+    if os.environ.get('Compaction','Delete').lower() == 'archive':
+        for key in fragments:
+            try:
+                s3Client.copy_object(Bucket=bucketName,Key='Archive/'+key,
+                    CopySource={'Bucket':bucketName,'Key':key},
+                    ACL='bucket-owner-full-control')
+            except ClientError as e:
+                if e.response['Error']['Code'] not in ('NoSuchKey','404'):
+                    raise
+    deleteKeys(fragments)
+    s3Client.delete_object(Bucket=bucketName,Key=journalKey)
+
+def compactPrefix(prefix):
+    journalKey='Compaction/'+prefix+'journal.json'
+    journal=data_layout.getJson(journalKey)
+    if journal == None:
+        objects=data_layout.listObjects(prefix)
+        now=datetime.now(timezone.utc)
+        orphans=[x['Key'] for x in objects
+            if x['Key'][len(prefix):].startswith('_'+compactedPrefix) and
+            (now-x['LastModified']).total_seconds() > orphanAgeInSec]
+        if len(orphans) > 0:
+            logger.info("Removing "+str(len(orphans))+
+                " hidden files of an interrupted compaction in "+prefix)
+            deleteKeys(orphans)
+        fragments=[x['Key'] for x in objects if isFragment(prefix,x['Key'])]
+        if len(fragments) == 0:
+            return 0
+        logger.info("Compacting "+str(len(fragments))+" files in "+prefix)
+        timestamp=datetime.utcnow().strftime("%H-%M-%S")
+        journal={"Outputs":[],"Fragments":fragments}
+        for extension,merge in (('.csv',mergeCsv),('.parquet',mergeParquet)):
+            keys=[key for key in fragments if key.endswith(extension)]
+            if len(keys) == 0:
+                continue
+            suffix=extension+'.gz' if extension == '.csv' else extension
+            for n,(body,merged) in enumerate(merge(keys)):
+                name=compactedPrefix+timestamp+'_'+str(n)+suffix
+                putObject(prefix+'_'+name,body)
+                journal['Outputs'].append({"HiddenKey":prefix+'_'+name,
+                    "Key":prefix+name,"Size":len(body),"Fragments":merged})
+        putObject(journalKey,json.dumps(journal).encode('utf-8'))
+    else:
+        logger.info("Finishing interrupted compaction of "+prefix)
+    finishCompaction(journalKey,journal)
+    return len(journal['Fragments'])
+
+def startCrawler():
+    try:
+        glueClient.start_crawler(Name=os.environ['CrawlerName'])
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'CrawlerRunningException':
+            raise
+        logger.info("Crawler "+os.environ['CrawlerName']+" is already running")
+
+def lambda_handler(event, context):
+    logger.info(json.dumps(event))
+    try:
+        day=data_layout.getDay(event)
+        start=time.time()
+        directories=0
+        fragments=0
+        for prefix in getDayPrefixes(day):
+            compacted=compactPrefix(prefix)
+            if compacted > 0:
+                directories+=1
+                fragments+=compacted
+        logger.info("Compacted "+str(fragments)+" files in "+str(directories)+
+            " directories in "+str(round(time.time()-start,1))+" seconds")
+        if os.environ.get('CrawlerName','') != '':
+            startCrawler()
+        return {"Date":str(day),"Directories":directories,"Fragments":fragments}
+    except ClientError as e:
+        e = sanitize_string(e)
+        logger.error("Unexpected client error %s" % e)
+        raise AWSTrustedAdvisorExplorerGenericException(e)
+    except Exception as f:
+        f = sanitize_string(f)
+        logger.error("Unexpected exception: %s" % f)
+        raise AWSTrustedAdvisorExplorerGenericException(f)
@@ -11,14 +11,17 @@
 #  and limitations under the License.                                                                                #
 ######################################################################################################################
 
-import boto3,json,logging,os,re
+import hashlib,json,logging,os,re,time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import date
 from botocore.exceptions import ClientError
+import client_factory,glue_catalog
+from pii_masking import sanitize_string
 
 class AWSTrustedAdvisorExplorerGenericException(Exception): pass
 
-athenaClient=boto3.client("athena")
-glueClient = boto3.client('glue')
+athenaClient=client_factory.getClient("athena")
+glueClient = client_factory.getClient('glue')
 
 #Logger block
 logger = logging.getLogger()
@@ -29,13 +32,6 @@ if "LOG_LEVEL" in os.environ:
     logger.setLevel(level=numeric_level)
     
 # --- helper functions ---
-def sanitize_string(x):
-    y = str(x)
-    if os.environ['MASK_PII'].lower() == 'true':
-        pattern=re.compile('\d{12}')
-        y = re.sub(pattern,lambda match: ((match.group()[1])+'XXXXXXX'+(match.group()[-4:])), y)
-    return y
- 
 def athenaQuery(athenaDb,outputLocation,queryString,workGroupName):
     logger.info('Variables passed to athenaQuery(): ' + athenaDb+','+outputLocation+','+queryString)
     startQueryResponse = athenaClient.start_query_execution(
@@ -52,6 +48,197 @@ def athenaQuery(athenaDb,outputLocation,queryString,workGroupName):
         WorkGroup=workGroupName
     )
     logger.info("startQueryResponse= " +json.dumps(startQueryResponse))
+    return startQueryResponse['QueryExecutionId']
+
+#Poll a query until it finishes or ViewQueryTimeoutInSec passes
+def waitForQuery(queryExecutionId):
+    deadline=time.time()+int(os.environ.get('ViewQueryTimeoutInSec','120'))
+    interval=0.5
+    while True:
+        status=athenaClient.get_query_execution(
+            QueryExecutionId=queryExecutionId)['QueryExecution']['Status']
+        if status['State'] in ('SUCCEEDED','FAILED','CANCELLED'):
+            return status['State'],status.get('StateChangeReason','')
+        if time.time()+interval > deadline:
+            return 'TIMEOUT','Query '+queryExecutionId+' still '+status['State']
+        time.sleep(interval)
+        interval=min(interval*2,5)
+
+#View deployment: the SHA-256 of the rendered SQL and of the columns of the
+#tables it reads is kept in the view's Glue table parameters (sqlHash), so
+#views whose SQL and tables did not change are skipped. Athena expands the
+#views' "table".* when they are created, so a new column has to redeploy them.
+viewNamePattern=re.compile(r'VIEW\s+"?(\w+)"?\s+AS',re.IGNORECASE)
+tableNamePattern=re.compile(r'(?:FROM|JOIN)\s+\(*"?(?!SELECT\b)(\w+)"?',re.IGNORECASE)
+tableInputKeys=['Name','Description','Owner','LastAccessTime','LastAnalyzedTime',
+    'Retention','StorageDescriptor','PartitionKeys','ViewOriginalText',
+    'ViewExpandedText','TableType','Parameters','TargetTable']
+
+def getView(athenaDb,viewName):
+    try:
+        return glueClient.get_table(DatabaseName=athenaDb,Name=viewName.lower())['Table']
+    except glueClient.exceptions.EntityNotFoundException:
+        return None
+
+def setViewHash(athenaDb,viewName,sqlHash):
+    table=getView(athenaDb,viewName)
+    tableInput={key:table[key] for key in tableInputKeys if key in table}
+    tableInput.setdefault('Parameters',{})['sqlHash']=sqlHash
+    glueClient.update_table(DatabaseName=athenaDb,TableInput=tableInput)
+
+#Columns & partition keys (name, type) of the tables the view reads
+def getViewTableColumns(athenaDb,queryString):
+    columns={}
+    for tableName in sorted(set(x.lower() for x in tableNamePattern.findall(queryString))):
+        table=getView(athenaDb,tableName)
+        columns[tableName]=None if table == None else [[x['Name'],x['Type']]
+            for x in table['StorageDescriptor']['Columns']+table.get('PartitionKeys',[])]
+    return columns
+
+def deployView(athenaDb,outputLocation,queryString,workGroupName):
+    viewName=viewNamePattern.search(queryString).group(1)
+    sqlHash=hashlib.sha256((queryString+json.dumps(getViewTableColumns(athenaDb,
+        queryString),sort_keys=True)).encode('utf-8')).hexdigest()
+    start=time.time()
+    view=getView(athenaDb,viewName)
+    if view != None and view.get('Parameters',{}).get('sqlHash') == sqlHash:
+        result={"View":viewName,"Status":"UNCHANGED","Seconds":0}
+    else:
+        state,reason=waitForQuery(athenaQuery(athenaDb,outputLocation,
+            queryString,workGroupName))
+        if state == 'SUCCEEDED':
+            setViewHash(athenaDb,viewName,sqlHash)
+        result={"View":viewName,"Status":state,
+            "Seconds":round(time.time()-start,2)}
+        if reason:
+            result['Error']=reason
+    logger.info('View deployment: '+json.dumps(result))
+    return result
+
+#Typed view definitions used when the extractor writes typed values
+#(OutputFormat=Parquet or NormalizeValues=true); views only project & alias
+#Query Key: (View Name, Table, [(Column, Alias, Cast)], Tags Join Column)
+typedViews={
+    'Query_qch7dwoux1': ('LowUtilizationAmazonEC2Instances_view','check_qch7dwoux1',
+        [('14-day average cpu utilization','average_cpu_utilization_14_days','decimal(10, 4)'),
+        ('14-day average network i/o','average_network_i/o_utilization_14 days','decimal(10, 4)'),
+        ('estimated monthly savings','estimated_monthly_savings','decimal(18,2)')],'instance id'),
+    'Query_davu99dc4c': ('UnderutilizedAmazonEBSVolumes_view','check_davu99dc4c',
+        [('monthly storage cost','Monthly_Storage_Cost','decimal(18,2)')],'volume id'),
+    'Query_hjlmh88um8': ('IdleLoadBalancers_view','check_hjlmh88um8',
+        [('estimated monthly savings','estimated_monthly_savings','decimal(18,2)')],'load balancer name'),
+    'Query_ti39halfu8': ('AmazonRDSIdleDBInstances_view','check_ti39halfu8',
+        [('estimated monthly savings on demand','estimated_monthly_savings','decimal(10,2)')],'db instance name'),
+    'Query_g31sq1e9u': ('UnderutilizedAmazonRedshiftClusters_view','check_g31sq1e9u',[],'cluster'),
+    'Query_1e93e4c0b5': ('EC2ReservedInstanceLeaseExpiration_view','check_1e93e4c0b5',
+        [('current monthly cost','current_monthly_cost','decimal(18,2)'),
+        ('estimated monthly savings','estimated_monthly_savings','decimal(18,2)'),
+        ('expiration date','expiration_date',None)],None),
+    'Query_51fc20e7i2': ('Route53LatencyResourceRecordSets_view','check_51fc20e7i2',[],'hosted zone name'),
+    'Query_z4aubrnsmz': ('UnassociatedElasticIPAddresses_view','check_z4aubrnsmz',[],None),
+    'Query_cx3c2r1chu': ('EC2ReservedInstancesOptimization_view','check_cx3c2r1chu',
+        [('estimated savings with recommendation monthly','estimated_savings_with_recommendation_monthly','decimal(18,2)'),
+        ('upfront cost of ris','upfront_cost_of_ris','decimal(18,2)'),
+        ('estimated cost of ris monthly','estimated_cost_of_ris_monthly','decimal(18,2)'),
+        ('estimated on-demand cost post recommended ri purchase monthly','estimated_on-demand_cost_post_recommended_ri_purchase_monthly','decimal(18,2)')],None)}
+
+def typedViewQuery(queryKey,tagsJoin):
+    viewName,table,columns,joinColumn=typedViews[queryKey]
+    query='CREATE OR REPLACE VIEW '+viewName+' AS\n    SELECT "'+table+'".*,\n'
+    query+='             "'+table+'"."datetime" "date_time"'
+    for column,alias,cast in columns:
+        expression='"'+table+'"."'+column+'"'
+        if cast != None:
+            expression='CAST('+expression+' AS '+cast+')'
+        query+=',\n             '+expression+' "'+alias+'"'
+    if joinColumn != None and tagsJoin:
+        query+='\n             %Insert_Tags_Here% FROM ('+table+' LEFT JOIN tags\n'
+        query+='        ON (("'+table+'"."'+joinColumn+'" = "tags"."resourceid")\n'
+        query+='            AND ("'+table+'"."datetime" = CAST("tags"."datetime" AS timestamp))))'
+    else:
+        query+='\n    FROM "'+table+'"'
+    return query
+
+#The rollup tables (rollup-ta-data-lambda.py) compute the optimization
+#percentages with the same arithmetic
+summaryViewQuery='''CREATE OR REPLACE VIEW summary_view AS 
+    SELECT summary.*,
+     "date_parse"("substr"("summary"."datetime", 1, 19), '%Y-%m-%d %T') "date_time"
+    , ((1 - (CAST("resourcesflagged" AS decimal(10,2)) / CAST("replace"(CAST("resourcesprocessed" AS varchar), '0', '1') AS decimal(10,2)))) * 100) "optimizationPercent"
+    , ((1 - ((CAST("resourcesflagged" AS decimal(10,2)) - (CAST("resourcesignored" AS decimal(10,2)) + CAST("resourcessuppressed" AS decimal(10,2)))) / CAST("replace"(CAST("resourcesprocessed" AS varchar), '0', '1') AS decimal(10,2)))) * 100) "trueoptimizationPercent"
+    FROM summary'''
+
+#Columns (and types of the typed tables) of the table of checkId, including
+#the columns added by TagEnrichment
+def getCheckHeader(checkId):
+    header=(['Date','DateTime','CheckName']+os.environ['Header_'+checkId].split(",")+
+        ['AccountId','AccountName','AccountEmail'])
+    columnTypes=(glue_catalog.getColumnTypes(checkId,header)
+        if glue_catalog.isNormalized() else None)
+    return glue_catalog.getEnrichedHeader(checkId,header,columnTypes)
+
+def isIncremental():
+    return os.environ.get('IncrementalMode','false').lower() == 'true'
+
+#IncrementalMode: unchanged Details rows are only written by the run that
+#first saw them, so the check views read the Details rows of every run through
+#the incremental table, with the Date & DateTime of that run. The join is
+#limited to the Details run's date, and with the Hive layout to the partition
+#of its Details file.
+#Rows written before the first incremental run are read as they are.
+def incrementalSource(checkId):
+    table='check_'+checkId.lower()
+    header,_=getCheckHeader(checkId)
+    columns=', '.join(('"incremental"."' if x in ('Date','DateTime') else '"d"."')+
+        x.lower()+'"' for x in header)
+    conditions=['("incremental"."checkid" = \''+checkId+'\')',
+        '(CAST("incremental"."accountid" AS varchar) = CAST("d"."accountid" AS varchar))',
+        '("incremental"."detailsdate" = "d"."date")',
+        '("incremental"."detailsdatetime" = "d"."datetime")']
+    if os.environ.get('PartitionLayout','Legacy').lower() == 'hive':
+        conditions+=['("d"."'+key+'" = CAST(regexp_extract("incremental"."detailspath", '+
+            '\''+key+'=(\\d+)\', 1) AS integer))' for key in ('year','month','day','shard')]
+    return ('(SELECT '+columns+'\n        FROM "'+table+'" "d" JOIN "incremental"\n'
+        '        ON ('+'\n            AND '.join(conditions)+')\n'
+        '    UNION ALL\n'
+        '    SELECT '+', '.join('"d"."'+x.lower()+'"' for x in header)+'\n'
+        '        FROM "'+table+'" "d"\n'
+        '        WHERE (SELECT count(*) FROM "incremental") = 0\n'
+        '            OR "d"."datetime" < (SELECT min("datetime") FROM "incremental")) "'+table+'"')
+
+#Replace the check table of the view's FROM clause with incrementalSource
+def resolveIncremental(query,checkId):
+    table='check_'+checkId.lower()
+    return re.sub(r'(FROM\s+\(?)"?'+table+r'"?(?!\w)',
+        lambda match: match.group(1)+incrementalSource(checkId),query,count=1)
+
+#PartitionLayout=Hive: tables are defined here (see glue_catalog.py) instead
+#of being discovered by the Glue crawler
+def createPartitionedTables(athenaDb):
+    logger.info('Variables passed to createPartitionedTables(): ' + athenaDb)
+    location='s3://'+os.environ['S3BucketName']+'/'
+    reportsLocation=location+'TA-Reports/'+os.environ.get('Category','cost_optimizing')+'/'
+    parquet=os.environ.get('OutputFormat','CSV').lower() == 'parquet'
+    for key in os.environ:
+        if key.startswith('Header_'):
+            checkId=key[len('Header_'):]
+            header,columnTypes=getCheckHeader(checkId)
+            if checkId == 'Summary':
+                tableInput=glue_catalog.getTableInput('summary',header,
+                    reportsLocation+'Summary/',parquet,columnTypes)
+            else:
+                tableInput=glue_catalog.getTableInput('check_'+checkId.lower(),header,
+                    reportsLocation+'check_'+checkId+'/',parquet,columnTypes)
+            glue_catalog.createOrUpdateTable(athenaDb,tableInput)
+    if isIncremental():
+        glue_catalog.createOrUpdateTable(athenaDb,glue_catalog.getTableInput('incremental',
+            glue_catalog.incrementalHeader,reportsLocation+'Incremental/',parquet,
+            glue_catalog.incrementalTypes if glue_catalog.isNormalized() else None))
+    if os.environ[("Tags")].strip() != '':
+        header=(['Date','DateTime','AccountId','AccountName','AccountEmail',
+            'RegionName','ResourceType','ResourceArn','ResourceId']+
+            [tag.strip() for tag in os.environ[("Tags")].strip().split(",")])
+        glue_catalog.createOrUpdateTable(athenaDb,glue_catalog.getTableInput('tags',header,location+'Tags/',False))
     return
 
 def checkIfTagsTableExistInDB(athenaDb):
@@ -76,8 +263,15 @@ def lambda_handler(event, context):
     logger.info('lambda_handler() Event : ' + json.dumps(event))
     try:
         workGroupName=os.environ['AthenaWorkGroup']
+        if os.environ.get('PartitionLayout','Legacy').lower() == 'hive':
+            logger.info("PartitionLayout is Hive; defining projected tables")
+            createPartitionedTables(os.environ['AthenaDb'])
         status=checkIfTagsTableExistInDB(os.environ['AthenaDb'])
         logger.info('Tags Table Status: ' + json.dumps(status))
+        #TagEnrichment writes the tag columns into the Details tables, so the
+        #views only join the tags table without it
+        tagsJoin=(os.environ[("Tags")].strip() != '' and status == 'PRESENT' and
+            os.environ.get('EnrichmentTags','').strip() == '')
         #View Queries
         Query={}
         
@@ -90,7 +284,7 @@ def lambda_handler(event, context):
              CAST("rtrim"("replace"("substr"("check_qch7dwoux1"."estimated monthly savings", 2), '$')) AS decimal(18,2)) "estimated_monthly_savings" 
              %Insert_Tags_Here% ''' + ('''FROM (check_qch7dwoux1 LEFT JOIN tags
         ON (("check_qch7dwoux1"."instance id" = "tags"."resourceid")
-            AND ("check_qch7dwoux1"."datetime" = "tags"."datetime")))''' if (os.environ[("Tags")].strip() != '' and status == 'PRESENT') else "FROM \"check_qch7dwoux1\"")
+            AND ("check_qch7dwoux1"."datetime" = "tags"."datetime")))''' if tagsJoin else "FROM \"check_qch7dwoux1\"")
             
         Query['Query_davu99dc4c']='''CREATE OR REPLACE VIEW UnderutilizedAmazonEBSVolumes_view AS 
     SELECT
@@ -99,7 +293,7 @@ def lambda_handler(event, context):
     , CAST("rtrim"("replace"("substr"("check_davu99dc4c"."monthly storage cost", 2),'$')) AS decimal(18,2)) "Monthly_Storage_Cost"
      %Insert_Tags_Here% ''' + ('''FROM (check_davu99dc4c LEFT JOIN tags
         ON (("check_davu99dc4c"."volume id" = "tags"."resourceid")
-            AND ("check_davu99dc4c"."datetime" = "tags"."datetime")))''' if (os.environ[("Tags")].strip() != '' and status == 'PRESENT') else "FROM \"check_davu99dc4c\"")
+            AND ("check_davu99dc4c"."datetime" = "tags"."datetime")))''' if tagsJoin else "FROM \"check_davu99dc4c\"")
         
         Query['Query_hjlmh88um8']='''CREATE OR REPLACE VIEW IdleLoadBalancers_view AS
     SELECT "check_hjlmh88um8".* ,
@@ -107,7 +301,7 @@ def lambda_handler(event, context):
              CAST("rtrim"("replace"("substr"("check_hjlmh88um8"."estimated monthly savings",2),'$')) AS decimal(18,2)) "estimated_monthly_savings" 
              %Insert_Tags_Here% ''' +('''FROM (check_hjlmh88um8 LEFT JOIN tags
         ON (("check_hjlmh88um8"."load balancer name" = "tags"."resourceid")
-            AND ("check_hjlmh88um8"."datetime" = "tags"."datetime")))''' if (os.environ[("Tags")].strip() != '' and status == 'PRESENT') else "FROM \"check_hjlmh88um8\"")
+            AND ("check_hjlmh88um8"."datetime" = "tags"."datetime")))''' if tagsJoin else "FROM \"check_hjlmh88um8\"")
 
 
         Query['Query_ti39halfu8']='''CREATE OR REPLACE VIEW AmazonRDSIdleDBInstances_view AS
@@ -116,14 +310,14 @@ def lambda_handler(event, context):
              CAST("rtrim"("replace"("replace"("check_ti39halfu8"."estimated monthly savings ON demand",'$'),'"')) AS decimal(10,2)) "estimated_monthly_savings"
              %Insert_Tags_Here% ''' +('''FROM (check_ti39halfu8 LEFT JOIN tags
         ON (("check_ti39halfu8"."db instance name" = "tags"."resourceid")
-            AND ("check_ti39halfu8"."datetime" = "tags"."datetime")))''' if (os.environ[("Tags")].strip() != '' and status == 'PRESENT') else "FROM \"check_ti39halfu8\"") 
+            AND ("check_ti39halfu8"."datetime" = "tags"."datetime")))''' if tagsJoin else "FROM \"check_ti39halfu8\"") 
             
         Query['Query_g31sq1e9u']='''CREATE OR REPLACE VIEW UnderutilizedAmazonRedshiftClusters_view AS
     SELECT "check_g31sq1e9u".*,
            "date_parse"("substr"("check_g31sq1e9u"."datetime", 1, 19), '%Y-%m-%d %T') "date_time" 
             %Insert_Tags_Here% ''' +('''FROM (check_g31sq1e9u LEFT JOIN tags
         ON (("check_g31sq1e9u"."cluster" = "tags"."resourceid")
-            AND ("check_g31sq1e9u"."datetime" = "tags"."datetime")))''' if (os.environ[("Tags")].strip() != '' and status == 'PRESENT') else "FROM \"check_g31sq1e9u\"")
+            AND ("check_g31sq1e9u"."datetime" = "tags"."datetime")))''' if tagsJoin else "FROM \"check_g31sq1e9u\"")
         
         Query['Query_1e93e4c0b5']='''CREATE OR REPLACE VIEW EC2ReservedInstanceLeaseExpiration_view AS
     SELECT "check_1e93e4c0b5".*,
@@ -139,14 +333,9 @@ def lambda_handler(event, context):
     %Insert_Tags_Here% ''' +('''FROM ("check_51fc20e7i2"
     LEFT JOIN tags
         ON (("check_51fc20e7i2"."hosted zone name" = "tags"."resourceid")
-            AND ("check_51fc20e7i2"."datetime" = "tags"."datetime")))''' if (os.environ[("Tags")].strip() != '' and status == 'PRESENT') else "FROM \"check_51fc20e7i2\"")
+            AND ("check_51fc20e7i2"."datetime" = "tags"."datetime")))''' if tagsJoin else "FROM \"check_51fc20e7i2\"")
         
-        Query['Query_summary']='''CREATE OR REPLACE VIEW summary_view AS 
-    SELECT summary.*,
-     "date_parse"("substr"("summary"."datetime", 1, 19), '%Y-%m-%d %T') "date_time"
-    , ((1 - (CAST("resourcesflagged" AS decimal(10,2)) / CAST("replace"(CAST("resourcesprocessed" AS varchar), '0', '1') AS decimal(10,2)))) * 100) "optimizationPercent"
-    , ((1 - ((CAST("resourcesflagged" AS decimal(10,2)) - (CAST("resourcesignored" AS decimal(10,2)) + CAST("resourcessuppressed" AS decimal(10,2)))) / CAST("replace"(CAST("resourcesprocessed" AS varchar), '0', '1') AS decimal(10,2)))) * 100) "trueoptimizationPercent"
-    FROM summary'''
+        Query['Query_summary']=summaryViewQuery
 
         Query['Query_z4aubrnsmz']='''CREATE OR REPLACE VIEW UnassociatedElasticIPAddresses_view AS SELECT "check_z4aubrnsmz".*, "date_parse"("substr"("check_z4aubrnsmz"."datetime", 1, 19), '%Y-%m-%d %T') "date_time" FROM "check_z4aubrnsmz"'''
 
@@ -159,17 +348,41 @@ def lambda_handler(event, context):
              CAST("rtrim"("replace"("substr"("check_cx3c2r1chu"."estimated on-demand cost post recommended ri purchase monthly",2),'$')) AS decimal(18,2)) "estimated_on-demand_cost_post_recommended_ri_purchase_monthly"
     FROM "check_cx3c2r1chu"'''
         
+        if glue_catalog.isNormalized():
+            logger.info("Values are normalized at ingest; using typed view definitions")
+            for queryKey in typedViews:
+                Query[queryKey]=typedViewQuery(queryKey,tagsJoin)
+            Query['Query_summary']=Query['Query_summary'].replace(
+                '''"date_parse"("substr"("summary"."datetime", 1, 19), '%Y-%m-%d %T') "date_time"''',
+                '''"summary"."datetime" "date_time"''')
+
+        if isIncremental():
+            logger.info("IncrementalMode is on; views read the Details rows of every run")
+            for key in os.environ:
+                checkId=key[len('Header_'):]
+                if key.startswith('Header_') and checkId != 'Summary' and \
+                        'Query_'+checkId.lower() in Query:
+                    Query['Query_'+checkId.lower()]=resolveIncremental(
+                        Query['Query_'+checkId.lower()],checkId)
+
         checks=["Query_1e93e4c0b5","Query_51fc20e7i2","Query_davu99dc4c","Query_g31sq1e9u","Query_qch7dwoux1","Query_ti39halfu8","Query_z4aubrnsmz","Query_hjlmh88um8","Query_summary"]
         logger.info("Cost Optimization Trusted Advisor Checks:" +str(checks))
         tagsString=''
         tags=[tag.strip() for tag in os.environ[("Tags")].strip().split(",")]
         logger.info("Tags:" +str(tags))
-        if os.environ[("Tags")].strip() != '' and status == 'PRESENT':
+        if tagsJoin:
             for tag in tags:
                 tagsString+=',\"tags\".\"'+tag+'\"'
+        deployments=[]
         for checkId in checks:
             outputLocation='s3://'+os.environ['AthenaOutput']+'/AthenaOutputs/'+str(date.today().year)+'/'+str(date.today().month)+'/'+str(date.today().day)+'/'+checkId+'/'
-            athenaQuery(os.environ['AthenaDb'],outputLocation,Query[checkId].replace("%Insert_Tags_Here%",tagsString),workGroupName)
+            deployments.append((os.environ['AthenaDb'],outputLocation,Query[checkId].replace("%Insert_Tags_Here%",tagsString),workGroupName))
+        with ThreadPoolExecutor(max_workers=int(os.environ.get('ViewDeployWorkers','4'))) as executor:
+            results=list(executor.map(lambda x: deployView(*x),deployments))
+        failed=[result for result in results if result['Status'] not in ('SUCCEEDED','UNCHANGED')]
+        if len(failed) > 0:
+            raise Exception("View deployment failed: "+json.dumps(failed))
+        return results
     except ClientError as e:
         e = sanitize_string(e)
         logger.error("Unexpected client error %s" % e)
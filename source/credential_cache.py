@@ -0,0 +1,120 @@
+######################################################################################################################
+#  Copyright 2019 Amazon.com, Inc. or its affiliates. All Rights Reserved.                                           #
+#                                                                                                                    #
+#  Licensed under the Apache License Version 2.0 (the "License"). You may not use this file except in compliance     #
+#  with the License. A copy of the License is located at                                                             #
+#                                                                                                                    #
+#      http://www.apache.org/licenses/                                                                               #
+#                                                                                                                    #
+#  or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES #
+#  OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific language governing permissions    #
+#  and limitations under the License.                                                                                #
+######################################################################################################################
+
+"""
+credential_cache
+Shared by the Lambda functions that assume the cross account role.
+
+Credentials returned by sts.assume_role are kept per (AccountId, RoleName) for
+the life of the Lambda container, so warm invocations for the same account do
+not call STS again. An entry is refreshed once it is within
+CredentialRefreshMarginInSec of its expiry, and concurrent callers for the
+same account wait on a single assume_role call. At most CredentialCacheSize
+entries (default 256) are kept: expired entries are dropped and the least
+recently used account is evicted when a new entry is stored.
+"""
+import logging,os,threading
+from collections import OrderedDict
+from datetime import datetime,timezone
+import client_factory,phase_metrics
+
+logger = logging.getLogger()
+
+class CredentialCache(object):
+    def __init__(self, refreshMarginInSec=300, maxEntries=256):
+        self.refreshMarginInSec = refreshMarginInSec
+        self.maxEntries = maxEntries
+        self.lock = threading.Lock()
+        self.keyLocks = {}
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.stsClient = None
+
+    def isFresh(self, roleCredentials):
+        expiration = roleCredentials['Credentials']['Expiration']
+        remaining = (expiration - datetime.now(timezone.utc)).total_seconds()
+        return remaining > self.refreshMarginInSec
+
+    def isExpired(self, roleCredentials, now):
+        return roleCredentials['Credentials']['Expiration'] <= now
+
+    #Store an entry, then drop expired entries, the least recently used ones
+    #over maxEntries and the locks of dropped keys no caller is waiting on
+    def store(self, key, roleCredentials):
+        now = datetime.now(timezone.utc)
+        with self.lock:
+            self.entries[key] = roleCredentials
+            self.entries.move_to_end(key)
+            dropped = [x for x, y in self.entries.items() if self.isExpired(y, now)]
+            for x in dropped:
+                del self.entries[x]
+            while len(self.entries) > self.maxEntries:
+                dropped.append(self.entries.popitem(last=False)[0])
+            for x in dropped:
+                if x in self.keyLocks and self.keyLocks[x][1] == 0:
+                    del self.keyLocks[x]
+
+    #Key locks are [lock, callers]; a lock is only dropped once no caller
+    #holds or waits for it, so every caller of a key shares the same lock
+    def assumeRole(self, accountId, roleName, sessionName):
+        key = (str(accountId), roleName)
+        with self.lock:
+            keyLock = self.keyLocks.setdefault(key, [threading.Lock(), 0])
+            keyLock[1] += 1
+        try:
+            #One assume_role call per key; other callers wait and then hit the cache
+            with keyLock[0]:
+                return self.getCredentials(key, accountId, roleName, sessionName)
+        finally:
+            with self.lock:
+                keyLock[1] -= 1
+                if keyLock[1] == 0 and key not in self.entries:
+                    del self.keyLocks[key]
+
+    def getCredentials(self, key, accountId, roleName, sessionName):
+        with self.lock:
+            roleCredentials = self.entries.get(key)
+        if roleCredentials is not None and self.isFresh(roleCredentials):
+            with self.lock:
+                self.hits += 1
+                if key in self.entries:
+                    self.entries.move_to_end(key)
+            return roleCredentials
+        with self.lock:
+            self.misses += 1
+            if self.stsClient is None:
+                self.stsClient = client_factory.getClient('sts')
+        roleArn = "arn:aws:iam::"+str(accountId)+":role/"+roleName
+        with phase_metrics.phase('AssumeRole', AccountId=accountId) as phase:
+            roleCredentials = self.stsClient.assume_role(RoleArn=roleArn,
+                RoleSessionName=sessionName)
+            phase.add('Retries', phase_metrics.retries(roleCredentials))
+        self.store(key, roleCredentials)
+        return roleCredentials
+
+    def getStats(self):
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses,
+                    "entries": len(self.entries)}
+
+cache = CredentialCache(int(os.environ.get('CredentialRefreshMarginInSec', '300')),
+    int(os.environ.get('CredentialCacheSize', '256')))
+
+#Assume the cross account role in a member account, reusing cached credentials
+def assumeRole(accountId, roleName=None,
+        sessionName="AWSTrustedAdvisorExplorerAssumeRole"):
+    roleCredentials = cache.assumeRole(accountId,
+        roleName or os.environ['IAMRoleName'], sessionName)
+    logger.info("Credential cache stats: "+str(cache.getStats()))
+    return roleCredentials
@@ -0,0 +1,78 @@
+######################################################################################################################
+#  Copyright 2019 Amazon.com, Inc. or its affiliates. All Rights Reserved.                                           #
+#                                                                                                                    #
+#  Licensed under the Apache License Version 2.0 (the "License"). You may not use this file except in compliance     #
+#  with the License. A copy of the License is located at                                                             #
+#                                                                                                                    #
+#      http://www.apache.org/licenses/                                                                               #
+#                                                                                                                    #
+#  or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES #
+#  OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific language governing permissions    #
+#  and limitations under the License.                                                                                #
+######################################################################################################################
+
+
+"""
+data_layout
+Shared by the Lambda functions that read one day of data back from the bucket
+(compaction, rollup & enrichment).
+
+A table directory holds one directory per day, TABLE/YYYY/M/D/ with the
+Legacy layout and one directory per shard, TABLE/year=YYYY/month=M/day=D/
+shard=N/ with PartitionLayout=Hive. Files whose name starts with "_" are
+hidden: they belong to a compaction in progress. The day of the data is the
+event's Date, else the Date of the latest pipeline run written by the accounts
+Lambda under Runs/latest.json, else today (UTC).
+"""
+import json,os
+from datetime import datetime
+from botocore.exceptions import ClientError
+import client_factory
+
+dataExtensions=('.csv','.csv.gz','.parquet')
+
+def listPrefixes(prefix):
+    prefixes=[]
+    paginator=client_factory.getClient('s3').get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=os.environ['S3BucketName'],
+            Prefix=prefix,Delimiter='/'):
+        prefixes.extend(x['Prefix'] for x in page.get('CommonPrefixes',[]))
+    return prefixes
+
+def listObjects(prefix):
+    objects=[]
+    paginator=client_factory.getClient('s3').get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=os.environ['S3BucketName'],
+            Prefix=prefix,Delimiter='/'):
+        objects.extend(page.get('Contents',[]))
+    return objects
+
+#Data files of a directory, without the hidden files
+def listDataKeys(prefix):
+    return [x['Key'] for x in listObjects(prefix)
+        if not x['Key'][len(prefix):].startswith('_') and x['Key'].endswith(dataExtensions)]
+
+#Directories holding one day of data under a table prefix
+def getDayPrefixes(table,day):
+    if os.environ.get('PartitionLayout','Legacy').lower() == 'hive':
+        return listPrefixes(table+'year='+str(day.year)+'/month='+str(day.month)+
+            '/day='+str(day.day)+'/')
+    return [table+str(day.year)+'/'+str(day.month)+'/'+str(day.day)+'/']
+
+#JSON object of key, or None when there is none
+def getJson(key):
+    try:
+        return json.loads(client_factory.getClient('s3').get_object(
+            Bucket=os.environ['S3BucketName'],Key=key)['Body'].read())
+    except ClientError as e:
+        if e.response['Error']['Code'] in ('NoSuchKey','404'):
+            return None
+        raise
+
+def getDay(event):
+    if 'Date' in event:
+        return datetime.strptime(event['Date'],'%Y-%m-%d').date()
+    run=getJson('Runs/latest.json')
+    if run != None:
+        return datetime.strptime(run['Date'],'%Y-%m-%d').date()
+    return datetime.utcnow().date()
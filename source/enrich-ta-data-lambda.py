@@ -0,0 +1,204 @@
+######################################################################################################################
+#  Copyright 2019 Amazon.com, Inc. or its affiliates. All Rights Reserved.                                           #
+#                                                                                                                    #
+#  Licensed under the Apache License Version 2.0 (the "License"). You may not use this file except in compliance     #
+#  with the License. A copy of the License is located at                                                             #
+#                                                                                                                    #
+#      http://www.apache.org/licenses/                                                                               #
+#                                                                                                                    #
+#  or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES #
+#  OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific language governing permissions    #
+#  and limitations under the License.                                                                                #
+######################################################################################################################
+
+"""
+enrichTAData
+Input:
+Optional {"Date": "YYYY-MM-DD"}; defaults to the Date of the latest pipeline
+run (Runs/latest.json), then to today (UTC).
+
+Output:
+Number of tagged resources indexed & Details files enriched.
+
+Description:
+Joins the day's Trusted Advisor Details files with the day's tag snapshot.
+The tag files are loaded into a hash index keyed by (AccountId, Region,
+ResourceId) and (AccountId, ResourceId), and the EnrichmentTags columns are
+appended to every Details row of the checks listed in
+glue_catalog.tagJoinColumns, so the Athena views no longer join the tags
+table. Each file is rewritten in place in its own format; files that already
+carry the tag columns are skipped, so re-runs are a no-op. Afterwards the
+compaction Lambda (CompactionFunction) is invoked, or the TA crawler
+(CrawlerName) is started.
+"""
+import csv,gzip,io,json,logging,os,time
+from concurrent.futures import ThreadPoolExecutor
+from botocore.exceptions import ClientError
+import client_factory,data_layout,glue_catalog
+from pii_masking import sanitize_string
+
+class AWSTrustedAdvisorExplorerGenericException(Exception): pass
+
+s3Client = client_factory.getClient('s3')
+glueClient = client_factory.getClient('glue')
+lambdaClient = client_factory.getClient('lambda')
+
+#Logger block
+logger = logging.getLogger()
+if "LOG_LEVEL" in os.environ:
+    numeric_level = getattr(logging, os.environ['LOG_LEVEL'].upper(), None)
+    if not isinstance(numeric_level, int):
+        raise ValueError('Invalid log level %s' % loglevel)
+    logger.setLevel(level=numeric_level)
+
+def getTagKeys(day):
+    if os.environ.get('PartitionLayout','Legacy').lower() == 'hive':
+        prefixes=data_layout.getDayPrefixes('Tags/',day)
+    else:
+        prefixes=[x for table in data_layout.listPrefixes('Tags/')
+            for x in data_layout.getDayPrefixes(table,day)]
+    #File names end with the run time, so later snapshots are indexed last
+    return sorted(key for prefix in prefixes for key in data_layout.listDataKeys(prefix))
+
+def getObject(key):
+    return s3Client.get_object(Bucket=os.environ['S3BucketName'],Key=key)['Body'].read()
+
+def readCsv(key):
+    body=getObject(key)
+    if key.endswith('.gz'):
+        body=gzip.decompress(body)
+    return [row for row in csv.reader(io.StringIO(body.decode('utf-8')),escapechar='\\')
+        if len(row) > 0]
+
+#Hash index of the day's tag values: (AccountId, Region, ResourceId) and
+#(AccountId, ResourceId) -> tuple of EnrichmentTags values
+def buildTagIndex(day,tags):
+    index={}
+    keys=getTagKeys(day)
+    with ThreadPoolExecutor(max_workers=int(os.environ.get('EnrichmentWorkers','16'))) as executor:
+        for rows in executor.map(readCsv,keys):
+            header=[x.lower() for x in rows[0]]
+            account=header.index('accountid')
+            region=header.index('regionname')
+            resource=header.index('resourceid')
+            positions=[header.index(x.lower()) if x.lower() in header else None for x in tags]
+            for row in rows[1:]:
+                values=tuple('' if x == None else row[x] for x in positions)
+                index[(row[account],row[region],row[resource])]=values
+                index[(row[account],row[resource])]=values
+    logger.info("Indexed "+str(len(index)//2)+" tagged resources from "+
+        str(len(keys))+" tag files")
+    return index
+
+def lookupTags(index,accountId,region,resourceId,empty):
+    values=index.get((str(accountId),str(region),str(resourceId)))
+    if values == None:
+        values=index.get((str(accountId),str(resourceId)),empty)
+    return values
+
+#Positions of the join columns, or None when the file is already enriched
+def getJoinPositions(checkId,header,tagCount):
+    if header[len(header)-tagCount:] == glue_catalog.getTagColumns(checkId,header[:len(header)-tagCount]):
+        return None
+    lower=[x.lower() for x in header]
+    return (lower.index('accountid'),lower.index('region') if 'region' in lower else None,
+        lower.index(glue_catalog.tagJoinColumns[checkId]))
+
+def enrichCsv(checkId,key,index,tagCount):
+    rows=readCsv(key)
+    positions=getJoinPositions(checkId,rows[0],tagCount)
+    if positions == None:
+        return False
+    account,region,resource=positions
+    empty=('',)*tagCount
+    rows[0]=rows[0]+glue_catalog.getTagColumns(checkId,rows[0])
+    for row in rows[1:]:
+        row.extend(lookupTags(index,row[account],
+            row[region] if region != None else '',row[resource],empty))
+    stream=io.StringIO()
+    if glue_catalog.isNormalized():
+        writer=csv.writer(stream,quoting=csv.QUOTE_NONE,escapechar='\\')
+    else:
+        writer=csv.writer(stream)
+    writer.writerows(rows)
+    body=stream.getvalue().encode('utf-8')
+    s3Client.put_object(Bucket=os.environ['S3BucketName'],Key=key,
+        Body=gzip.compress(body) if key.endswith('.gz') else body,
+        ACL='bucket-owner-full-control')
+    return True
+
+def enrichParquet(checkId,key,index,tagCount):
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise AWSTrustedAdvisorExplorerGenericException(
+            "pyarrow is required to enrich Parquet files")
+    table=pq.read_table(io.BytesIO(getObject(key)))
+    positions=getJoinPositions(checkId,table.column_names,tagCount)
+    if positions == None:
+        return False
+    account,region,resource=[None if x == None else table.column(x).to_pylist()
+        for x in positions]
+    empty=(None,)*tagCount
+    values=[lookupTags(index,account[i],region[i] if region != None else '',
+        resource[i],empty) for i in range(0,table.num_rows)]
+    for n,column in enumerate(glue_catalog.getTagColumns(checkId,table.column_names)):
+        table=table.append_column(column,pa.array([x[n] or None for x in values],type=pa.string()))
+    buffer=io.BytesIO()
+    pq.write_table(table,buffer,compression='snappy')
+    s3Client.put_object(Bucket=os.environ['S3BucketName'],Key=key,
+        Body=buffer.getvalue(),ACL='bucket-owner-full-control')
+    return True
+
+def enrichFile(checkId,key,index,tagCount):
+    if key.endswith('.parquet'):
+        return enrichParquet(checkId,key,index,tagCount)
+    return enrichCsv(checkId,key,index,tagCount)
+
+def getDetailsKeys(day):
+    files=[]
+    for category in data_layout.listPrefixes('TA-Reports/'):
+        for checkId in glue_catalog.tagJoinColumns:
+            for prefix in data_layout.getDayPrefixes(category+'check_'+checkId+'/',day):
+                files.extend((checkId,key) for key in data_layout.listDataKeys(prefix))
+    return files
+
+def startNextStage(day):
+    if os.environ.get('CompactionFunction','') != '':
+        lambdaClient.invoke(FunctionName=os.environ['CompactionFunction'],
+            InvocationType='Event',Payload=json.dumps({"Date":str(day)}).encode('utf-8'))
+    elif os.environ.get('CrawlerName','') != '':
+        try:
+            glueClient.start_crawler(Name=os.environ['CrawlerName'])
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'CrawlerRunningException':
+                raise
+            logger.info("Crawler "+os.environ['CrawlerName']+" is already running")
+
+def lambda_handler(event, context):
+    logger.info(json.dumps(event))
+    try:
+        day=data_layout.getDay(event)
+        start=time.time()
+        tags=[x.strip() for x in os.environ.get('EnrichmentTags','').split(',') if x.strip() != '']
+        enriched=0
+        resources=0
+        if len(tags) > 0:
+            index=buildTagIndex(day,tags)
+            resources=len(index)//2
+            files=getDetailsKeys(day)
+            with ThreadPoolExecutor(max_workers=int(os.environ.get('EnrichmentWorkers','16'))) as executor:
+                enriched=sum(executor.map(lambda x: enrichFile(x[0],x[1],index,len(tags)),files))
+            logger.info("Enriched "+str(enriched)+" of "+str(len(files))+" Details files in "+
+                str(round(time.time()-start,1))+" seconds")
+        startNextStage(day)
+        return {"Date":str(day),"Resources":resources,"Files":enriched}
+    except ClientError as e:
+        e = sanitize_string(e)
+        logger.error("Unexpected client error %s" % e)
+        raise AWSTrustedAdvisorExplorerGenericException(e)
+    except Exception as f:
+        f = sanitize_string(f)
+        logger.error("Unexpected exception: %s" % f)
+        raise AWSTrustedAdvisorExplorerGenericException(f)
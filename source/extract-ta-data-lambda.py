@@ -11,13 +11,20 @@
 #  and limitations under the License.                                                                                #
 ######################################################################################################################
 
-import boto3,csv,os,logging,re
+import hashlib,io,json,os,logging,re,time
+from concurrent.futures import ThreadPoolExecutor,as_completed
 from datetime import date,datetime
-from subprocess import call
+from decimal import Decimal,InvalidOperation
+from operator import itemgetter
 from botocore.exceptions import ClientError
+import client_factory,credential_cache,glue_catalog,phase_metrics,refresh_planner
+from s3_writer import encodeCsv,writeToS3
+from pii_masking import lazy,logRows,sanitize_json,sanitize_list,sanitize_string
 
 class AWSTrustedAdvisorExplorerGenericException(Exception): pass
 
+s3Client = client_factory.getClient('s3')
+
 #Logger block
 logger = logging.getLogger()
 if "LOG_LEVEL" in os.environ:
@@ -26,109 +33,286 @@ if "LOG_LEVEL" in os.environ:
         raise ValueError('Invalid log level %s' % loglevel)
     logger.setLevel(level=numeric_level)
 
-def sanitize_string(x):
-    y = str(x)
-    if os.environ['MASK_PII'].lower() == 'true':
-        pattern=re.compile('\d{12}')
-        y = re.sub(pattern,lambda match: ((match.group()[1])+'XXXXXXX'+(match.group()[-4:])), y)
-    return y
-
-def sanitize_json(x):
-    d = x.copy()
-    if os.environ['MASK_PII'].lower() == 'true':
-        for k, v in d.items():
-            if 'AccountId' in k:
-                d[k] = sanitize_string(v)
-            if 'AccountName' in k:
-                d[k] = v[:3]+'-MASKED-'+v[-3:]
-            if 'AccountEmail' in k:
-                d[k] = v[:3]+'-MASKED-'+v[-3:]
-    return d
-
-def sanitize_list(x):
-    v = x.copy()
-    if os.environ['MASK_PII'].lower() == 'true':
-        v[-3]=sanitize_string(v[-3])
-        v[-2]=v[-2][:3]+'-MASKED-'+v[-2][-3:]
-        v[-1]=v[-1][:3]+'-MASKED-'+v[-1][-3:]
-    return v
-
-def write2csv(values,fileName):
-    logger.info('Variables passed to writeToCsv(): Data & Filename(' + 
-        sanitize_string(fileName) + ')' )
-    csv_out = open("/tmp/"+fileName, 'w')
-    mywriter = csv.writer(csv_out)
-    mywriter.writerows(values)
-    logger.info('Number of rows in file '+ sanitize_string(fileName) +
-        '(including header): ' + str(len(values)))
-    csv_out.close()
-    logger.info('Size of file "' + sanitize_string(fileName) + 
-        '": '+str(os.stat("/tmp/"+fileName).st_size)+" bytes")
-    return os.stat("/tmp/"+fileName).st_size
+def write2csv(values,fileName,s3Path):
+    logger.info('Variables passed to writeToCsv(): Data & Filename(%s)',
+        lazy(sanitize_string,fileName))
+    with phase_metrics.phase('WriteCsv') as phase:
+        size = writeToS3(encodeCsv(values,escaped=glue_catalog.isNormalized()),
+            fileName,s3Path)
+        phase.add('Rows',len(values)-1)
+        phase.add('Bytes',size)
+    logger.info('Number of rows in file %s(including header): %d',
+        lazy(sanitize_string,fileName),len(values))
+    logger.info('Size of file "%s": %d bytes',lazy(sanitize_string,fileName),size)
+    return size
+
+#Typed values (Parquet or NormalizeValues), column types from glue_catalog.getColumnTypes
+
+def convertValue(value,columnType):
+    if value is None or columnType == 'string':
+        return value
+    try:
+        if columnType == 'date':
+            return datetime.strptime(str(value),'%m-%d-%Y').date()
+        if columnType == 'timestamp':
+            return datetime.strptime(str(value).replace('T',' ')[:19],'%Y-%m-%d %H:%M:%S')
+        number=glue_catalog.parseNumber(value)
+        if number == None:
+            return None
+        if columnType == 'decimal':
+            return Decimal(str(number)).quantize(Decimal('0.01'))
+        if columnType == 'double':
+            return float(number)
+        return int(number)
+    except (ValueError,OverflowError,InvalidOperation):
+        return None
+
+def write2parquet(values,fileName,s3Path,columnTypes):
+    logger.info('Variables passed to write2parquet(): Data & Filename(%s)',
+        lazy(sanitize_string,fileName))
+    try:
+        import pyarrow,pyarrow.parquet
+    except ImportError:
+        raise AWSTrustedAdvisorExplorerGenericException("OutputFormat is "+
+            "Parquet but pyarrow is not available; attach the pyarrow layer")
+    arrowTypes={'string':pyarrow.string(),'date':pyarrow.date32(),
+        'timestamp':pyarrow.timestamp('ms'),'bigint':pyarrow.int64(),
+        'double':pyarrow.float64(),'decimal':pyarrow.decimal128(18,2)}
+    header=values[0]
+    with phase_metrics.phase('WriteParquet') as phase:
+        #Rows are already normalized by genericTAParse
+        columns=[]
+        for i in range(0,len(header)):
+            columns.append(pyarrow.array([row[i] for row in values[1:]],
+                type=arrowTypes[columnTypes[i]]))
+        table=pyarrow.Table.from_arrays(columns,names=header)
+        buffer=io.BytesIO()
+        pyarrow.parquet.write_table(table,buffer,compression='snappy')
+        size = writeToS3([buffer.getvalue()],fileName,s3Path)
+        phase.add('Rows',len(values)-1)
+        phase.add('Bytes',size)
+    logger.info('Number of rows in file %s(including header): %d',
+        lazy(sanitize_string,fileName),len(values))
+    logger.info('Size of file "%s": %d bytes',lazy(sanitize_string,fileName),size)
+    return size
+
+def writeFile(values,fileName,s3Path,columnTypes):
+    if fileName.endswith('.parquet'):
+        return write2parquet(values,fileName,s3Path,columnTypes)
+    return write2csv(values,fileName,s3Path)
+
+#Construct the S3 Path for today's run (PartitionLayout=Hive adds key=value partitions)
+def getS3Path(prefix,accountId):
+    today=date.today()
+    if os.environ.get('PartitionLayout','Legacy').lower() == 'hive':
+        shard=int(accountId) % int(os.environ.get('PartitionShards','16'))
+        return (prefix+'year='+str(today.year)+'/month='+str(today.month)+
+            '/day='+str(today.day)+'/shard='+str(shard)+'/')
+    return prefix+str(today.year)+'/'+str(today.month)+'/'+str(today.day)+'/'
 
 #Get TA Check Results
 def getTACheckResults(checkId,client,language):
     logger.info("Getting Trusted Advisor Results for Check & Language:" +checkId+','+language)
     result = client.describe_trusted_advisor_check_result(checkId=checkId,
         language=language.lower())
-    logger.info(result)
+    logger.info("Check %s: status %s, %d flagged resources",checkId,
+        result['result'].get('status'),len(result['result'].get('flaggedResources',[])))
+    logger.debug('%s',lazy(sanitize_string,result))
     return result
 
-#Write to S3
-def writeToS3(fileName,s3Path):
-    logger.info('Variables passed to writeToS3(): '+ 
-        sanitize_string(fileName)+','+s3Path)
-    #required variables
-    bucketName=os.environ['S3BucketName']
-    s3Client = boto3.resource('s3')
-    s3Client.meta.client.upload_file('/tmp/'+fileName, bucketName, 
-        s3Path+fileName,ExtraArgs={'ACL': 'bucket-owner-full-control'})
-    return fileName
-
-#Assume Role in Child Account
+#Assume Role in Child Account (credentials are cached across invocations)
 def assumeRole(accountId):
-    logger.info('Variables passed to assumeRole(): '+sanitize_string(accountId))
-    roleArn="arn:aws:iam::"+str(accountId)+":role/"+os.environ['IAMRoleName']
-    #STS assume role call
-    stsClient = boto3.client('sts')
-    roleCredentials = stsClient.assume_role(RoleArn=roleArn, RoleSessionName="AWSTrustedAdvisorExplorerAssumeRole")
-    return roleCredentials
+    logger.info('Variables passed to assumeRole(): %s',lazy(sanitize_string,accountId))
+    #STS assume role call, served from the container's credential cache
+    return credential_cache.assumeRole(accountId)
         
+def checkAssumeRoleFailure(error):
+    if "(AccessDenied) when calling the AssumeRole operation" in error:
+        pattern=re.compile(r'.*iam::(\d{12}):.*$')
+        match=pattern.match(error)
+        if match != None:
+            logger.info('Assume Role Error for Account:'+sanitize_string(match.group(1)))
+            key_name='Logs/AssumeRoleFailure/'+ str(date.today().year)+ '/'+str(date.today().month)+'/'+str(date.today().day)+'/'+str(match.group(1))+'.log'
+            s3Client.put_object(ACL='bucket-owner-full-control',StorageClass='STANDARD',Body=error, Bucket=os.environ['S3BucketName'],Key=key_name)
+    return
+
 #TA Check & Parse
+#Incremental mode: a per (account, check) manifest keeps the digest of the
+#last written Details file, which is only rewritten when the result changes.
+#Every run writes an Incremental row per (account, check) pointing at the run
+#holding the Details rows; compaction keeps the manifest's DetailsKey current
+def isIncremental():
+    return os.environ.get('IncrementalMode','false').lower() == 'true'
+
+def getManifestKey(checkId,accountId):
+    return 'Manifests/'+checkId+'/'+str(accountId)+'.json'
+
+def getManifest(checkId,accountId):
+    try:
+        response=s3Client.get_object(Bucket=os.environ['S3BucketName'],
+            Key=getManifestKey(checkId,accountId))
+        return json.loads(response['Body'].read())
+    except ClientError as e:
+        if e.response['Error']['Code'] in ('NoSuchKey','404'):
+            return None
+        raise
+
+def putManifest(checkId,accountId,manifest):
+    s3Client.put_object(ACL='bucket-owner-full-control',StorageClass='STANDARD',
+        Body=json.dumps(manifest),Bucket=os.environ['S3BucketName'],
+        Key=getManifestKey(checkId,accountId))
+
+#Today's row pointing at the run whose Details rows hold the check result and
+#at the day directory of its Details file, which the Athena views resolve
+#(see create-athena-views-lambda.py)
+def writeIncrementalRow(checkId,accountId,accountName,accountEmail,Date,
+        dateTime,checkName,category,manifest,extension,normalize):
+    fileName=(checkId+"_"+str(accountId)+"_Incremental_"+str(Date)+"_"+
+        str(datetime.utcnow().strftime("%H-%M-%S"))+extension)
+    filePath=getS3Path('TA-Reports/'+category+'/Incremental/',accountId)
+    header=list(glue_catalog.incrementalHeader)
+    tablePrefix='TA-Reports/'+category+'/check_'+checkId+'/'
+    detailsKey=manifest['DetailsKey']
+    row=[Date,dateTime,checkName,checkId,manifest['Date'],manifest['DateTime'],
+        detailsKey[len(tablePrefix):detailsKey.rindex('/')+1],str(accountId),
+        accountName,accountEmail]
+    if normalize:
+        row=[convertValue(x,y) for x,y in zip(row,glue_catalog.incrementalTypes)]
+    size=writeFile([header,row],fileName,filePath,glue_catalog.incrementalTypes)
+    registerPartition('incremental',header,'TA-Reports/'+category+'/Incremental/',
+        filePath,glue_catalog.incrementalTypes)
+    return {"IncrementalFileName":fileName,"IncrementalFileSize":size}
+
+#Digest of the Details rows without the Date & DateTime columns of the run
+def resultDigest(rows):
+    digest=hashlib.sha256()
+    for row in rows:
+        digest.update(json.dumps(row[2:],default=str).encode('utf-8'))
+    return digest.hexdigest()
+
+#PartitionDiscovery=Registration: register the partition of a file just written
+def registerPartition(tableName,header,tableLocation,s3Path,columnTypes):
+    if glue_catalog.isRegistration():
+        glue_catalog.registerPartitions(tableName,header,
+            's3://'+os.environ['S3BucketName']+'/'+tableLocation,[s3Path],
+            os.environ.get('OutputFormat','CSV').lower() == 'parquet',
+            columnTypes if glue_catalog.isNormalized() else None)
+
+#Row projectors, compiled once per check & container from the Header_ and
+#Schema_ variables. Schema keys that are digits index the metadata of a
+#flagged resource, the others the flagged resource itself
+flaggedStatuses=frozenset(['warning','error'])
+projectors={}
+
+def stripCommas(value):
+    return value if value is None else value.replace(",","")
+
+#itemgetter that always returns a tuple
+def getTupleGetter(keys):
+    if len(keys) == 0:
+        return lambda x:()
+    if len(keys) == 1:
+        key=keys[0]
+        return lambda x:(x[key],)
+    return itemgetter(*keys)
+
+def compileProjector(checkId):
+    try:
+        summaryHeader=os.environ["Header_Summary"].split(",")
+        resourceHeader=os.environ["Header_"+checkId].split(",")
+        schema=os.environ["Schema_"+checkId].split(",")
+    except KeyError as e:
+        logger.error("Unable to find env variable : %s" %e)
+        raise Exception("Unable to find env variable %s" % e)
+    logger.info("Summary Header from environment variables:"+str(summaryHeader))
+    logger.info(checkId+" Check Header from environment variables:"+str(resourceHeader))
+    logger.info(checkId+" Check Schema from environment variables:"+str(schema))
+    summaryHeader=["Date","DateTime","CheckName"]+summaryHeader+["AccountId","AccountName","AccountEmail"]
+    resourceHeader=["Date","DateTime","CheckName"]+resourceHeader+["AccountId","AccountName","AccountEmail"]
+    normalize=glue_catalog.isNormalized()
+    resourceTypes=glue_catalog.getColumnTypes(checkId,resourceHeader)
+    tableHeader,tableTypes=glue_catalog.getEnrichedHeader(checkId,resourceHeader,resourceTypes)
+    #Values are fetched as the flagged resource keys followed by the metadata
+    #indexes, and only put back in schema order if the schema mixes them
+    storeColumns=[j for j,key in enumerate(schema) if not key.isdigit()]
+    metadataColumns=[j for j,key in enumerate(schema) if key.isdigit()]
+    getStore=getTupleGetter([schema[j] for j in storeColumns])
+    getMetadata=getTupleGetter([int(schema[j]) for j in metadataColumns])
+    order=storeColumns+metadataColumns
+    reorder=None if order == sorted(order) else getTupleGetter([order.index(j) for j in range(len(order))])
+    #Typed values are parsed before commas are stripped, so "$1,234.00" is
+    #kept as 1234.00
+    converters=[]
+    for j in order:
+        columnType=resourceTypes[j+3]
+        if normalize and columnType != 'string':
+            converters.append(lambda value,columnType=columnType:convertValue(value,columnType))
+        elif schema[j].isdigit():
+            converters.append(stripCommas)
+        else:
+            converters.append(None)
+
+    #Rows of the warning & error resources: prefix + schema values + suffix
+    def project(flaggedResources,prefix,suffix):
+        rows=[]
+        for store in flaggedResources:
+            if store['status'] in flaggedStatuses:
+                values=[x if f is None else f(x) for f,x in
+                    zip(converters,getStore(store)+getMetadata(store['metadata']))]
+                if reorder is not None:
+                    values=reorder(values)
+                rows.append([*prefix,*values,*suffix])
+        return rows
+
+    #Without typed columns the metadata values only have their commas stripped
+    def projectStrings(flaggedResources,prefix,suffix):
+        return [[*prefix,*getStore(store),*[x if x is None else x.replace(",","")
+            for x in getMetadata(store['metadata'])],*suffix]
+            for store in flaggedResources if store['status'] in flaggedStatuses]
+
+    if reorder is None and all(f is None for f in converters[:len(storeColumns)]) and \
+            all(f is stripCommas for f in converters[len(storeColumns):]):
+        project=projectStrings
+
+    return {"SummaryHeader":summaryHeader,
+            "SummaryTypes":glue_catalog.getColumnTypes('Summary',summaryHeader),
+            "ResourceHeader":resourceHeader,"ResourceTypes":resourceTypes,
+            "TableHeader":tableHeader,"TableTypes":tableTypes,
+            "Normalize":normalize,"Project":project}
+
+def getProjector(checkId):
+    projector=projectors.get(checkId)
+    if projector is None:
+        projector=compileProjector(checkId)
+        projectors[checkId]=projector
+    return projector
+
 def genericTAParse(client,checkId,accountId,accountName,accountEmail,language,
         Date,dateTime,checkName,category):  
-    #Construct File Name (CheckID_AccountID_CheckName_Date_Time.csv)
+    #Construct File Name (CheckID_AccountID_CheckName_Date_Time.csv|.parquet)
+    extension='.parquet' if os.environ.get('OutputFormat','CSV').lower() == 'parquet' else '.csv'
     resourceFilename=(checkId+"_"+str(accountId)+"_"+str(Date)+"_"+
-        str(datetime.utcnow().strftime("%H-%M-%S"))+'.csv')
+        str(datetime.utcnow().strftime("%H-%M-%S"))+extension)
     summaryFilename=(checkId+"_"+str(accountId)+"_Summary_"+str(Date)+
-        "_"+str(datetime.utcnow().strftime("%H-%M-%S"))+'.csv')    
+        "_"+str(datetime.utcnow().strftime("%H-%M-%S"))+extension)    
     fileDetails = [{"SummaryFileName":summaryFilename,
                     "SummaryFileSize": 0}, 
                     {"DetailsFileName":resourceFilename,
                     "DetailsFileSize": 0}]
     #Construct S3 Path
-    resourceFilePath='TA-Reports/'+category+'/check_'+checkId+'/'+ \
-        str(date.today().year)+'/'+str(date.today().month)+'/'+ \
-        str(date.today().day)+'/'
-    summaryFilePath='TA-Reports/'+category+'/Summary/'+str(date.today().year)+ \
-        '/'+str(date.today().month)+'/'+str(date.today().day)+'/'
+    resourceFilePath=getS3Path('TA-Reports/'+category+'/check_'+checkId+'/',
+        accountId)
+    summaryFilePath=getS3Path('TA-Reports/'+category+'/Summary/',accountId)
+    projector=getProjector(checkId)
+    normalize=projector['Normalize']
     #TA Check Module
-    result=getTACheckResults(checkId,client,language)
-    try:
-        summaryFileHeader=list(os.environ[("Header_Summary")].split(","))
-        logger.info("Summary Header from environment variables:"+str(summaryFileHeader))
-        resourceFileHeader=list(os.environ[("Header_"+checkId)].split(","))
-        logger.info(checkId+" Check Header from environment variables:"+str(resourceFileHeader))
-        resourceFileSchema=list(os.environ[("Schema_"+checkId)].split(","))
-        logger.info(checkId+" Check Schema from environment variables:"+str(resourceFileSchema))
-    except Exception as e:
-        logger.error("Unable to find env variable : %s" %e)
-        raise Exception("Unable to find env variable %s" % e)    
+    with phase_metrics.phase('GetTACheckResults') as phase:
+        result=getTACheckResults(checkId,client,language)
+        phase.add('Retries',phase_metrics.retries(result))
+        phase.add('Rows',len(result['result'].get('flaggedResources',[])))
     logger.info("Trusted Advisor Summary Execution Block")
-    summaryFileHeader.extend(["AccountId","AccountName","AccountEmail"])
-    summaryFileHeader.insert(0,"CheckName") 
-    summaryFileHeader.insert(0,"DateTime")
-    summaryFileHeader.insert(0,"Date")
+    summaryFileHeader=list(projector['SummaryHeader'])
+    summaryTypes=projector['SummaryTypes']
     summaryFileRows=[summaryFileHeader]
     summaryFileRow=[Date,dateTime,checkName,result['result']['checkId'],
         result['result']['status'],
@@ -145,51 +329,65 @@ def genericTAParse(client,checkId,accountId,accountName,accountEmail,language,
             str(accountId),accountName,accountEmail])
     else:
         summaryFileRow.extend([0,0,str(accountId),accountName,accountEmail])
-    logger.info(sanitize_list(summaryFileRow))
+    if normalize:
+        summaryFileRow=[convertValue(x,y) for x,y in zip(summaryFileRow,summaryTypes)]
+    logger.info('%s',lazy(sanitize_list,summaryFileRow))
     summaryFileRows.append(summaryFileRow)
 
     
-    #Write the Summary Values into a csv file & Copy file to S3
+    #Stream the Summary Values to S3 as a csv/parquet file
     if len(summaryFileRows) > 1:
-        fileDetails[0]['SummaryFileSize'] = write2csv(summaryFileRows,summaryFilename)
-        writeToS3(summaryFilename,summaryFilePath)
+        fileDetails[0]['SummaryFileSize'] = writeFile(summaryFileRows,
+            summaryFilename,summaryFilePath,summaryTypes)
+        registerPartition('summary',summaryFileHeader,
+            'TA-Reports/'+category+'/Summary/',summaryFilePath,summaryTypes)
     
     logger.info("Trusted Advisor Results Execution Block")
     #TA Flagged Resources Execution
-    resourceFileHeader.extend(["AccountId","AccountName","AccountEmail"])
-    resourceFileHeader.insert(0,"CheckName")
-    resourceFileHeader.insert(0,"DateTime")
-    resourceFileHeader.insert(0,"Date")
+    resourceFileHeader=list(projector['ResourceHeader'])
+    resourceTypes=projector['ResourceTypes']
+    #Glue table columns, including the columns added by TagEnrichment
+    tableHeader,tableTypes=projector['TableHeader'],projector['TableTypes']
+    rowDate=convertValue(Date,'date') if normalize else Date
+    rowDateTime=convertValue(dateTime,'timestamp') if normalize else dateTime
     resourceFileRows=[resourceFileHeader]
-    for i in range(0,len(result['result']['flaggedResources'])):
-        if result['result']['flaggedResources'][i]['status'] == "warning" or \
-            result['result']['flaggedResources'][i]['status'] == "error":
-            store=result['result']['flaggedResources'][i]
-            resourceFileRow=[]
-            for key in resourceFileSchema:
-                if key.isdigit() == True:
-                    if store['metadata'][int(key)] is None:
-                        resourceFileRow.append(store['metadata'][int(key)])
-                    else:
-                        resourceFileRow.append(
-                                store['metadata'][int(key)].replace(",",""))
-                else:
-                    resourceFileRow.append(store[key])
-            resourceFileRow.extend([str(accountId),accountName,accountEmail])
-            resourceFileRow.insert(0,checkName)
-            resourceFileRow.insert(0,dateTime)
-            resourceFileRow.insert(0,Date)
-            logger.info(sanitize_list(resourceFileRow))
-            resourceFileRows.append(resourceFileRow)
+    with phase_metrics.phase('BuildRows') as phase:
+        resourceFileRows.extend(projector['Project'](
+            result['result'].get('flaggedResources',[]),
+            (rowDate,rowDateTime,checkName),
+            (str(accountId),accountName,accountEmail)))
+        phase.add('Rows',len(resourceFileRows)-1)
+    logRows(logger,"Details of Check "+checkId,resourceFileRows,first=1)
     
 
-    #Write the Resource Values into a csv file & Copy file to S3
-    if len(resourceFileRows) > 1:
-        fileDetails[1]['DetailsFileSize'] = write2csv(resourceFileRows,resourceFilename)
-        writeToS3(resourceFilename,resourceFilePath)
-    
-    logger.info("Clean /tmp/")
-    call('rm -rf /tmp/*', shell=True)
+    #Stream the Resource Values to S3 as a csv/parquet file
+    if len(resourceFileRows) > 1 and isIncremental():
+        digest=resultDigest(resourceFileRows)
+        manifest=getManifest(checkId,accountId)
+        if manifest is not None and manifest['Digest'] == digest:
+            logger.info("Details for Check "+checkId+" unchanged since "+
+                manifest['DateTime']+"; skipping "+resourceFilename)
+            fileDetails[1]['DetailsFileName']=None
+            fileDetails[1]['ReusedDetailsKey']=manifest['DetailsKey']
+            fileDetails[1]['Unchanged']=True
+            manifest['LastSeenDateTime']=dateTime
+        else:
+            fileDetails[1]['DetailsFileSize'] = writeFile(resourceFileRows,
+                resourceFilename,resourceFilePath,resourceTypes)
+            registerPartition('check_'+checkId.lower(),tableHeader,
+                'TA-Reports/'+category+'/check_'+checkId+'/',resourceFilePath,tableTypes)
+            manifest={"Digest":digest,"Date":Date,"DateTime":dateTime,
+                "LastSeenDateTime":dateTime,
+                "DetailsKey":resourceFilePath+resourceFilename}
+        fileDetails.append(writeIncrementalRow(checkId,accountId,accountName,
+            accountEmail,Date,dateTime,checkName,category,manifest,
+            extension,normalize))
+        putManifest(checkId,accountId,manifest)
+    elif len(resourceFileRows) > 1:
+        fileDetails[1]['DetailsFileSize'] = writeFile(resourceFileRows,
+            resourceFilename,resourceFilePath,resourceTypes)
+        registerPartition('check_'+checkId.lower(),tableHeader,
+            'TA-Reports/'+category+'/check_'+checkId+'/',resourceFilePath,tableTypes)
      
     return {"status": result['ResponseMetadata']['HTTPStatusCode'],
             "checkId": checkId, "fileDetails": fileDetails}    
@@ -197,20 +395,19 @@ def genericTAParse(client,checkId,accountId,accountName,accountEmail,language,
 def lambda_handler(event, context):
     if ("Header_"+event['CheckId']) in os.environ and ("Schema_"+event['CheckId']) in os.environ:
         try:
-            logger.info(sanitize_json(event))
+            logger.info('%s',lazy(sanitize_json,event))
             logger.info("Assume role in child account")
             roleCredentials=assumeRole(event['AccountId'])       
-            logger.info("Create boto3 support client using the temporary credentials")
-            supportClient=boto3.client("support",region_name="us-east-1",
-                aws_access_key_id = roleCredentials['Credentials']['AccessKeyId'],
-                aws_secret_access_key = 
-                    roleCredentials['Credentials']['SecretAccessKey'],
-                aws_session_token=roleCredentials['Credentials']['SessionToken'])        
-            result = genericTAParse(supportClient,event['CheckId'],event['AccountId'],
-                event['AccountName'],event['AccountEmail'],event['Language'],
-                event['Date'],event['DateTime'],event['CheckName'],
-                event['Category'])
-            logger.info(result)
+            logger.info("Get the pooled boto3 support client for the temporary credentials")
+            supportClient=client_factory.getClient("support","us-east-1",
+                roleCredentials['Credentials'])
+            with phase_metrics.context(ExtractionMode='Check',
+                    AccountId=event['AccountId'],CheckId=event['CheckId']):
+                result = genericTAParse(supportClient,event['CheckId'],event['AccountId'],
+                    event['AccountName'],event['AccountEmail'],event['Language'],
+                    event['Date'],event['DateTime'],event['CheckName'],
+                    event['Category'])
+            logger.info('%s',lazy(sanitize_string,result))
             return result      
         except ClientError as e:
             e = sanitize_string(e)
@@ -221,4 +418,134 @@ def lambda_handler(event, context):
             logger.error("Unexpected exception: %s" % f)
             raise AWSTrustedAdvisorExplorerGenericException(f)
     else:
-        return "Header_"+event['CheckId']+" not found in env variables; Skipping Check"
\ No newline at end of file
+        return "Header_"+event['CheckId']+" not found in env variables; Skipping Check"
+
+#Per-account extraction (ExtractionMode=Account): the role is assumed once and
+#all of the account's checks are refreshed, polled & extracted on a bounded pool
+refreshPendingStatuses=['enqueued','processing']
+
+def refreshCheck(supportClient,checkId):
+    logger.info('Refreshing Trusted Advisor Check:'+checkId)
+    try:
+        supportClient.refresh_trusted_advisor_check(checkId=checkId)
+        return True
+    except ClientError as e:
+        logger.info("Refresh not possible for Check "+checkId+
+            "; extracting the last result: "+sanitize_string(e))
+        return False
+
+#Poll the refresh status of all pending checks with one API call per round and
+#call onComplete(checkId) as soon as a check leaves enqueued/processing. The
+#wait between rounds follows millisUntilNextRefreshable, bounded by
+#RefreshPollIntervalInSec and MaxRefreshPollIntervalInSec, and doubles while no
+#check completes
+def pollRefreshStatuses(supportClient,checkIds,onComplete):
+    pending=set(checkIds)
+    minInterval=int(os.environ.get('RefreshPollIntervalInSec','15'))
+    maxInterval=int(os.environ.get('MaxRefreshPollIntervalInSec','60'))
+    deadline=time.time()+int(os.environ.get('MaxRefreshWaitInSec','600'))
+    interval=minInterval
+    rounds=0
+    while pending:
+        rounds+=1
+        response=supportClient.describe_trusted_advisor_check_refresh_statuses(
+            checkIds=sorted(pending))
+        hints=[]
+        completed=0
+        for status in response['statuses']:
+            if status['checkId'] not in pending:
+                continue
+            if status['status'] not in refreshPendingStatuses:
+                pending.discard(status['checkId'])
+                completed+=1
+                onComplete(status['checkId'])
+            elif status.get('millisUntilNextRefreshable',0) > 0:
+                hints.append(status['millisUntilNextRefreshable']/1000.0)
+        if not pending:
+            break
+        interval=minInterval if completed else min(interval*2,maxInterval)
+        sleepFor=min(max(min(hints) if hints else interval,minInterval),maxInterval)
+        if time.time()+sleepFor > deadline:
+            logger.info("Checks "+str(sorted(pending))+" still refreshing after "
+                "the maximum wait; extracting the last result")
+            for checkId in sorted(pending):
+                onComplete(checkId)
+            break
+        time.sleep(sleepFor)
+    logger.info("Polled refresh status of "+str(len(checkIds))+" Checks in "+
+        str(rounds)+" API calls")
+
+def extractCheck(supportClient,event,check):
+    with phase_metrics.context(ExtractionMode='Account',AccountId=event['AccountId'],
+            CheckId=check['CheckId']):
+        return genericTAParse(supportClient,check['CheckId'],event['AccountId'],
+            event['AccountName'],event['AccountEmail'],check['Language'],
+            event['Date'],event['DateTime'],check['CheckName'],check['Category'])
+
+def extractAccountChecks(supportClient,event):
+    checks=[check for check in event['Checks'] if
+        ("Header_"+check['CheckId']) in os.environ and
+        ("Schema_"+check['CheckId']) in os.environ]
+    logger.info("Extracting "+str(len(checks))+" of "+str(len(event['Checks']))+
+        " Checks with headers defined in env variables")
+    checksById={check['CheckId']:check for check in checks}
+    results=[]
+    failedCheckIds=[]
+    with ThreadPoolExecutor(max_workers=int(os.environ.get('AccountWorkers','8'))) as executor:
+        futures={}
+        #Extraction of a check starts as soon as its refresh is done
+        def submit(checkId):
+            futures[executor.submit(extractCheck,supportClient,event,
+                checksById[checkId])]=checkId
+        plan=refresh_planner.planRefresh(supportClient,checksById)
+        toRefresh=[checkId for checkId in checksById if
+            plan[checkId][0]==refresh_planner.REFRESH]
+        refreshed=list(executor.map(lambda checkId:(checkId,
+            refreshCheck(supportClient,checkId)),toRefresh))
+        for checkId in checksById:
+            if plan[checkId][0]==refresh_planner.SKIP:
+                submit(checkId)
+        for checkId,isRefreshed in refreshed:
+            if not isRefreshed:
+                submit(checkId)
+        pollRefreshStatuses(supportClient,
+            [checkId for checkId,isRefreshed in refreshed if isRefreshed]+
+            [checkId for checkId in checksById if
+                plan[checkId][0]==refresh_planner.POLL],submit)
+        for future in as_completed(list(futures)):
+            try:
+                results.append(future.result())
+            except Exception as e:
+                logger.error("Unable to extract Check "+futures[future]+": "+
+                    sanitize_string(e))
+                failedCheckIds.append(futures[future])
+    return results,failedCheckIds
+
+def account_lambda_handler(event, context):
+    try:
+        logger.info('%s',lazy(sanitize_json,
+            {k: v for k, v in event.items() if k != 'Checks'}))
+        logger.info("Assume role in child account")
+        roleCredentials=assumeRole(event['AccountId'])
+        logger.info("Get the pooled boto3 support client for the temporary credentials")
+        supportClient=client_factory.getClient("support","us-east-1",
+            roleCredentials['Credentials'])
+        results,failedCheckIds=extractAccountChecks(supportClient,event)
+        if len(results) == 0 and len(failedCheckIds) > 0:
+            raise AWSTrustedAdvisorExplorerGenericException(
+                "Unable to extract any Check: "+str(failedCheckIds))
+        fileDetails=[]
+        for result in results:
+            fileDetails.extend(result['fileDetails'])
+        return {"status": 200, "checkIds": [x['checkId'] for x in results],
+                "failedCheckIds": failedCheckIds, "fileDetails": fileDetails}
+    except ClientError as e:
+        checkAssumeRoleFailure(str(e))
+        e = sanitize_string(e)
+        logger.error("Unexpected client error %s" % e)
+        raise AWSTrustedAdvisorExplorerGenericException(e)
+    except Exception as f:
+        checkAssumeRoleFailure(str(f))
+        f = sanitize_string(f)
+        logger.error("Unexpected exception: %s" % f)
+        raise AWSTrustedAdvisorExplorerGenericException(f)
\ No newline at end of file
@@ -11,10 +11,12 @@
 #  and limitations under the License.                                                                                #
 ######################################################################################################################
 
-import boto3,csv,os,re,logging
+import os,re,logging
 from datetime import datetime,date
-from subprocess import call
 from botocore.exceptions import ClientError
+import client_factory,credential_cache,glue_catalog,phase_metrics
+from s3_writer import encodeCsv,writeToS3
+from pii_masking import lazy,logRows,sanitize_json,sanitize_string
 
 class AWSTrustedAdvisorExplorerGenericException(Exception): pass
 
@@ -26,24 +28,9 @@ if "LOG_LEVEL" in os.environ:
         raise ValueError('Invalid log level %s' % loglevel)
     logger.setLevel(level=numeric_level)
 
-def sanitize_string(x):
-    y = str(x)
-    if os.environ['MASK_PII'].lower() == 'true':
-        pattern=re.compile('\d{12}')
-        y = re.sub(pattern,lambda match: ((match.group()[1])+'XXXXXXX'+(match.group()[-4:])), y)
-    return y
-
-def sanitize_json(x):
-    d = x.copy()
-    if os.environ['MASK_PII'].lower() == 'true':
-        for k, v in d.items():
-            if 'AccountId' in k:
-                d[k] = sanitize_string(v)
-            if 'AccountName' in k:
-                d[k] = v[:3]+'-MASKED-'+v[-3:]
-            if 'AccountEmail' in k:
-                d[k] = v[:3]+'-MASKED-'+v[-3:]
-    return d
+#Tag rows also hold the account ID in the ResourceArn
+def sanitize_row(x):
+    return sanitize_string(sanitize_json(x))
 
 def getResourceId(Arn):
     #RegEx Pattern
@@ -56,74 +43,125 @@ def getResourceId(Arn):
             return ''
     return match.group(1)
 
-#Get Tag Information & Resource List
-def getTagInfo(accountId,region,resourceType,customerKeys,Date,dateTime,accountName,accountEmail):
-    tagInfo={}
+#Map a resource ARN back to one of the requested "service:type" filters
+def getResourceType(Arn,resourceTypes):
+    parts=Arn.split(':',5)
+    if len(parts) < 6:
+        return None
+    resourceType=parts[2]+':'+re.split('[/:]',parts[5])[0]
+    if resourceType in resourceTypes:
+        return resourceType
+    for x in resourceTypes:
+        if x.split(':')[0] == parts[2]:
+            return x
+    return None
+
+#Get Tag Information & Resource List for all resource types of a region in a
+#single pagination; returns {ResourceType: {ResourceArn: row}}
+def getTagInfo(accountId,region,resourceTypes,customerKeys,Date,dateTime,accountName,accountEmail):
+    tagInfo={resourceType:{} for resourceType in resourceTypes}
+    keys=set(customerKeys)
     #Assume a role and generate a Client
     roleCredentials=assumeRole(accountId)
     #Construct Client
-    tagClient=boto3.client("resourcegroupstaggingapi",
-        region_name=region,
-        aws_access_key_id=roleCredentials['Credentials']['AccessKeyId'],
-        aws_secret_access_key=roleCredentials['Credentials']['SecretAccessKey'],
-        aws_session_token=roleCredentials['Credentials']['SessionToken'])
+    tagClient=client_factory.getClient("resourcegroupstaggingapi",region,
+        roleCredentials['Credentials'])
     paginator = tagClient.get_paginator('get_resources')
-    for customerKey in customerKeys:
-        page_Iterator = paginator.paginate(ResourceTypeFilters=[resourceType],TagFilters=[{'Key': customerKey}])
+    #Multiple TagFilters are ANDed, so the requested keys are projected here
+    page_Iterator = paginator.paginate(ResourceTypeFilters=resourceTypes)
+    pages=0
+    with phase_metrics.phase('GetResources') as phase:
         for page in page_Iterator:
+            pages+=1
+            phase.add('Retries',phase_metrics.retries(page))
             for resource in page['ResourceTagMappingList']:
-                for tag in resource['Tags']:
-                    if tag['Key'] == customerKey:
-                        if resource['ResourceARN'] not in tagInfo.keys():
-                            tagInfo[resource['ResourceARN']]={}
-                        tagInfo[resource['ResourceARN']][customerKey]=tag['Value']
-                        tagInfo[resource['ResourceARN']]['ResourceArn']=resource['ResourceARN']
-                        tagInfo[resource['ResourceARN']]['ResourceId']=getResourceId(resource['ResourceARN'])
-                        tagInfo[resource['ResourceARN']]['ResourceType']=resourceType
-                        tagInfo[resource['ResourceARN']]['RegionName']=region
-                        tagInfo[resource['ResourceARN']]['Date']=Date
-                        tagInfo[resource['ResourceARN']]['DateTime']=dateTime
-                        tagInfo[resource['ResourceARN']]['AccountId']=accountId
-                        tagInfo[resource['ResourceARN']]['AccountName']=accountName
-                        tagInfo[resource['ResourceARN']]['AccountEmail']=accountEmail
+                tags={tag['Key']:tag['Value'] for tag in resource['Tags'] if tag['Key'] in keys}
+                if not tags:
+                    continue
+                resourceType=getResourceType(resource['ResourceARN'],resourceTypes)
+                if resourceType == None:
+                    continue
+                tags.update({'ResourceArn':resource['ResourceARN'],
+                             'ResourceId':getResourceId(resource['ResourceARN']),
+                             'ResourceType':resourceType,
+                             'RegionName':region,
+                             'Date':Date,
+                             'DateTime':dateTime,
+                             'AccountId':accountId,
+                             'AccountName':accountName,
+                             'AccountEmail':accountEmail})
+                tagInfo[resourceType][resource['ResourceARN']]=tags
+        phase.add('Pages',pages)
+        phase.add('Rows',sum(len(x) for x in tagInfo.values()))
+    logger.info("Harvested tags of "+str(len(resourceTypes))+" Resource Types in "+
+        region+" with "+str(pages)+" get_resources calls")
     return tagInfo
 
-def write2csv(tagInfo,fileName,file_Header):
-    logger.info('Variables passed to write2csv(): Data,' + 
-        sanitize_string(fileName) +','+str(file_Header))
-    with open("/tmp/"+fileName, 'w') as csvfile:
-        writer = csv.DictWriter(csvfile, fieldnames=file_Header)
-        writer.writeheader()
-        for key in tagInfo:
-            logger.info(sanitize_json(tagInfo[key]))
-            writer.writerow(tagInfo[key])
-    logger.info('Number of rows in file '+ sanitize_string(fileName) +
-        '(including header): ' + str(len(tagInfo.keys())))
-    csvfile.close()
-    logger.info('Size of file "' + sanitize_string(fileName) + 
-        '": '+str(os.stat("/tmp/"+fileName).st_size)+" bytes")
-    return 
+def write2csv(tagInfo,fileName,file_Header,s3Path):
+    logger.info('Variables passed to write2csv(): Data,%s,%s',
+        lazy(sanitize_string,fileName),file_Header)
+    logRows(logger,"Tags of "+fileName,tagInfo.values(),mask=sanitize_row)
+    with phase_metrics.phase('WriteCsv') as phase:
+        size = writeToS3(encodeCsv(tagInfo.values(),file_Header),fileName,s3Path)
+        phase.add('Rows',len(tagInfo))
+        phase.add('Bytes',size)
+    logger.info('Number of rows in file %s(including header): %d',
+        lazy(sanitize_string,fileName),len(tagInfo))
+    logger.info('Size of file "%s": %d bytes',lazy(sanitize_string,fileName),size)
+    return size
+
+#Construct the S3 Path for today's run; with PartitionLayout=Hive the resource
+#type is only kept as a column so that all tag files share one partition tree
+def getS3Path(resourceType,accountId):
+    today=date.today()
+    if os.environ.get('PartitionLayout','Legacy').lower() == 'hive':
+        shard=int(accountId) % int(os.environ.get('PartitionShards','16'))
+        return ('Tags/year='+str(today.year)+'/month='+str(today.month)+
+            '/day='+str(today.day)+'/shard='+str(shard)+'/')
+    return ('Tags/'+str(resourceType)+'/'+str(today.year)+'/'+str(today.month)+
+        '/'+str(today.day)+'/')
 
-#Write to S3
-def writeToS3(fileName,s3Path):
-    logger.info('Variables passed to writeToS3(): '+sanitize_string(fileName)+','+s3Path)
-    #required variables
-    bucketName=os.environ['S3BucketName']
-    s3Client = boto3.resource('s3')
-    s3Client.meta.client.upload_file('/tmp/'+fileName, bucketName, s3Path+fileName,ExtraArgs={'ACL': 'bucket-owner-full-control'})
-    return
+#Record which resource types had tagged resources in the region activity index
+#read by get-tags-lambda (RegionIndex/<AccountId>/<Region>/<ResourceType>)
+def updateRegionIndex(accountId,region,tagInfo):
+    s3Client = client_factory.getClient('s3')
+    inactive=[]
+    for resourceType in tagInfo:
+        key='RegionIndex/'+str(accountId)+'/'+region+'/'+resourceType
+        if len(tagInfo[resourceType]) > 0:
+            s3Client.put_object(Bucket=os.environ['S3BucketName'],Key=key,
+                Body=b'',ACL='bucket-owner-full-control')
+        else:
+            inactive.append({'Key':key})
+    if len(inactive) > 0:
+        s3Client.delete_objects(Bucket=os.environ['S3BucketName'],
+            Delete={'Objects':inactive,'Quiet':True})
 
-#Assume Role in Child Account
+#Mark the end of a full region sweep (RegionIndex/<AccountId>/_sweep); run by
+#the tag state machine after every region of the sweep was extracted
+def markFullSweep(accountId):
+    s3Client = client_factory.getClient('s3')
+    s3Client.put_object(Bucket=os.environ['S3BucketName'],
+        Key='RegionIndex/'+str(accountId)+'/_sweep',Body=b'',
+        ACL='bucket-owner-full-control')
+
+#Assume Role in Child Account (credentials are cached across invocations)
 def assumeRole(accountId):
-    logger.info('Variables passed to assumeRole(): '+sanitize_string(accountId))
-    roleArn="arn:aws:iam::"+str(accountId)+":role/"+os.environ['IAMRoleName']
-    #STS assume role call
-    stsClient = boto3.client('sts')
-    roleCredentials = stsClient.assume_role(RoleArn=roleArn, RoleSessionName="AWSTrustedAdvisorExplorerAssumeRole")
-    return roleCredentials
+    logger.info('Variables passed to assumeRole(): %s',lazy(sanitize_string,accountId))
+    #STS assume role call, served from the container's credential cache
+    return credential_cache.assumeRole(accountId)
 
 def lambda_handler(event, context):
-    logger.info(sanitize_json(event))
+    logger.info('%s',lazy(sanitize_json,event))
+    if 'SweepAccountId' in event:
+        logger.info("Full region sweep done for Account %s",lazy(sanitize_string,event['SweepAccountId']))
+        try:
+            markFullSweep(event['SweepAccountId'])
+        except ClientError as e:
+            e = sanitize_string(e)
+            logger.error("Unexpected client error %s" % e)
+            raise AWSTrustedAdvisorExplorerGenericException(e)
+        return
     if os.environ[("CustomerKeys")].strip() !='':
         try:
             file_Header=['Date','DateTime','AccountId','AccountName','AccountEmail',
@@ -131,18 +169,23 @@ def lambda_handler(event, context):
             customerKeys=[tag.strip() for tag in os.environ[("CustomerKeys")].strip().split(",")]
             logger.info("Tags: "+str(customerKeys))
             file_Header.extend(customerKeys)            
-            tagInfo=getTagInfo(str(event['AccountId']),event['Region'],event['ResourceType'],customerKeys,event['Date'],event['DateTime'],event['AccountName'],event['AccountEmail'])        
-            if len(tagInfo.keys()) > 0:
-                #Resource File Name
-                resourceFilename=(str(event['ResourceType'])+"_"+str(event['AccountId'])+"_"+event['Region']+"_"+str(event['Date'])+"_"+str(datetime.utcnow().strftime("%H-%M-%S"))+'.csv')
-                #Write the Values into a csv file
-                write2csv(tagInfo,resourceFilename,file_Header)
-                #Construct S3 Path
-                resourceFilePath='Tags/'+str(event['ResourceType'])+'/'+str(date.today().year)+'/'+str(date.today().month)+'/'+str(date.today().day)+'/'
-                #Copy file to S3
-                writeToS3(resourceFilename,resourceFilePath)
-                logger.info("Clean /tmp/")
-                call('rm -rf /tmp/*', shell=True)      
+            #Region harvest events carry every ResourceType of the region
+            resourceTypes=event.get('ResourceTypes',[event.get('ResourceType')])
+            with phase_metrics.context(AccountId=event['AccountId'],Region=event['Region']):
+                tagInfo=getTagInfo(str(event['AccountId']),event['Region'],resourceTypes,customerKeys,event['Date'],event['DateTime'],event['AccountName'],event['AccountEmail'])        
+                for resourceType in resourceTypes:
+                    if len(tagInfo[resourceType].keys()) > 0:
+                        #Resource File Name
+                        resourceFilename=(str(resourceType)+"_"+str(event['AccountId'])+"_"+event['Region']+"_"+str(event['Date'])+"_"+str(datetime.utcnow().strftime("%H-%M-%S"))+'.csv')
+                        #Construct S3 Path
+                        resourceFilePath=getS3Path(resourceType,event['AccountId'])
+                        #Stream the Values to S3 as a csv file
+                        write2csv(tagInfo[resourceType],resourceFilename,file_Header,resourceFilePath)
+                        if glue_catalog.isRegistration():
+                            glue_catalog.registerPartitions('tags',file_Header,
+                                's3://'+os.environ['S3BucketName']+'/Tags/',[resourceFilePath],False)
+            if int(os.environ.get('RegionSweepIntervalInDays','0')) > 0:
+                updateRegionIndex(event['AccountId'],event['Region'],tagInfo)
         except ClientError as e:
             e = sanitize_string(e)
             logger.error("Unexpected client error %s" % e)
@@ -28,16 +28,22 @@ This function creates the input parameters needed to execute the step function
 state machine: MapOrganizations and TagMapOrganizations. The input is either 
 from organizations or a user defined csv. The step functions Map contruct is 
 used to create parallel branches - one per account. 
+Accounts are passed either as batches bounded by the serialized input size 
+({"Accounts": [...]}) or, with AccountInputMode=Manifest, as a reference to 
+an account list in S3 that is read by a distributed Map.
 """
-import json,re,boto3,os,csv,logging,datetime
+import json,re,os,csv,codecs,gzip,logging,datetime
+from concurrent.futures import ThreadPoolExecutor
 from botocore.exceptions import ClientError
 import urllib.request as request
+import client_factory,glue_catalog,phase_metrics
+from pii_masking import logRows,sanitize_json,sanitize_string
 
 class AWSTrustedAdvisorExplorerGenericException(Exception): pass
 
-orgs = boto3.client('organizations',region_name='us-east-1')
-sfn = boto3.client('stepfunctions')
-s3 = boto3.client('s3')
+orgs = client_factory.getClient('organizations','us-east-1')
+sfn = client_factory.getClient('stepfunctions')
+s3 = client_factory.getClient('s3')
 
 logger = logging.getLogger()
 if "LOG_LEVEL" in os.environ:
@@ -75,30 +81,14 @@ def send_anonymous_metric():
         logger.error('Error occurred while sending metric: {}'.format(json.dumps(response_body)))
         logger.error('Error: {}'.format(e))     
 
-def sanitize_string(x):
-    y = str(x)
-    if os.environ['MASK_PII'].lower() == 'true':
-        pattern=re.compile('\d{12}')
-        y = re.sub(pattern,lambda match: ((match.group()[1])+'XXXXXXX'+(match.group()[-4:])), y)
-    return y
-
-def sanitize_json(x):
-    d = x.copy()
-    if os.environ['MASK_PII'].lower() == 'true':
-        for k, v in d.items():
-            if 'AccountId' in k:
-                d[k] = sanitize_string(v)
-            if 'AccountName' in k:
-                d[k] = v[:3]+'-MASKED-'+v[-3:]
-            if 'AccountEmail' in k:
-                d[k] = v[:3]+'-MASKED-'+v[-3:]
-    return d
-
 def execute_state_machine(sfn_arn, resource_parameters):
     logger.info("Executing State Machine :"+sanitize_string(sfn_arn))
-    response = sfn.start_execution(
-        stateMachineArn=sfn_arn,
-        input=resource_parameters)
+    with phase_metrics.phase('StartExecution') as phase:
+        response = sfn.start_execution(
+            stateMachineArn=sfn_arn,
+            input=resource_parameters)
+        phase.add('Retries', phase_metrics.retries(response))
+        phase.add('Bytes', len(resource_parameters))
     return response
 
 def list_accounts_from_organizations():
@@ -117,58 +107,113 @@ def list_accounts_from_organizations():
                                              "AccountEmail": x['Email'],
                                              "Date": todaysDate,
                                              "DateTime": todaysDateTime})
-                logger.info(sanitize_json({"AccountId": x['Id'], 
-                                             "AccountName": x['Name'], 
-                                             "AccountEmail": x['Email'],
-                                             "Date": todaysDate,
-                                             "DateTime": todaysDateTime}))
+    logRows(logger, "Accounts", accounts["accounts"], mask=sanitize_json)
     return accounts
 
+accountIdPattern = re.compile(r'^\d{12}$')
+
+#Stream the account file from S3 (optionally gzip compressed) and parse,
+#validate & deduplicate it in a single pass without a local copy
 def list_accounts_from_file():
     logger.info("Extracting Accounts via File Input:" + os.environ['BUCKET_NAME'] +','+os.environ['OBJECT_NAME'])
     accounts = {}
     accounts["accounts"] = []
-    file_name = '/tmp/accounts.csv' 
-    s3.download_file(os.environ['BUCKET_NAME'], os.environ['OBJECT_NAME'], 
-        file_name)    
-    with open(file_name) as csvfile:
-        readCSV = csv.reader(csvfile, delimiter=',')
-        x = 0
-        # keep track of the positions, since this is a user defined file
-        accountIdPos = 0
-        accountNamePos = 0
-        accountEmailPos = 0
-        todaysDate = datetime.datetime.utcnow().strftime("%m-%d-%Y")
-        todaysDateTime = datetime.datetime.utcnow().strftime('%Y-%m-%d %T')
-        for row in readCSV:
-            if len(row) == 3:
-                # read in the headers
-                if x == 0:
-                    for y in range(len(row)):
-                        if row[y].lower() == 'accountid':
-                            accountIdPos = y
-                        if row[y].lower() == 'accountname':
-                            accountNamePos = y
-                        if row[y].lower() == 'accountemail':
-                            accountEmailPos = y
-                else:
-                    accounts["accounts"].append({"AccountId": row[accountIdPos].strip(), 
-                                     "AccountName": row[accountNamePos].strip(), 
-                                     "AccountEmail": row[accountEmailPos].strip(),
-                                     "Date": todaysDate,
-                                     "DateTime": todaysDateTime})
-                    logger.info(sanitize_json({"AccountId": row[accountIdPos].strip(), 
-                                     "AccountName": row[accountNamePos].strip(), 
-                                     "AccountEmail": row[accountEmailPos].strip(),
-                                     "Date": todaysDate,
-                                     "DateTime": todaysDateTime}))
-            else:
-                logger.error("Input needs to have 3 fields: AccountId," +
-                    "AccountName and AccountEmail")
-                raise Exception("Insufficient fields in input file")
-            x = x + 1
+    response = s3.get_object(Bucket=os.environ['BUCKET_NAME'],
+        Key=os.environ['OBJECT_NAME'])
+    body = response['Body']
+    if os.environ['OBJECT_NAME'].lower().endswith('.gz') or \
+            response.get('ContentEncoding', '').lower() == 'gzip':
+        body = gzip.GzipFile(fileobj=body)
+    readCSV = csv.reader(codecs.getreader('utf-8-sig')(body), delimiter=',')
+    # keep track of the positions, since this is a user defined file
+    header = next(readCSV, [])
+    positions = {}
+    for y in range(len(header)):
+        positions[header[y].strip().lower()] = y
+    if not all(x in positions for x in ('accountid', 'accountname', 'accountemail')):
+        logger.error("Input needs to have 3 fields: AccountId," +
+            "AccountName and AccountEmail")
+        raise Exception("Insufficient fields in input file")
+    accountIdPos = positions['accountid']
+    accountNamePos = positions['accountname']
+    accountEmailPos = positions['accountemail']
+    minFields = max(accountIdPos, accountNamePos, accountEmailPos) + 1
+    todaysDate = datetime.datetime.utcnow().strftime("%m-%d-%Y")
+    todaysDateTime = datetime.datetime.utcnow().strftime('%Y-%m-%d %T')
+    seen = set()
+    skipped = 0
+    duplicates = 0
+    for row in readCSV:
+        if len(row) == 0 or (len(row) == 1 and row[0].strip() == ''):
+            continue
+        if len(row) < minFields or \
+                not accountIdPattern.match(row[accountIdPos].strip()):
+            logger.error("Skipping invalid account row " + str(readCSV.line_num))
+            skipped = skipped + 1
+            continue
+        accountId = row[accountIdPos].strip()
+        if accountId in seen:
+            duplicates = duplicates + 1
+            continue
+        seen.add(accountId)
+        account = {"AccountId": accountId, 
+                   "AccountName": row[accountNamePos].strip(), 
+                   "AccountEmail": row[accountEmailPos].strip(),
+                   "Date": todaysDate,
+                   "DateTime": todaysDateTime}
+        accounts["accounts"].append(account)
+    logRows(logger, "Accounts", accounts["accounts"], mask=sanitize_json)
+    logger.info("Read " + str(len(accounts["accounts"])) + " Accounts; skipped " +
+        str(skipped) + " invalid and " + str(duplicates) + " duplicate rows")
     return accounts 
 
+#Batch accounts by the serialized size of the state machine input, so long
+#account names or emails can not push a batch over the input limit. The
+#MapOrganizations iterations output {} and the Map discards its result, so
+#the batch size does not depend on the output of the extraction.
+def batch_accounts(accounts, maxBatchBytes):
+    batches = []
+    batch = []
+    batchBytes = len(json.dumps({"Accounts": []}))
+    for account in accounts:
+        accountBytes = len(json.dumps(account)) + 2
+        if len(batch) > 0 and batchBytes + accountBytes > maxBatchBytes:
+            batches.append(batch)
+            batch = []
+            batchBytes = len(json.dumps({"Accounts": []}))
+        batch.append(account)
+        batchBytes += accountBytes
+    if len(batch) > 0:
+        batches.append(batch)
+    return batches
+
+#Write the full account list to S3; the state machines read it with a
+#distributed Map, so one execution covers any number of accounts
+def write_accounts_manifest(accounts):
+    now = datetime.datetime.utcnow()
+    key = ('AccountManifests/' + now.strftime('%Y-%m-%d') + '/accounts_' +
+        now.strftime('%H-%M-%S') + '.json')
+    s3.put_object(Bucket=os.environ['S3BucketName'], Key=key,
+        Body=json.dumps(accounts).encode('utf-8'),
+        ACL='bucket-owner-full-control')
+    logger.info("Wrote " + str(len(accounts)) + " Accounts to manifest " + key)
+    return {"Manifest": {"Bucket": os.environ['S3BucketName'], "Key": key}}
+
+#Record the Date of this run under Runs/latest.json; the compaction & rollup
+#Lambdas started on a schedule process the data of the latest run
+def write_run_marker():
+    now = datetime.datetime.utcnow()
+    s3.put_object(Bucket=os.environ['S3BucketName'], Key='Runs/latest.json',
+        Body=json.dumps({"Date": now.strftime('%Y-%m-%d'),
+            "DateTime": now.strftime('%Y-%m-%d %T')}).encode('utf-8'),
+        ACL='bucket-owner-full-control')
+
+def start_execution(name, sfn_arn, resource_parameters):
+    execution_ret = execute_state_machine(sfn_arn, json.dumps(resource_parameters))
+    return {
+        'statusCode': execution_ret['ResponseMetadata']['HTTPStatusCode'],
+        'body': json.dumps({name: execution_ret['executionArn']})}
+
 def lambda_handler(event, context):
     logger.info(json.dumps(event))
     accounts = {}
@@ -178,33 +223,31 @@ def lambda_handler(event, context):
         else:
             accounts = list_accounts_from_organizations()            
         resource_parameters = accounts['accounts']     
-        logger.info("Batching Accounts by 50 to overcome step-function Input limitation of max  32,768 characters")
-        n = 50  
-        accountsBatch = [resource_parameters[i * n:(i + 1) * n] for i in range((len(resource_parameters) + n - 1) // n )]        
-        response=[]        
-        for batch in accountsBatch:
-            TA_data_extract_sfn_execution_ret = \
-                execute_state_machine(os.environ['EXTRACT_TA_DATA_SFN_ARN'],  
-                    json.dumps(batch))
-            response.append({
-                'statusCode': 
-                    TA_data_extract_sfn_execution_ret['ResponseMetadata']
-                    ['HTTPStatusCode'],
-                'body': json.dumps({"TA_data_extract_sfn_execution_ret": 
-                    TA_data_extract_sfn_execution_ret['executionArn']})
-                    })
-            
+        write_run_marker()
+        if glue_catalog.isRegistration():
+            #The run's partitions, and the next day's for a run going past midnight
+            today = datetime.datetime.utcnow().date()
+            glue_catalog.registerRunPartitions([today, today + datetime.timedelta(days=1)])
+        if os.environ.get('AccountInputMode', 'Batch').lower() == 'manifest':
+            inputs = [write_accounts_manifest(resource_parameters)]
+        else:
+            maxBatchBytes = int(os.environ.get('MaxBatchInputBytes', '32768'))
+            logger.info("Batching Accounts by " + str(maxBatchBytes) +
+                " bytes to overcome the step-function input size limitation")
+            inputs = [{"Accounts": batch} for batch in
+                batch_accounts(resource_parameters, maxBatchBytes)]
+        executions = []
+        for resource_input in inputs:
+            executions.append(("TA_data_extract_sfn_execution_ret",
+                os.environ['EXTRACT_TA_DATA_SFN_ARN'], resource_input))
             if os.environ[("Tags")].strip() != '':
-                tag_data_extract_sfn_execution_ret = \
-                    execute_state_machine(os.environ['TAG_DATA_EXTRACT_SFN_ARN'], \
-                        json.dumps(batch))
-            
-                response.append({
-                    'statusCode': 
-                        tag_data_extract_sfn_execution_ret['ResponseMetadata']
-                        ['HTTPStatusCode'],
-                    'body': json.dumps({"tag_data_extract_sfn_execution_ret": 
-                        tag_data_extract_sfn_execution_ret['executionArn']})})
+                executions.append(("tag_data_extract_sfn_execution_ret",
+                    os.environ['TAG_DATA_EXTRACT_SFN_ARN'], resource_input))
+        logger.info("Starting " + str(len(executions)) + " state machine executions")
+        #Executions are started concurrently; results keep the input order
+        with ThreadPoolExecutor(max_workers=int(os.environ.get(
+                'StartExecutionWorkers', '8'))) as executor:
+            response = list(executor.map(lambda x: start_execution(*x), executions))
         if os.environ['AnonymousUsage'].lower() == "yes":
             send_anonymous_metric()        
         return response
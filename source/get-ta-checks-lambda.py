@@ -11,13 +11,16 @@
 #  and limitations under the License.                                                                                #
 ######################################################################################################################
 
-import json,boto3,os,logging,re
+import json,os,logging,time
 from botocore.exceptions import ClientError
+import client_factory,phase_metrics
+from pii_masking import lazy,sanitize_json,sanitize_string
 
 class AWSTrustedAdvisorExplorerGenericException(Exception): pass
 
-sfn = boto3.client('stepfunctions')
-supportClient = boto3.client('support',region_name="us-east-1")
+sfn = client_factory.getClient('stepfunctions')
+supportClient = client_factory.getClient('support',"us-east-1")
+s3 = client_factory.getClient('s3')
 
 logger = logging.getLogger()
 if "LOG_LEVEL" in os.environ:
@@ -26,58 +29,83 @@ if "LOG_LEVEL" in os.environ:
         raise ValueError('Invalid log level: %s' % loglevel)
     logger.setLevel(level=numeric_level)
     
-def sanitize_json(x):
-    d = x.copy()
-    if os.environ['MASK_PII'].lower() == 'true':
-        for k, v in d.items():
-            if 'AccountId' in k:
-                d[k] = sanitize_string(v)
-            if 'AccountName' in k:
-                d[k] = v[:3]+'-MASKED-'+v[-3:]
-            if 'AccountEmail' in k:
-                d[k] = v[:3]+'-MASKED-'+v[-3:]
-    return d
-    
-def sanitize_string(x):
-    y = str(x)
-    if os.environ['MASK_PII'].lower() == 'true':
-        pattern=re.compile('\d{12}')
-        y = re.sub(pattern,lambda match: ((match.group()[1])+'XXXXXXX'+(match.group()[-4:])), y)
-    return y                                       
-
 def execute_state_machine(sfn_arn, resource_parameters):
     logger.info("Executing State Machine :"+sanitize_string(sfn_arn))
-    response = sfn.start_execution(
-        stateMachineArn=sfn_arn,
-        input=resource_parameters
-    )
+    with phase_metrics.phase('StartExecution') as phase:
+        response = sfn.start_execution(
+            stateMachineArn=sfn_arn,
+            input=resource_parameters
+        )
+        phase.add('Retries', phase_metrics.retries(response))
+        phase.add('Bytes', len(resource_parameters))
     return response
         
-def get_trusted_advisor_checks(language, accountId, accountName, 
-                                    accountEmail, date, dateTime):
+#Check catalog: all the checks of describe_trusted_advisor_checks, cached per
+#container and in S3 under CheckCatalog/All/<language>.json for
+#CheckCatalogTtlInSec. The configured categories & supported check IDs are
+#applied on read, so a stack update changing them takes effect immediately.
+catalogCache = {}
+
+def get_check_catalog_key(language):
+    return 'CheckCatalog/All/'+language+'.json'
+
+def load_check_catalog(language):
+    try:
+        response = s3.get_object(Bucket=os.environ['S3BucketName'],
+            Key=get_check_catalog_key(language))
+        catalog = json.loads(response['Body'].read())
+        if catalog['ExpiresAt'] > time.time():
+            return catalog
+    except ClientError as e:
+        if e.response['Error']['Code'] not in ('NoSuchKey','404'):
+            raise
+    return None
+
+def build_check_catalog(language):
     logger.info("Extracting Trusted Advisor Check Details")
     response = supportClient.describe_trusted_advisor_checks(language=language)
+    checks = [{"CheckId": x['id'], "CheckName": x['name'], "Category": x['category']}
+        for x in response['checks']]
+    catalog = {"ExpiresAt": time.time()+int(os.environ.get('CheckCatalogTtlInSec','86400')),
+               "Checks": checks}
+    s3.put_object(Bucket=os.environ['S3BucketName'],Key=get_check_catalog_key(language),
+        Body=json.dumps(catalog).encode('utf-8'),ACL='bucket-owner-full-control')
+    return catalog
+
+def get_check_catalog(language):
+    catalog = catalogCache.get(language)
+    if catalog == None or catalog['ExpiresAt'] <= time.time():
+        catalog = load_check_catalog(language)
+        if catalog == None:
+            catalog = build_check_catalog(language)
+        else:
+            logger.info("Using the Trusted Advisor Check catalog cached in S3")
+        catalogCache[language] = catalog
+    categories = frozenset(category.strip() for category in
+        os.environ[("Category")].split(","))
+    supportedChecks = frozenset(checkId.strip() for checkId in
+        os.environ['SupportedChecks'].split(","))
+    logger.info("Appending CheckIds for:"+ os.environ[("Category")])
+    return [x for x in catalog['Checks']
+        if x['Category'] in categories and x['CheckId'] in supportedChecks]
+        
+def get_trusted_advisor_checks(language, accountId, accountName, 
+                                    accountEmail, date, dateTime):
     TA_checks = {}
     TA_checks["checks"] = []
-    
-    logger.info("Appending CheckIds for:"+ os.environ[("Category")])
-    for x in response['checks']:                                                                   
-        for category in list(os.environ[("Category")].split(",")):
-            if x['category'] == category and x['id'] in os.environ['SupportedChecks']:
-                TA_checks["checks"].append({"CheckId": x['id'], 
-                                            "CheckName": x['name'],
-                                            "Category":x['category'],
-                                            "Language": language, 
-                                            "AccountId": accountId, 
-                                            "AccountName": accountName, 
-                                            "AccountEmail": accountEmail,
-                                            "Date": date,
-                                            "DateTime": dateTime})
+    accountInfo = {"Language": language, 
+                   "AccountId": accountId, 
+                   "AccountName": accountName, 
+                   "AccountEmail": accountEmail,
+                   "Date": date,
+                   "DateTime": dateTime}
+    for check in get_check_catalog(language):
+        TA_checks["checks"].append(dict(check, **accountInfo))
     return TA_checks
     
 def lambda_handler(event, context):
     try:
-        logger.info(sanitize_json(event))                    
+        logger.info('%s', lazy(sanitize_json, event))                    
         TA_checks = get_trusted_advisor_checks(os.environ['LANGUAGE'], 
                                                 event['AccountId'], 
                                                 event['AccountName'], 
@@ -86,9 +114,20 @@ def lambda_handler(event, context):
                                                 event['DateTime'])
         logger.info("Got " + str(len(TA_checks['checks'])) + " TA Checks")        
         resource_parameters = TA_checks['checks']
-        sfn_execution_ret = execute_state_machine(os.environ['EXTRACT_TA_DATA_PER_CHECK_SFN_ARN'], 
-                                json.dumps(resource_parameters))        
+        if os.environ.get('ExtractionMode','Check').lower() == 'account':
+            logger.info("ExtractionMode is Account; passing the checks to the per-account extractor")
+            return {"ExtractionMode": "Account",
+                    "AccountId": event['AccountId'],
+                    "AccountName": event['AccountName'],
+                    "AccountEmail": event['AccountEmail'],
+                    "Date": event['Date'],
+                    "DateTime": event['DateTime'],
+                    "Checks": resource_parameters}
+        with phase_metrics.context(AccountId=event['AccountId']):
+            sfn_execution_ret = execute_state_machine(os.environ['EXTRACT_TA_DATA_PER_CHECK_SFN_ARN'], 
+                                    json.dumps(resource_parameters))        
         return {
+            'ExtractionMode': 'Check',
             'statusCode': sfn_execution_ret['ResponseMetadata']['HTTPStatusCode'],
             'body': json.dumps({"sfn_execution_arn": sfn_execution_ret['executionArn']})
         }        
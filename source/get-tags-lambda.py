@@ -11,12 +11,15 @@
 #  and limitations under the License.                                                                                #
 ######################################################################################################################
 
-import json,boto3,os,logging,re
+import json,os,logging,time
+from datetime import datetime,timezone
 from botocore.exceptions import ClientError
+import client_factory,phase_metrics
+from pii_masking import lazy,logRows,sanitize_json,sanitize_string
 
 class AWSTrustedAdvisorExplorerGenericException(Exception): pass
 
-sfn = boto3.client('stepfunctions')
+sfn = client_factory.getClient('stepfunctions')
 
 #Logger block
 logger = logging.getLogger()
@@ -26,75 +29,119 @@ if "LOG_LEVEL" in os.environ:
         raise ValueError('Invalid log level %s' % loglevel)
     logger.setLevel(level=numeric_level)
 
-def sanitize_string(x):
-    y = str(x)
-    if os.environ['MASK_PII'].lower() == 'true':
-        pattern=re.compile('\d{12}')
-        y = re.sub(pattern,lambda match: ((match.group()[1])+'XXXXXXX'+(match.group()[-4:])), y)
-    return y
-
-def sanitize_json(x):
-    d = x.copy()
-    if os.environ['MASK_PII'].lower() == 'true':
-        for k, v in d.items():
-            if 'AccountId' in k:
-                d[k] = sanitize_string(v)
-            if 'AccountName' in k:
-                d[k] = v[:3]+'-MASKED-'+v[-3:]
-            if 'AccountEmail' in k:
-                d[k] = v[:3]+'-MASKED-'+v[-3:]
-    return d
-
 def execute_state_machine(sfn_arn, resource_parameters):
     logger.info("Executing State Machine :"+sanitize_string(sfn_arn))
-    response = sfn.start_execution(
-        stateMachineArn=sfn_arn,
-        input=resource_parameters
-    )
+    with phase_metrics.phase('StartExecution') as phase:
+        response = sfn.start_execution(
+            stateMachineArn=sfn_arn,
+            input=resource_parameters
+        )
+        phase.add('Retries', phase_metrics.retries(response))
+        phase.add('Bytes', len(resource_parameters))
     return response
 
+#describe_regions is cached for the life of the container
+regionsCache={'Regions':None,'ExpiresAt':0}
+
 def describe_regions():
+    if regionsCache['Regions'] != None and time.time() < regionsCache['ExpiresAt']:
+        logger.info("Using " + str(len(regionsCache['Regions'])) + " cached AWS Regions")
+        return regionsCache['Regions']
     logger.info("Getting a list of AWS Regions")
-    ec2 = boto3.client('ec2',region_name='us-east-1')
+    ec2 = client_factory.getClient('ec2','us-east-1')
     response = ec2.describe_regions()
     regions=[]
     for region in response['Regions']:
         regions.append(region['RegionName'])
     logger.info("Got " + str(len(regions)) + " AWS Regions")
+    regionsCache['Regions']=regions
+    regionsCache['ExpiresAt']=time.time()+int(os.environ.get('RegionCacheTtlInSec','86400'))
     return regions
+
+#Region activity index: RegionIndex/<AccountId>/<Region>/<ResourceType> exists
+#when the last tag extraction found tagged resources of that type, and
+#RegionIndex/<AccountId>/_sweep marks the last run over all regions; it is
+#written by the tag state machine once all the regions were extracted
+def getRegionIndex(accountId):
+    s3 = client_factory.getClient('s3')
+    prefix='RegionIndex/'+str(accountId)+'/'
+    sweptAt=None
+    activeRegions={}
+    paginator = s3.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=os.environ['S3BucketName'],Prefix=prefix):
+        for obj in page.get('Contents',[]):
+            key=obj['Key'][len(prefix):]
+            if key == '_sweep':
+                sweptAt=obj['LastModified']
+            elif '/' in key:
+                region,resourceType=key.split('/',1)
+                activeRegions.setdefault(region,set()).add(resourceType)
+    return sweptAt,activeRegions
+
+#Return {Region: set(ResourceTypes)} to fan out to, or None for a full sweep
+def getActiveRegions(accountId):
+    sweepIntervalInDays=int(os.environ.get('RegionSweepIntervalInDays','0'))
+    if sweepIntervalInDays == 0:
+        return None
+    sweptAt,activeRegions=getRegionIndex(accountId)
+    if sweptAt == None or (datetime.now(timezone.utc)-sweptAt).days >= sweepIntervalInDays:
+        logger.info("Full region sweep for Account "+sanitize_string(accountId))
+        return None
+    logger.info("Region index for Account "+sanitize_string(accountId)+
+        " has "+str(len(activeRegions))+" active Regions")
+    return activeRegions
         
-def get_Mappings(accountId, accountName,accountEmail,date,dateTime,regions):
+def get_Mappings(accountId, accountName,accountEmail,date,dateTime,regions,activeRegions=None):
     logger.info("Generate an Input list of JSON objects that will be passed to the StateMachine")
     resourceTypes = list(os.environ[("ResourceTypes")].split(","))
     finalMap={}
     finalMap['resources'] = []    
-    for resourceType in resourceTypes:
+    if activeRegions != None:
+        regions=[region for region in regions if region in activeRegions]
+    #Region harvest: one item per region covering all of the resource types
+    if os.environ.get('TagHarvestMode','Region').lower() == 'region':
         for region in regions:
-            finalMap['resources'].append({"ResourceType": resourceType, 
+            finalMap['resources'].append({"ResourceTypes": resourceTypes, 
                                         "Region": region, 
                                         "AccountId": accountId, 
                                         "AccountName": accountName, 
                                         "AccountEmail": accountEmail,
                                         "Date": date,
                                         "DateTime": dateTime})
-            logger.info(sanitize_json({"ResourceType": resourceType, 
+        logger.info("Generated "+str(len(regions))+" region harvest items for Account "+
+                                        sanitize_string(accountId))
+        return finalMap
+    for resourceType in resourceTypes:
+        for region in regions:
+            if activeRegions != None and resourceType not in activeRegions[region]:
+                continue
+            finalMap['resources'].append({"ResourceType": resourceType, 
                                         "Region": region, 
                                         "AccountId": accountId, 
                                         "AccountName": accountName, 
                                         "AccountEmail": accountEmail,
                                         "Date": date,
-                                        "DateTime": dateTime}))
+                                        "DateTime": dateTime})
+    logRows(logger, "Resource harvest items", finalMap['resources'], mask=sanitize_json)
     return finalMap
 
 def lambda_handler(event, context):
     try:
-        logger.info(sanitize_json(event))
+        logger.info('%s', lazy(sanitize_json, event))
         regions = describe_regions()
+        activeRegions = getActiveRegions(event['AccountId'])
         finalMap = get_Mappings(event['AccountId'],event['AccountName'],event['AccountEmail'],
-                                    event['Date'],event['DateTime'],regions) 
+                                    event['Date'],event['DateTime'],regions,activeRegions) 
         resource_parameters = finalMap['resources']      
-        sfn_execution_ret = execute_state_machine(os.environ['TAG_DATA_EXTRACT_SFN_ARN'], 
-                                json.dumps(resource_parameters))
+        if len(resource_parameters) == 0:
+            logger.info("No active Regions for Account "+sanitize_string(event['AccountId']))
+            return {'statusCode': 200, 'body': ''}
+        sfn_input = {"Resources": resource_parameters}
+        if activeRegions == None and int(os.environ.get('RegionSweepIntervalInDays','0')) > 0:
+            sfn_input["SweepAccountId"] = event['AccountId']
+        with phase_metrics.context(AccountId=event['AccountId']):
+            sfn_execution_ret = execute_state_machine(os.environ['TAG_DATA_EXTRACT_SFN_ARN'], 
+                                    json.dumps(sfn_input))
         return {
             'statusCode': 
                 sfn_execution_ret['ResponseMetadata']['HTTPStatusCode'],
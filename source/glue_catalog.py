@@ -0,0 +1,290 @@
+######################################################################################################################
+#  Copyright 2019 Amazon.com, Inc. or its affiliates. All Rights Reserved.                                           #
+#                                                                                                                    #
+#  Licensed under the Apache License Version 2.0 (the "License"). You may not use this file except in compliance     #
+#  with the License. A copy of the License is located at                                                             #
+#                                                                                                                    #
+#      http://www.apache.org/licenses/                                                                               #
+#                                                                                                                    #
+#  or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES #
+#  OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific language governing permissions    #
+#  and limitations under the License.                                                                                #
+######################################################################################################################
+
+"""
+glue_catalog
+Shared by create-athena-views-lambda and the extract Lambdas when
+PartitionLayout is Hive.
+
+Defines the Glue tables of the Hive layout from the Header_* columns. With
+PartitionDiscovery=Projection Athena projects the partitions; with
+PartitionDiscovery=Registration the accounts Lambda registers the day x shard
+partitions of every table once per run (registerRunPartitions), in
+batch_create_partition calls of 100 partitions. The extractors only redefine
+a table when its header no longer matches the Glue columns, and register the
+day's partitions of a table they had to create, so no crawler is needed.
+"""
+import datetime,logging,math,os,re,threading,time
+from decimal import Decimal,InvalidOperation
+import client_factory
+
+logger = logging.getLogger()
+
+#Column types of the typed tables (Parquet or NormalizeValues), derived from
+#the Header_* column names unless the check has a Types_<checkId> map
+columnTypeRules=[
+    (re.compile('^date$'),'date'),
+    (re.compile('^datetime$|date$'),'timestamp'),
+    (re.compile('^resources|count$|number of|size$|age$|gb$|days$|^days|years$'),'bigint'),
+    (re.compile('percent|utilization|i/o|months$'),'double'),
+    (re.compile('cost|savings'),'decimal')]
+athenaTypes={'decimal':'decimal(18,2)'}
+
+def getColumnType(column):
+    for pattern,columnType in columnTypeRules:
+        if pattern.search(column.lower()):
+            return columnType
+    return 'string'
+
+#Numbers of typed columns. int, float & Decimal values are kept; strings are
+#parsed as a whole first ("5e-05", "1.2E+3") and otherwise searched for a
+#number after an optional sign & currency symbol, without thousands
+#separators ("-$1,234.50", "12 %")
+numberPattern=re.compile(r'(-)?\s*[$\u20ac\u00a3\u00a5]?\s*((?:\d[\d,]*)?\.?\d+(?:[eE][-+]?\d+)?)')
+
+def parseNumber(value):
+    if isinstance(value,bool) or value is None:
+        return None
+    if isinstance(value,(int,Decimal)):
+        return value if not isinstance(value,Decimal) or value.is_finite() else None
+    if isinstance(value,float):
+        return value if math.isfinite(value) else None
+    text=str(value).strip()
+    try:
+        number=Decimal(text)
+        return number if number.is_finite() else None
+    except InvalidOperation:
+        pass
+    match=numberPattern.search(text)
+    if match == None:
+        return None
+    try:
+        number=Decimal(match.group(2).replace(',',''))
+    except InvalidOperation:
+        return None
+    return -number if match.group(1) else number
+
+#Types_<checkId> lists one type (string, date, timestamp, bigint, double or
+#decimal) per Header_<checkId> column; header is the full file header
+def getColumnTypes(checkId,header):
+    types=os.environ.get('Types_'+checkId,'').split(',')
+    if len(types)+6 != len(header):
+        return [getColumnType(x) for x in header]
+    return ['date','timestamp','string']+types+['string','string','string']
+
+#TagEnrichment: the Details tables of checks with a resource column also hold
+#the EnrichmentTags columns, filled in by enrich-ta-data-lambda.py
+#Check Id: Details column matched with the ResourceId of the tag files
+tagJoinColumns={'Qch7DwouX1':'instance id','DAvU99Dc4C':'volume id',
+    'hjLMh88uM8':'load balancer name','Ti39halfu8':'db instance name',
+    'G31sQ1E9U':'cluster','51fC20e7I2':'hosted zone name'}
+
+def getTagColumns(checkId,header):
+    tags=[x.strip() for x in os.environ.get('EnrichmentTags','').split(',') if x.strip() != '']
+    if checkId not in tagJoinColumns:
+        return []
+    columns=set(x.lower() for x in header)
+    return [('tag_'+x if x.lower() in columns else x) for x in tags]
+
+def getEnrichedHeader(checkId,header,columnTypes=None):
+    tagColumns=getTagColumns(checkId,header)
+    if columnTypes != None:
+        columnTypes=columnTypes+['string']*len(tagColumns)
+    return header+tagColumns,columnTypes
+
+#IncrementalMode: one row per run, account & check with Details rows, giving
+#the Date & DateTime of the run whose Details rows hold the check result and
+#the day directory of its Details file relative to the check table
+incrementalHeader=['Date','DateTime','CheckName','CheckId','DetailsDate',
+    'DetailsDateTime','DetailsPath','AccountId','AccountName','AccountEmail']
+incrementalTypes=['date','timestamp','string','string','date','timestamp',
+    'string','string','string','string']
+
+#NormalizeValues needs the typed tables of the Hive layout: the crawler defines
+#the Legacy CSV tables with string columns, which the typed views can not read
+def isNormalized():
+    return os.environ.get('OutputFormat','CSV').lower() == 'parquet' or \
+        (os.environ.get('NormalizeValues','false').lower() == 'true' and
+        os.environ.get('PartitionLayout','Legacy').lower() == 'hive')
+
+partitionKeys=[{'Name':'year','Type':'int'},{'Name':'month','Type':'int'},
+    {'Name':'day','Type':'int'},{'Name':'shard','Type':'int'}]
+partitionPattern=re.compile(r'year=(\d+)/month=(\d+)/day=(\d+)/shard=(\d+)/')
+
+def isProjection():
+    return os.environ.get('PartitionDiscovery','Projection').lower() == 'projection'
+
+class PartitionRegistrationError(Exception): pass
+
+def isRegistration():
+    return os.environ.get('PartitionLayout','Legacy').lower() == 'hive' and \
+        not isProjection()
+
+def getProjectionParameters():
+    shards=int(os.environ.get('PartitionShards','16'))
+    return {'projection.enabled':'true',
+        'projection.year.type':'integer','projection.year.range':'2020,2099',
+        'projection.month.type':'integer','projection.month.range':'1,12',
+        'projection.day.type':'integer','projection.day.range':'1,31',
+        'projection.shard.type':'integer','projection.shard.range':'0,'+str(shards-1)}
+
+#columnTypes types the columns of a CSV table; without it every CSV column is
+#a string read with OpenCSVSerde
+def getTableInput(tableName,header,location,parquet,columnTypes=None):
+    if parquet:
+        columnTypes=columnTypes or [getColumnType(x) for x in header]
+        columns=[{'Name':x.lower(),'Type':athenaTypes.get(y,y)} for x,y in zip(header,columnTypes)]
+        storageDescriptor={'Columns':columns,'Location':location,
+            'InputFormat':'org.apache.hadoop.hive.ql.io.parquet.MapredParquetInputFormat',
+            'OutputFormat':'org.apache.hadoop.hive.ql.io.parquet.MapredParquetOutputFormat',
+            'SerdeInfo':{'SerializationLibrary':
+                'org.apache.hadoop.hive.ql.io.parquet.serde.ParquetHiveSerDe'}}
+        parameters={'classification':'parquet'}
+    elif columnTypes:
+        #Normalized CSV escapes delimiters with a backslash instead of quoting
+        columns=[{'Name':x.lower(),'Type':athenaTypes.get(y,y)} for x,y in zip(header,columnTypes)]
+        storageDescriptor={'Columns':columns,'Location':location,
+            'InputFormat':'org.apache.hadoop.mapred.TextInputFormat',
+            'OutputFormat':'org.apache.hadoop.hive.ql.io.HiveIgnoreKeyTextOutputFormat',
+            'SerdeInfo':{'SerializationLibrary':'org.apache.hadoop.hive.serde2.lazy.LazySimpleSerDe',
+                'Parameters':{'field.delim':',','escape.delim':'\\'}}}
+        parameters={'classification':'csv','skip.header.line.count':'1'}
+    else:
+        columns=[{'Name':x.lower(),'Type':'string'} for x in header]
+        storageDescriptor={'Columns':columns,'Location':location,
+            'InputFormat':'org.apache.hadoop.mapred.TextInputFormat',
+            'OutputFormat':'org.apache.hadoop.hive.ql.io.HiveIgnoreKeyTextOutputFormat',
+            'SerdeInfo':{'SerializationLibrary':'org.apache.hadoop.hive.serde2.OpenCSVSerde',
+                'Parameters':{'separatorChar':',','quoteChar':'"'}}}
+        parameters={'classification':'csv','skip.header.line.count':'1'}
+    if isProjection():
+        parameters.update(getProjectionParameters())
+    return {'Name':tableName,'TableType':'EXTERNAL_TABLE','Parameters':parameters,
+        'PartitionKeys':partitionKeys,'StorageDescriptor':storageDescriptor}
+
+def createOrUpdateTable(athenaDb,tableInput):
+    logger.info('Variables passed to createOrUpdateTable(): ' + athenaDb+','+tableInput['Name'])
+    glueClient=client_factory.getClient('glue')
+    try:
+        glueClient.get_table(DatabaseName=athenaDb,Name=tableInput['Name'])
+        glueClient.update_table(DatabaseName=athenaDb,TableInput=tableInput)
+    except glueClient.exceptions.EntityNotFoundException:
+        glueClient.create_table(DatabaseName=athenaDb,TableInput=tableInput)
+    return
+
+#Tables checked & partitions registered by this container
+lock=threading.Lock()
+checkedTables={}
+registeredPartitions=set()
+
+#Make sure the table exists with the columns of header; the Glue table is
+#only rewritten when the header or the column types changed. Returns True
+#when the table was created.
+def ensureTable(tableName,header,location,parquet,columnTypes=None):
+    tableInput=getTableInput(tableName,header,location,parquet,columnTypes)
+    columns=[(x['Name'],x['Type']) for x in tableInput['StorageDescriptor']['Columns']]
+    with lock:
+        if checkedTables.get(tableName) == columns:
+            return False
+    created=False
+    athenaDb=os.environ['AthenaDb']
+    glueClient=client_factory.getClient('glue')
+    try:
+        table=glueClient.get_table(DatabaseName=athenaDb,Name=tableName)['Table']
+        current=[(x['Name'],x['Type']) for x in table['StorageDescriptor']['Columns']]
+        if current != columns:
+            logger.info("Header of table "+tableName+" changed; updating the table")
+            glueClient.update_table(DatabaseName=athenaDb,TableInput=tableInput)
+    except glueClient.exceptions.EntityNotFoundException:
+        logger.info("Creating table "+tableName)
+        glueClient.create_table(DatabaseName=athenaDb,TableInput=tableInput)
+        created=True
+    with lock:
+        checkedTables[tableName]=columns
+    return created
+
+#batch_create_partition errors retried with a backoff; other errors than
+#these and AlreadyExistsException fail the registration at once
+retryableErrors=frozenset(['ThrottlingException','InternalServiceException',
+    'ConcurrentModificationException','OperationTimeoutException'])
+partitionRetries=4
+
+#Create partitions in batch_create_partition calls of 100; a partition only
+#counts as registered once Glue created it or reported it as existing
+def createPartitions(tableName,partitions):
+    glueClient=client_factory.getClient('glue')
+    with lock:
+        partitions=[x for x in partitions
+            if (tableName,tuple(x['Values'])) not in registeredPartitions]
+    for i in range(0,len(partitions),100):
+        batch=partitions[i:i+100]
+        for attempt in range(partitionRetries+1):
+            response=glueClient.batch_create_partition(DatabaseName=os.environ['AthenaDb'],
+                TableName=tableName,PartitionInputList=batch)
+            errors={tuple(x['PartitionValues']):x['ErrorDetail'] for x in response.get('Errors',[])
+                if x['ErrorDetail']['ErrorCode'] != 'AlreadyExistsException'}
+            with lock:
+                registeredPartitions.update((tableName,tuple(x['Values'])) for x in batch
+                    if tuple(x['Values']) not in errors)
+            if len(errors) == 0:
+                break
+            values,error=next(iter(errors.items()))
+            if attempt == partitionRetries or any(x['ErrorCode'] not in retryableErrors
+                    for x in errors.values()):
+                raise PartitionRegistrationError("Unable to register "+str(len(errors))+
+                    " partitions of table "+tableName+", e.g. "+str(list(values))+": "+
+                    error['ErrorCode']+" "+error.get('ErrorMessage',''))
+            time.sleep(min(2**attempt,30))
+            batch=[x for x in batch if tuple(x['Values']) in errors]
+    if len(partitions) > 0:
+        logger.info("Registered "+str(len(partitions))+" partitions of table "+tableName)
+
+#Partitions of every shard of days under location
+def getDayPartitions(storageDescriptor,location,days):
+    partitions=[]
+    for day in days:
+        for shard in range(int(os.environ.get('PartitionShards','16'))):
+            values=[str(day.year),str(day.month),str(day.day),str(shard)]
+            partitions.append({'Values':values,'StorageDescriptor':dict(storageDescriptor,
+                Location=location+'year='+values[0]+'/month='+values[1]+'/day='+
+                values[2]+'/shard='+values[3]+'/')})
+    return partitions
+
+#Register the day x shard partitions of every registered-partition table of
+#AthenaDb; run once per run by the accounts Lambda
+def registerRunPartitions(days):
+    glueClient=client_factory.getClient('glue')
+    names=[x['Name'] for x in partitionKeys]
+    paginator=glueClient.get_paginator('get_tables')
+    for page in paginator.paginate(DatabaseName=os.environ['AthenaDb']):
+        for table in page['TableList']:
+            if [x['Name'] for x in table.get('PartitionKeys',[])] != names or \
+                    table.get('Parameters',{}).get('projection.enabled') == 'true':
+                continue
+            storageDescriptor=table['StorageDescriptor']
+            location=storageDescriptor['Location']
+            createPartitions(table['Name'],getDayPartitions(storageDescriptor,
+                location if location.endswith('/') else location+'/',days))
+
+#Make sure the table of the files written under s3Paths (relative to
+#S3BucketName) exists. The partitions of the run are registered by the
+#accounts Lambda; only a table created here gets the partitions of the days
+#of s3Paths registered, for every shard.
+def registerPartitions(tableName,header,tableLocation,s3Paths,parquet,columnTypes=None):
+    if not ensureTable(tableName,header,tableLocation,parquet,columnTypes):
+        return
+    storageDescriptor=getTableInput(tableName,header,tableLocation,
+        parquet,columnTypes)['StorageDescriptor']
+    days=sorted(set(datetime.date(*[int(x) for x in match.groups()[:3]])
+        for match in map(partitionPattern.search,s3Paths) if match != None))
+    createPartitions(tableName,getDayPartitions(storageDescriptor,tableLocation,days))
@@ -0,0 +1,137 @@
+######################################################################################################################
+#  Copyright 2019 Amazon.com, Inc. or its affiliates. All Rights Reserved.                                           #
+#                                                                                                                    #
+#  Licensed under the Apache License Version 2.0 (the "License"). You may not use this file except in compliance     #
+#  with the License. A copy of the License is located at                                                             #
+#                                                                                                                    #
+#      http://www.apache.org/licenses/                                                                               #
+#                                                                                                                    #
+#  or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES #
+#  OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific language governing permissions    #
+#  and limitations under the License.                                                                                #
+######################################################################################################################
+
+"""
+phase_metrics
+Shared by the Lambda functions that time their phases.
+
+With PhaseMetrics=true every phase (assume role, Trusted Advisor result, row
+building, CSV encoding, S3 upload, tag pagination, state machine start) writes
+one CloudWatch embedded metric format (EMF) line to stdout with its latency and
+counts (Rows, Bytes, Pages, Parts, Retries); CloudWatch Logs turns the lines
+into metrics in MetricsNamespace. CSV rows are encoded while they are
+uploaded, so WriteToS3 also reports UploadMs, the time spent in S3 calls.
+The metric dimensions are the phase and, where known, the ExtractionMode; the
+AccountId, CheckId and Region known to the phase are written as properties of
+the line, so they can be queried in CloudWatch Logs Insights without creating
+a metric per account and check. Values set with context() are inherited by
+the phases of the same thread. Account IDs are masked when MASK_PII is true.
+When disabled, phase() and context() return a shared no-op object.
+"""
+import json,os,sys,threading,time
+import pii_masking
+
+enabled = os.environ.get('PhaseMetrics', 'false').lower() == 'true'
+namespace = os.environ.get('MetricsNamespace', 'TrustedAdvisorExplorer')
+stream = sys.stdout
+
+lock = threading.Lock()
+local = threading.local()
+dimensionKeys = frozenset(['ExtractionMode'])
+units = {'LatencyMs': 'Milliseconds', 'UploadMs': 'Milliseconds', 'Bytes': 'Bytes'}
+
+#Retries made by botocore for a response
+def retries(response):
+    return response.get('ResponseMetadata', {}).get('RetryAttempts', 0)
+
+class NullPhase(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def add(self, name, value):
+        pass
+
+    def timer(self, name):
+        return self
+
+nullPhase = NullPhase()
+
+class Context(object):
+    def __init__(self, dimensions):
+        self.dimensions = dimensions
+
+    def __enter__(self):
+        self.previous = getattr(local, 'dimensions', {})
+        local.dimensions = dict(self.previous, **self.dimensions)
+        return self
+
+    def __exit__(self, *args):
+        local.dimensions = self.previous
+        return False
+
+class Phase(object):
+    def __init__(self, name, dimensions):
+        self.name = name
+        self.dimensions = dict(getattr(local, 'dimensions', {}), **dimensions)
+        self.values = {}
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, errorType, *args):
+        self.values['LatencyMs'] = round((time.perf_counter()-self.start)*1000, 3)
+        if errorType is not None:
+            self.values['Errors'] = 1
+        emit(self.name, self.dimensions, self.values)
+        return False
+
+    def add(self, name, value):
+        self.values[name] = self.values.get(name, 0)+value
+
+    #Add the milliseconds spent in a block to name
+    def timer(self, name):
+        return Timer(self, name)
+
+class Timer(object):
+    def __init__(self, phase, name):
+        self.phase = phase
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        self.phase.add(self.name, round((time.perf_counter()-self.start)*1000, 3))
+        return False
+
+def emit(phase, dimensions, values):
+    dimensions = {k: pii_masking.sanitize_string(v) if k == 'AccountId' else str(v)
+        for k, v in dimensions.items() if v is not None}
+    record = {'_aws': {'Timestamp': int(time.time()*1000),
+        'CloudWatchMetrics': [{'Namespace': namespace,
+            'Dimensions': [['Phase']+sorted(x for x in dimensions if x in dimensionKeys)],
+            'Metrics': [{'Name': k, 'Unit': units.get(k, 'Count')} for k in values]}]},
+        'Phase': phase}
+    record.update(dimensions)
+    record.update(values)
+    line = json.dumps(record)+'\n'
+    with lock:
+        stream.write(line)
+        stream.flush()
+
+#Time a phase: with phase('WriteToS3', AccountId=x) as p: ...; p.add('Bytes', n)
+def phase(name, **dimensions):
+    if not enabled:
+        return nullPhase
+    return Phase(name, dimensions)
+
+#Dimensions inherited by the phases of this thread: with context(CheckId=x): ...
+def context(**dimensions):
+    if not enabled:
+        return nullPhase
+    return Context(dimensions)
@@ -0,0 +1,100 @@
+######################################################################################################################
+#  Copyright 2019 Amazon.com, Inc. or its affiliates. All Rights Reserved.                                           #
+#                                                                                                                    #
+#  Licensed under the Apache License Version 2.0 (the "License"). You may not use this file except in compliance     #
+#  with the License. A copy of the License is located at                                                             #
+#                                                                                                                    #
+#      http://www.apache.org/licenses/                                                                               #
+#                                                                                                                    #
+#  or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES #
+#  OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific language governing permissions    #
+#  and limitations under the License.                                                                                #
+######################################################################################################################
+
+"""
+pii_masking
+Shared by the Lambda functions that log account information.
+
+When MASK_PII is true 12 digit account IDs are logged as their second digit,
+XXXXXXX and their last four digits, and account names & emails as their first
+and last three characters. MASK_PII is read and the pattern compiled once per
+container.
+
+lazy() defers masking until a log record is actually written, so
+logger.info('%s', lazy(sanitize_json, event)) costs nothing below the log
+level. logRows() logs at most RowLogBudget rows of a row set, spread evenly
+over the set, followed by a one line summary; 0 only logs the summary and -1
+logs every row.
+"""
+import itertools,logging,os,re
+
+maskPII = os.environ.get('MASK_PII', 'true').lower() == 'true'
+rowLogBudget = int(os.environ.get('RowLogBudget', '20'))
+accountIdPattern = re.compile(r'\d{12}')
+
+def maskAccountId(match):
+    x = match.group()
+    return x[1]+'XXXXXXX'+x[-4:]
+
+def maskName(x):
+    return x[:3]+'-MASKED-'+x[-3:]
+
+def sanitize_string(x):
+    if not maskPII:
+        return str(x)
+    return accountIdPattern.sub(maskAccountId, str(x))
+
+#Mask the values of the keys containing one of accountIdKeys or nameKeys
+def sanitize_json(x, accountIdKeys=('AccountId',), nameKeys=('AccountName', 'AccountEmail')):
+    d = x.copy()
+    if maskPII:
+        for k, v in d.items():
+            if any(y in k for y in accountIdKeys):
+                d[k] = sanitize_string(v)
+            if any(y in k for y in nameKeys):
+                d[k] = maskName(v)
+    return d
+
+#Rows ending with AccountId, AccountName & AccountEmail
+def sanitize_list(x):
+    v = list(x)
+    if maskPII:
+        v[-3] = sanitize_string(v[-3])
+        v[-2] = maskName(v[-2])
+        v[-1] = maskName(v[-1])
+    return v
+
+class Lazy(object):
+    __slots__ = ('function', 'args')
+
+    def __init__(self, function, args):
+        self.function = function
+        self.args = args
+
+    def __str__(self):
+        return str(self.function(*self.args))
+
+#Log argument formatted as function(*args) only when the record is written
+def lazy(function, *args):
+    return Lazy(function, args)
+
+#Log the rows after the first `first` rows within the row log budget
+def logRows(logger, label, rows, mask=sanitize_list, first=0, level=logging.INFO):
+    if not logger.isEnabledFor(level):
+        return
+    total = len(rows)-first
+    if rowLogBudget < 0 or total <= rowLogBudget:
+        selected = range(total)
+    else:
+        selected = [i*total//rowLogBudget for i in range(rowLogBudget)]
+    selected = iter(selected)
+    target = next(selected, None)
+    for i, row in enumerate(itertools.islice(rows, first, None)):
+        if target is None:
+            break
+        if i == target:
+            logger.log(level, '%s', mask(row))
+            target = next(selected, None)
+    if rowLogBudget >= 0 and total > rowLogBudget:
+        logger.log(level, '%s: logged %d of %d rows', sanitize_string(label),
+            rowLogBudget, total)
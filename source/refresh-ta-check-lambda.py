@@ -11,9 +11,11 @@
 #  and limitations under the License.                                                                                #
 ######################################################################################################################
 
-import re,boto3,logging,os
+import re,logging,os
 from datetime import date
 from botocore.exceptions import ClientError
+import client_factory,credential_cache,refresh_planner
+from pii_masking import lazy,sanitize_json,sanitize_string
 
 class AWSTrustedAdvisorExplorerGenericException(Exception): pass
 
@@ -24,31 +26,12 @@ if "LOG_LEVEL" in os.environ:
         raise ValueError('Invalid log level: %s' % loglevel)
     logger.setLevel(level=numeric_level) 
 
-def sanitize_json(x):
-    d = x.copy()
-    if os.environ['MASK_PII'].lower() == 'true':
-        for k, v in d.items():
-            if 'AccountId' in k:
-                d[k] = sanitize_string(v)
-            if 'AccountName' in k:
-                d[k] = v[:3]+'-MASKED-'+v[-3:]
-            if 'AccountEmail' in k:
-                d[k] = v[:3]+'-MASKED-'+v[-3:]
-    return d
-
-def sanitize_string(x):
-    y = str(x)
-    if os.environ['MASK_PII'].lower() == 'true':
-        pattern=re.compile('\d{12}')
-        y = re.sub(pattern,lambda match: ((match.group()[1])+'XXXXXXX'+(match.group()[-4:])), y)
-    return y
-
 def refresh_trusted_advisor_checks(supportClient,checkId):
     logger.info('Refreshing Trusted Advisor Check:'+checkId)
     response = supportClient.refresh_trusted_advisor_check(
         checkId=checkId
     )
-    logger.info(sanitize_json(response))
+    logger.info('%s', lazy(sanitize_json, response))
     return response
 
 def checkAssumeRoleFailure(error):
@@ -58,35 +41,60 @@ def checkAssumeRoleFailure(error):
         logger.info('Assume Role Error for Account:'+match.group(1))
         if match != None:       
             key_name='Logs/AssumeRoleFailure/'+ str(date.today().year)+ '/'+str(date.today().month)+'/'+str(date.today().day)+'/'+str(match.group(1))+'.log'
-            client = boto3.client('s3')
-            client.put_object(ACL='bucket-owner-full-control',StorageClass='STANDARD',Body=error, Bucket=os.environ['S3BucketName'],Key=key_name)
+            client_factory.getClient('s3').put_object(ACL='bucket-owner-full-control',StorageClass='STANDARD',Body=error, Bucket=os.environ['S3BucketName'],Key=key_name)
     return
         
-#Assume Role in Child Account
+#Assume Role in Child Account (credentials are cached across invocations)
 def assumeRole(accountId):
     logger.info('Variables passed to assumeRole(): '+sanitize_string(accountId))
-    roleArn="arn:aws:iam::"+str(accountId)+":role/"+os.environ['IAMRoleName']
-    #STS assume role call
-    stsClient = boto3.client('sts')
-    roleCredentials = stsClient.assume_role(RoleArn=roleArn, RoleSessionName="AWSTrustedAdvisorExplorerAssumeRole")
-    return roleCredentials
+    #STS assume role call, served from the container's credential cache
+    return credential_cache.assumeRole(accountId)
         
+#First state of the per-check state machine: the refreshes of all the checks
+#of the account (the Map items) are planned at once and each item carries its
+#action to TARefresh. Items left unplanned are planned by themselves there.
+def plan_refreshes(checks):
+    if len(checks) == 0:
+        return checks
+    try:
+        roleCredentials=assumeRole(checks[0]['AccountId'])
+        supportClient=client_factory.getClient("support","us-east-1",
+            roleCredentials['Credentials'])
+        plan=refresh_planner.planRefresh(supportClient,
+            [check['CheckId'] for check in checks])
+    except Exception as e:
+        logger.info("Unable to plan the refreshes of the account; planning "+
+            "each Check: "+sanitize_string(e))
+        return checks
+    for check in checks:
+        check["RefreshAction"], check["RefreshStatus"] = plan[check['CheckId']]
+    return checks
+
 def lambda_handler(event, context):
+    if isinstance(event, list):
+        return plan_refreshes(event)
     try:
-        logger.info(sanitize_json(event))
+        logger.info('%s', lazy(sanitize_json, event))
         logger.info("Assume Role in child account")
         roleCredentials=assumeRole(event['AccountId'])       
-        logger.info("Create boto3 support client using the temporary credentials")
-        supportClient=boto3.client("support",region_name="us-east-1",
-            aws_access_key_id = roleCredentials['Credentials']['AccessKeyId'],
-            aws_secret_access_key = 
-                roleCredentials['Credentials']['SecretAccessKey'],
-            aws_session_token=roleCredentials['Credentials']['SessionToken'])
-        response = refresh_trusted_advisor_checks(
-                    supportClient, event['CheckId'])
-        logger.info("Append the Refresh Status '"+response['status']['status']+"' to response." +
+        logger.info("Get the pooled boto3 support client for the temporary credentials")
+        supportClient=client_factory.getClient("support","us-east-1",
+            roleCredentials['Credentials'])
+        #Planned for all the checks of the account by the PlanRefreshes state
+        if "RefreshAction" in event:
+            action, status = event["RefreshAction"], event.get("RefreshStatus")
+        else:
+            action, status = refresh_planner.planRefresh(
+                    supportClient, [event['CheckId']])[event['CheckId']]
+        if action == refresh_planner.REFRESH:
+            response = refresh_trusted_advisor_checks(
+                        supportClient, event['CheckId'])
+            status = response['status']['status']
+        logger.info("Append the Refresh Status '"+str(status)+"' to response." +
             " This will be consumed by downstream Lambda")
-        event["RefreshStatus"] = response['status']['status']        
+        event["RefreshStatus"] = status
+        #Fresh or non refreshable checks go straight to extraction
+        event["RefreshSkipped"] = action == refresh_planner.SKIP
         return event
     except ClientError as e:
         checkAssumeRoleFailure(str(e))
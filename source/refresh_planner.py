@@ -0,0 +1,83 @@
+######################################################################################################################
+#  Copyright 2019 Amazon.com, Inc. or its affiliates. All Rights Reserved.                                           #
+#                                                                                                                    #
+#  Licensed under the Apache License Version 2.0 (the "License"). You may not use this file except in compliance     #
+#  with the License. A copy of the License is located at                                                             #
+#                                                                                                                    #
+#      http://www.apache.org/licenses/                                                                               #
+#                                                                                                                    #
+#  or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES #
+#  OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific language governing permissions    #
+#  and limitations under the License.                                                                                #
+######################################################################################################################
+
+"""
+refresh_planner
+Shared by the Lambda functions that refresh Trusted Advisor checks.
+
+Before a refresh, the last refresh time (describe_trusted_advisor_check_summaries)
+and the refresh eligibility (describe_trusted_advisor_check_refresh_statuses) of
+the checks are read in one call each. A check is not refreshed when its result
+is newer than FreshnessWindowInSec, when it cannot be refreshed yet, or when a
+refresh is already enqueued or processing.
+"""
+import logging,os
+from datetime import datetime,timezone
+from botocore.exceptions import ClientError
+
+logger = logging.getLogger()
+
+pendingStatuses = ['enqueued','processing']
+
+#Plan outcomes
+REFRESH = 'refresh'
+SKIP = 'skip'
+POLL = 'poll'
+
+def parseTimestamp(timestamp):
+    try:
+        return datetime.strptime(timestamp, '%Y-%m-%dT%H:%M:%SZ').replace(
+            tzinfo=timezone.utc)
+    except (TypeError, ValueError):
+        return None
+
+def planCheck(summary, status, freshnessWindowInSec, now):
+    if status is not None and status['status'] in pendingStatuses:
+        return POLL, "refresh already "+status['status']
+    refreshedAt = parseTimestamp(summary.get('timestamp')) if summary else None
+    if refreshedAt is not None:
+        age = (now - refreshedAt).total_seconds()
+        if age < freshnessWindowInSec:
+            return SKIP, "refreshed "+str(int(age))+"s ago"
+    if status is not None and status.get('millisUntilNextRefreshable', 0) > 0:
+        return SKIP, "not refreshable for another "+str(
+            round(status['millisUntilNextRefreshable']/1000))+"s"
+    return REFRESH, "stale"
+
+#Return {checkId: (REFRESH|SKIP|POLL, status)} for the checks of one account.
+#If the planning calls fail every check is refreshed, as before.
+def planRefresh(supportClient, checkIds):
+    checkIds = list(checkIds)
+    if not checkIds:
+        return {}
+    freshnessWindowInSec = int(os.environ.get('FreshnessWindowInSec', '0'))
+    try:
+        summaries = {x['checkId']: x for x in
+            supportClient.describe_trusted_advisor_check_summaries(
+                checkIds=checkIds)['summaries']}
+        statuses = {x['checkId']: x for x in
+            supportClient.describe_trusted_advisor_check_refresh_statuses(
+                checkIds=checkIds)['statuses']}
+    except ClientError as e:
+        logger.info("Unable to plan refreshes, refreshing all Checks: "+
+            e.response['Error']['Code'])
+        return {checkId: (REFRESH, None) for checkId in checkIds}
+    now = datetime.now(timezone.utc)
+    plan = {}
+    for checkId in checkIds:
+        status = statuses.get(checkId)
+        action, reason = planCheck(summaries.get(checkId), status,
+            freshnessWindowInSec, now)
+        logger.info("Refresh plan for Check "+checkId+": "+action+" ("+reason+")")
+        plan[checkId] = (action, status['status'] if status else None)
+    return plan
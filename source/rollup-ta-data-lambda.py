@@ -0,0 +1,213 @@
+######################################################################################################################
+#  Copyright 2019 Amazon.com, Inc. or its affiliates. All Rights Reserved.                                           #
+#                                                                                                                    #
+#  Licensed under the Apache License Version 2.0 (the "License"). You may not use this file except in compliance     #
+#  with the License. A copy of the License is located at                                                             #
+#                                                                                                                    #
+#      http://www.apache.org/licenses/                                                                               #
+#                                                                                                                    #
+#  or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES #
+#  OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific language governing permissions    #
+#  and limitations under the License.                                                                                #
+######################################################################################################################
+
+"""
+rollupTAData
+Input:
+Optional {"Date": "YYYY-MM-DD"}; defaults to the Date of the latest pipeline
+run (Runs/latest.json), then to today (UTC).
+
+Output:
+Number of Summary files read & rows written per rollup table.
+
+Description:
+Aggregates the day's Trusted Advisor Summary files into compact tables that
+dashboards can query directly:
+rollup_check_daily    one row per (date, category, account, check)
+rollup_account_daily  one row per (date, category, account)
+with estimated monthly savings, resource counts and optimization
+percentages. Only the day's Summary directories are read and only the day's
+dt= partition of each table is rewritten, so history is never recomputed.
+When a check was reported more than once on the day the latest run is kept.
+Both tables are defined by this Lambda with partition projection on dt.
+"""
+import csv,gzip,io,json,logging,os,time
+from concurrent.futures import ThreadPoolExecutor
+from decimal import ROUND_HALF_UP,Decimal,InvalidOperation
+from botocore.exceptions import ClientError
+import client_factory,data_layout,glue_catalog
+from pii_masking import sanitize_string
+
+class AWSTrustedAdvisorExplorerGenericException(Exception): pass
+
+s3Client = client_factory.getClient('s3')
+
+#Logger block
+logger = logging.getLogger()
+if "LOG_LEVEL" in os.environ:
+    numeric_level = getattr(logging, os.environ['LOG_LEVEL'].upper(), None)
+    if not isinstance(numeric_level, int):
+        raise ValueError('Invalid log level %s' % loglevel)
+    logger.setLevel(level=numeric_level)
+
+#Rollup tables: (Name, [(Column, Type)])
+countColumns=['resourcesprocessed','resourcesflagged','resourcesignored','resourcessuppressed']
+rollupTables={
+    'check':('rollup_check_daily',[('date','date'),('category','string'),
+        ('accountid','string'),('accountname','string'),('checkid','string'),
+        ('checkname','string'),('status','string'),('datetime','timestamp')]+
+        [(x,'bigint') for x in countColumns]+
+        [('estimatedmonthlysavings','decimal(18,2)'),('estimatedpercentmonthlysavings','double'),
+        ('optimizationpercent','double'),('trueoptimizationpercent','double')]),
+    'account':('rollup_account_daily',[('date','date'),('category','string'),
+        ('accountid','string'),('accountname','string'),('checks','bigint'),
+        ('checksflagged','bigint')]+[(x,'bigint') for x in countColumns]+
+        [('estimatedmonthlysavings','decimal(18,2)'),
+        ('optimizationpercent','double'),('trueoptimizationpercent','double')])}
+
+#(Category, Summary directory) pairs holding one day of data, for both layouts
+def getSummaryPrefixes(day):
+    return [(category[len('TA-Reports/'):-1],x)
+        for category in data_layout.listPrefixes('TA-Reports/')
+        for x in data_layout.getDayPrefixes(category+'Summary/',day)]
+
+#Summary rows as dicts with lower case keys, from CSV (plain, gzip,
+#normalized) or Parquet files
+def readRows(key):
+    body=s3Client.get_object(Bucket=os.environ['S3BucketName'],Key=key)['Body'].read()
+    if key.endswith('.parquet'):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise AWSTrustedAdvisorExplorerGenericException(
+                "pyarrow is required to read Parquet files")
+        table=pq.read_table(io.BytesIO(body))
+        return table.rename_columns([x.lower() for x in table.column_names]).to_pylist()
+    if key.endswith('.gz'):
+        body=gzip.decompress(body)
+    reader=csv.reader(io.StringIO(body.decode('utf-8')),escapechar='\\')
+    rows=[]
+    header=None
+    for row in reader:
+        if len(row) == 0 or row == header:
+            continue
+        if header == None:
+            header=row
+            continue
+        rows.append(dict(zip([x.lower() for x in header],row)))
+    return rows
+
+def readPrefix(prefix):
+    with ThreadPoolExecutor(max_workers=int(os.environ.get('RollupWorkers','16'))) as executor:
+        for attempt in range(2):
+            keys=data_layout.listDataKeys(prefix)
+            try:
+                return len(keys),[row for rows in executor.map(readRows,keys) for row in rows]
+            except ClientError as e:
+                #A fragment was compacted while it was read; list the directory again
+                if e.response['Error']['Code'] not in ('NoSuchKey','404') or attempt == 1:
+                    raise
+
+def toNumber(value,numberType):
+    number=glue_catalog.parseNumber(value)
+    if number == None:
+        return numberType(0)
+    try:
+        if numberType == Decimal:
+            return Decimal(str(number))
+        return numberType(number)
+    except (ValueError,OverflowError,InvalidOperation):
+        return numberType(0)
+
+def toTimestamp(value):
+    return str(value).replace('T',' ')[:19]
+
+#Same arithmetic as summary_view (create-athena-views-lambda.py): every 0
+#digit of resourcesprocessed is replaced by 1 and the decimal(10,2) quotient
+#is rounded half up to 2 decimals, as Athena does
+def optimizationPercents(counts):
+    processed,flagged,ignored,suppressed=[Decimal(x) for x in counts]
+    divisor=Decimal(str(int(processed)).replace('0','1'))
+    def percent(numerator):
+        return float((1-(numerator/divisor).quantize(Decimal('0.01'),ROUND_HALF_UP))*100)
+    return percent(flagged),percent(flagged-(ignored+suppressed))
+
+def rollup(day,summaryRows):
+    checks={}
+    for category,row in summaryRows:
+        key=(category,str(row.get('accountid')),row.get('checkid'))
+        if key not in checks or toTimestamp(row.get('datetime')) > checks[key][7]:
+            counts=[toNumber(row.get(x),int) for x in countColumns]
+            checks[key]=[day,category,key[1],row.get('accountname'),key[2],
+                row.get('checkname'),row.get('status'),toTimestamp(row.get('datetime'))]+counts+\
+                [toNumber(row.get('estimatedmonthlysavings'),Decimal).quantize(Decimal('0.01')),
+                toNumber(row.get('estimatedpercentmonthlysavings'),float)]+\
+                list(optimizationPercents(counts))
+    accounts={}
+    for key,row in checks.items():
+        account=accounts.setdefault(key[:2],[day,key[0],key[1],row[3],0,0,0,0,0,0,Decimal('0.00')])
+        account[4]+=1
+        account[5]+=1 if row[9] > 0 else 0
+        for i in range(0,4):
+            account[6+i]+=row[8+i]
+        account[10]+=row[12]
+    accountRows=[row+list(optimizationPercents(row[6:10])) for row in accounts.values()]
+    return {'check':sorted(checks.values(),key=lambda x:x[1:5]),
+        'account':sorted(accountRows,key=lambda x:x[1:3])}
+
+def getTableInput(tableName,columns):
+    location='s3://'+os.environ['S3BucketName']+'/Rollups/'+tableName+'/'
+    return {'Name':tableName,'TableType':'EXTERNAL_TABLE',
+        'Parameters':{'classification':'csv','skip.header.line.count':'1',
+            'projection.enabled':'true','projection.dt.type':'date',
+            'projection.dt.format':'yyyy-MM-dd','projection.dt.range':'2020-01-01,NOW',
+            'storage.location.template':location+'dt=${dt}/'},
+        'PartitionKeys':[{'Name':'dt','Type':'string'}],
+        'StorageDescriptor':{'Columns':[{'Name':x,'Type':y} for x,y in columns],
+            'Location':location,
+            'InputFormat':'org.apache.hadoop.mapred.TextInputFormat',
+            'OutputFormat':'org.apache.hadoop.hive.ql.io.HiveIgnoreKeyTextOutputFormat',
+            'SerdeInfo':{'SerializationLibrary':'org.apache.hadoop.hive.serde2.lazy.LazySimpleSerDe',
+                'Parameters':{'field.delim':',','escape.delim':'\\'}}}}
+
+def writeRollup(tableName,columns,day,rows):
+    stream=io.StringIO()
+    writer=csv.writer(stream,quoting=csv.QUOTE_NONE,escapechar='\\')
+    writer.writerow([x for x,_ in columns])
+    writer.writerows(rows)
+    key='Rollups/'+tableName+'/dt='+str(day)+'/'+tableName+'.csv.gz'
+    s3Client.put_object(Bucket=os.environ['S3BucketName'],Key=key,
+        Body=gzip.compress(stream.getvalue().encode('utf-8')),
+        ACL='bucket-owner-full-control')
+    logger.info("Wrote "+str(len(rows))+" rows to "+key)
+
+def lambda_handler(event, context):
+    logger.info(json.dumps(event))
+    try:
+        day=data_layout.getDay(event)
+        start=time.time()
+        files=0
+        summaryRows=[]
+        for category,prefix in getSummaryPrefixes(day):
+            count,rows=readPrefix(prefix)
+            files+=count
+            summaryRows.extend((category,row) for row in rows)
+        tables=rollup(day,summaryRows)
+        result={"Date":str(day),"Files":files}
+        for name,(tableName,columns) in rollupTables.items():
+            glue_catalog.createOrUpdateTable(os.environ['AthenaDb'],
+                getTableInput(tableName,columns))
+            if len(tables[name]) > 0:
+                writeRollup(tableName,columns,day,tables[name])
+            result[tableName]=len(tables[name])
+        logger.info("Rolled up "+str(files)+" Summary files in "+
+            str(round(time.time()-start,1))+" seconds: "+json.dumps(result))
+        return result
+    except ClientError as e:
+        e = sanitize_string(e)
+        logger.error("Unexpected client error %s" % e)
+        raise AWSTrustedAdvisorExplorerGenericException(e)
+    except Exception as f:
+        f = sanitize_string(f)
+        logger.error("Unexpected exception: %s" % f)
+        raise AWSTrustedAdvisorExplorerGenericException(f)
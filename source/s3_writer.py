@@ -0,0 +1,95 @@
+######################################################################################################################
+#  Copyright 2019 Amazon.com, Inc. or its affiliates. All Rights Reserved.                                           #
+#                                                                                                                    #
+#  Licensed under the Apache License Version 2.0 (the "License"). You may not use this file except in compliance     #
+#  with the License. A copy of the License is located at                                                             #
+#                                                                                                                    #
+#      http://www.apache.org/licenses/                                                                               #
+#                                                                                                                    #
+#  or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES #
+#  OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific language governing permissions    #
+#  and limitations under the License.                                                                                #
+######################################################################################################################
+
+
+
+"""
+s3_writer
+Shared by the Lambda functions that extract Trusted Advisor & tag data.
+
+Rows are encoded as CSV in chunks so large results never sit in memory twice.
+The chunks are sent with a single put_object unless they grow past
+multipartPartSize, in which case they are streamed as a multipart upload that
+is aborted if any part fails.
+"""
+import csv,io,logging,os
+import client_factory,phase_metrics
+from pii_masking import lazy,sanitize_string
+
+logger = logging.getLogger()
+
+multipartPartSize=8*1024*1024
+
+#Rows are lists, or dicts when fieldNames is given (the header row is written
+#first); escaped output backslash-escapes delimiters instead of quoting
+def encodeCsv(rows,fieldNames=None,chunkRows=1000,escaped=False):
+    stream = io.StringIO()
+    dialect = {'quoting':csv.QUOTE_NONE,'escapechar':'\\'} if escaped else {}
+    if fieldNames == None:
+        writer = csv.writer(stream,**dialect)
+    else:
+        writer = csv.DictWriter(stream,fieldnames=fieldNames,**dialect)
+        writer.writeheader()
+    for i,row in enumerate(rows,1):
+        writer.writerow(row)
+        if i % chunkRows == 0:
+            yield stream.getvalue().encode('utf-8')
+            stream.seek(0)
+            stream.truncate(0)
+    yield stream.getvalue().encode('utf-8')
+
+def writeToS3(chunks,fileName,s3Path):
+    logger.info('Variables passed to writeToS3(): %s,%s',
+        lazy(sanitize_string,fileName),s3Path)
+    #required variables
+    bucketName=os.environ['S3BucketName']
+    s3Client = client_factory.getClient('s3')
+    buffer=bytearray()
+    parts=[]
+    uploadId=None
+    size=0
+    with phase_metrics.phase('WriteToS3') as phase:
+        try:
+            for chunk in chunks:
+                buffer+=chunk
+                size+=len(chunk)
+                if len(buffer) >= multipartPartSize:
+                    with phase.timer('UploadMs'):
+                        if uploadId == None:
+                            uploadId=s3Client.create_multipart_upload(Bucket=bucketName,
+                                Key=s3Path+fileName,ACL='bucket-owner-full-control')['UploadId']
+                        part=s3Client.upload_part(Bucket=bucketName,Key=s3Path+fileName,
+                            PartNumber=len(parts)+1,UploadId=uploadId,Body=bytes(buffer))
+                    phase.add('Retries',phase_metrics.retries(part))
+                    parts.append({'ETag':part['ETag'],'PartNumber':len(parts)+1})
+                    buffer=bytearray()
+            with phase.timer('UploadMs'):
+                if uploadId == None:
+                    response=s3Client.put_object(Bucket=bucketName,Key=s3Path+fileName,
+                        Body=bytes(buffer),ACL='bucket-owner-full-control')
+                else:
+                    if len(buffer) > 0:
+                        part=s3Client.upload_part(Bucket=bucketName,Key=s3Path+fileName,
+                            PartNumber=len(parts)+1,UploadId=uploadId,Body=bytes(buffer))
+                        parts.append({'ETag':part['ETag'],'PartNumber':len(parts)+1})
+                    response=s3Client.complete_multipart_upload(Bucket=bucketName,
+                        Key=s3Path+fileName,UploadId=uploadId,MultipartUpload={'Parts':parts})
+            phase.add('Retries',phase_metrics.retries(response))
+            phase.add('Parts',len(parts))
+            phase.add('Bytes',size)
+        except Exception:
+            if uploadId != None:
+                s3Client.abort_multipart_upload(Bucket=bucketName,
+                    Key=s3Path+fileName,UploadId=uploadId)
+            raise
+    return size
@@ -11,12 +11,14 @@
 #  and limitations under the License.                                                                                #
 ######################################################################################################################
 
-import boto3,logging,os,re
+import logging,os
 from botocore.exceptions import ClientError
+import client_factory
+from pii_masking import lazy,sanitize_json,sanitize_string
 
 class AWSTrustedAdvisorExplorerGenericException(Exception): pass
 
-glueClient=boto3.client('glue')
+glueClient=client_factory.getClient('glue')
 
 #Logger block
 logger = logging.getLogger()
@@ -26,27 +28,8 @@ if "LOG_LEVEL" in os.environ:
         raise ValueError('Invalid log level %s' % loglevel)
     logger.setLevel(level=numeric_level)
 
-def sanitize_string(x):
-    y = str(x)
-    if os.environ['MASK_PII'].lower() == 'true':
-        pattern=re.compile('\d{12}')
-        y = re.sub(pattern,lambda match: ((match.group()[1])+'XXXXXXX'+(match.group()[-4:])), y)
-    return y
-
-def sanitize_json(x):
-    d = x.copy()
-    if os.environ['MASK_PII'].lower() == 'true':
-        for k, v in d.items():
-            if 'AccountId' in k:
-                d[k] = sanitize_string(v)
-            if 'account' in k:
-                d[k] = sanitize_string(v)
-            if 'accountid' in k:
-                d[k] = sanitize_string(v)
-    return d
-
 def lambda_handler(event,context):
-    logger.info(sanitize_json(event))
+    logger.info('%s', lazy(sanitize_json, event, ('AccountId', 'account'), ()))
     try:
         response=glueClient.start_crawler(Name=os.environ['CrawlerName'])
         return response
@@ -0,0 +1,33 @@
+######################################################################################################################
+#  Copyright 2019 Amazon.com, Inc. or its affiliates. All Rights Reserved.                                           #
+#                                                                                                                    #
+#  Licensed under the Apache License Version 2.0 (the "License"). You may not use this file except in compliance     #
+#  with the License. A copy of the License is located at                                                             #
+#                                                                                                                    #
+#      http://www.apache.org/licenses/                                                                               #
+#                                                                                                                    #
+#  or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES #
+#  OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific language governing permissions    #
+#  and limitations under the License.                                                                                #
+######################################################################################################################
+
+"""
+Loads the Lambda modules (file names with dashes) for the unit tests. No AWS
+call is made when a module is loaded; boto3 clients only need a region.
+"""
+import importlib.util,os,sys
+
+sourceDir=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if sourceDir not in sys.path:
+    sys.path.insert(0,sourceDir)
+os.environ.setdefault('AWS_DEFAULT_REGION','us-east-1')
+os.environ.setdefault('AWS_REGION','us-east-1')
+os.environ.setdefault('MASK_PII','true')
+
+def loadLambda(fileName,environment={}):
+    os.environ.update(environment)
+    spec=importlib.util.spec_from_file_location(fileName[:-3].replace('-','_'),
+        os.path.join(sourceDir,fileName))
+    module=importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
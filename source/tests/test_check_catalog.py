@@ -0,0 +1,65 @@
+######################################################################################################################
+#  Copyright 2019 Amazon.com, Inc. or its affiliates. All Rights Reserved.                                           #
+#                                                                                                                    #
+#  Licensed under the Apache License Version 2.0 (the "License"). You may not use this file except in compliance     #
+#  with the License. A copy of the License is located at                                                             #
+#                                                                                                                    #
+#      http://www.apache.org/licenses/                                                                               #
+#                                                                                                                    #
+#  or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES #
+#  OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific language governing permissions    #
+#  and limitations under the License.                                                                                #
+######################################################################################################################
+
+
+
+import io,os,unittest
+from unittest import mock
+from botocore.exceptions import ClientError
+from tests.lambdas import loadLambda
+
+class FakeS3(object):
+    def __init__(self):
+        self.objects = {}
+
+    def get_object(self, Bucket, Key):
+        if Key not in self.objects:
+            raise ClientError({'Error': {'Code': 'NoSuchKey'}}, 'GetObject')
+        return {'Body': io.BytesIO(self.objects[Key])}
+
+    def put_object(self, Bucket, Key, Body, **kwargs):
+        self.objects[Key] = Body
+
+class FakeSupport(object):
+    def __init__(self):
+        self.calls = 0
+
+    def describe_trusted_advisor_checks(self, language):
+        self.calls += 1
+        return {'checks': [{'id': 'a', 'name': 'A', 'category': 'cost_optimizing'},
+            {'id': 'b', 'name': 'B', 'category': 'cost_optimizing'},
+            {'id': 'c', 'name': 'C', 'category': 'security'}]}
+
+class CheckCatalogTest(unittest.TestCase):
+    def setUp(self):
+        environment = mock.patch.dict(os.environ)
+        environment.start()
+        self.addCleanup(environment.stop)
+        self.getTAChecks = loadLambda('get-ta-checks-lambda.py',
+            {'S3BucketName': 'bucket', 'Category': 'cost_optimizing',
+             'SupportedChecks': 'a'})
+        self.getTAChecks.s3 = FakeS3()
+        self.getTAChecks.supportClient = FakeSupport()
+
+    def test_filters_are_applied_to_the_cached_catalog(self):
+        self.assertEqual([x['CheckId'] for x in self.getTAChecks.get_check_catalog('en')], ['a'])
+        os.environ['SupportedChecks'] = 'a,b,c'
+        self.assertEqual([x['CheckId'] for x in self.getTAChecks.get_check_catalog('en')], ['a', 'b'])
+        #A new container reads the unfiltered catalog from S3
+        self.getTAChecks.catalogCache.clear()
+        os.environ['Category'] = 'cost_optimizing,security'
+        self.assertEqual([x['CheckId'] for x in self.getTAChecks.get_check_catalog('en')], ['a', 'b', 'c'])
+        self.assertEqual(self.getTAChecks.supportClient.calls, 1)
+
+if __name__ == '__main__':
+    unittest.main()
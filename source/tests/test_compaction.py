@@ -0,0 +1,92 @@
+######################################################################################################################
+#  Copyright 2019 Amazon.com, Inc. or its affiliates. All Rights Reserved.                                           #
+#                                                                                                                    #
+#  Licensed under the Apache License Version 2.0 (the "License"). You may not use this file except in compliance     #
+#  with the License. A copy of the License is located at                                                             #
+#                                                                                                                    #
+#      http://www.apache.org/licenses/                                                                               #
+#                                                                                                                    #
+#  or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES #
+#  OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific language governing permissions    #
+#  and limitations under the License.                                                                                #
+######################################################################################################################
+
+import io,unittest
+from datetime import date,datetime,timedelta,timezone
+from botocore.exceptions import ClientError
+from unittest import mock
+from tests.lambdas import loadLambda
+import client_factory,data_layout
+
+class FakePaginator(object):
+    def __init__(self, s3):
+        self.s3 = s3
+
+    def paginate(self, Bucket, Prefix, Delimiter):
+        keys = sorted(x for x in self.s3.objects if x.startswith(Prefix))
+        yield {'Contents': [{'Key': x, 'LastModified': self.s3.objects[x][1]}
+            for x in keys if Delimiter not in x[len(Prefix):]],
+            'CommonPrefixes': [{'Prefix': x} for x in sorted(set(
+                Prefix+x[len(Prefix):].split(Delimiter)[0]+Delimiter
+                for x in keys if Delimiter in x[len(Prefix):]))]}
+
+class FakeS3(object):
+    def __init__(self):
+        self.objects = {}
+
+    def get_paginator(self, name):
+        return FakePaginator(self)
+
+    def get_object(self, Bucket, Key):
+        if Key not in self.objects:
+            raise ClientError({'Error': {'Code': 'NoSuchKey'}}, 'GetObject')
+        return {'Body': io.BytesIO(self.objects[Key][0])}
+
+    def put_object(self, Bucket, Key, Body, **kwargs):
+        self.objects[Key] = (Body, datetime.now(timezone.utc))
+
+    def copy_object(self, Bucket, Key, CopySource, **kwargs):
+        if CopySource['Key'] not in self.objects:
+            raise ClientError({'Error': {'Code': 'NoSuchKey'}}, 'CopyObject')
+        self.objects[Key] = self.objects[CopySource['Key']]
+
+    def delete_object(self, Bucket, Key):
+        self.objects.pop(Key, None)
+
+    def delete_objects(self, Bucket, Delete):
+        for x in Delete['Objects']:
+            self.objects.pop(x['Key'], None)
+
+class CompactionTest(unittest.TestCase):
+    def setUp(self):
+        self.compact = loadLambda('compact-ta-data-lambda.py',
+            {'S3BucketName': 'bucket', 'PartitionLayout': 'Legacy', 'Compaction': 'Delete'})
+        self.compact.s3Client = self.s3 = FakeS3()
+        patcher = mock.patch.object(client_factory, 'getClient', return_value=self.s3)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_day_of_the_latest_run(self):
+        self.assertEqual(data_layout.getDay({}), datetime.utcnow().date())
+        self.s3.put_object('bucket', 'Runs/latest.json', b'{"Date": "2026-10-16"}')
+        self.assertEqual(data_layout.getDay({}), date(2026, 10, 16))
+        self.assertEqual(data_layout.getDay({'Date': '2026-10-01'}), date(2026, 10, 1))
+
+    def test_orphaned_hidden_files_are_removed(self):
+        prefix = 'TA-Reports/cost_optimizing/Summary/2026/10/16/'
+        for name in ['a.csv', 'b.csv']:
+            self.s3.put_object('bucket', prefix+name, b'H\nrow '+name.encode()+b'\n')
+        self.s3.put_object('bucket', prefix+'_compacted_01-00-00_0.csv.gz', b'old')
+        self.s3.objects[prefix+'_compacted_01-00-00_0.csv.gz'] = (b'old',
+            datetime.now(timezone.utc)-timedelta(hours=1))
+        self.s3.put_object('bucket', prefix+'_compacted_09-00-00_0.csv.gz', b'running')
+        self.assertEqual(self.compact.compactPrefix(prefix), 2)
+        names = sorted(x[len(prefix):] for x in self.s3.objects if x.startswith(prefix))
+        self.assertEqual(len(names), 2)
+        #The recent hidden file may belong to a running compaction
+        self.assertEqual(names[0], '_compacted_09-00-00_0.csv.gz')
+        self.assertTrue(names[1].startswith('compacted_'))
+        self.assertFalse(any(x.startswith('Compaction/') for x in self.s3.objects))
+
+if __name__ == '__main__':
+    unittest.main()
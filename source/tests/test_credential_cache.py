@@ -0,0 +1,67 @@
+######################################################################################################################
+#  Copyright 2019 Amazon.com, Inc. or its affiliates. All Rights Reserved.                                           #
+#                                                                                                                    #
+#  Licensed under the Apache License Version 2.0 (the "License"). You may not use this file except in compliance     #
+#  with the License. A copy of the License is located at                                                             #
+#                                                                                                                    #
+#      http://www.apache.org/licenses/                                                                               #
+#                                                                                                                    #
+#  or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES #
+#  OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific language governing permissions    #
+#  and limitations under the License.                                                                                #
+######################################################################################################################
+
+
+import threading,unittest
+from datetime import datetime,timedelta,timezone
+import tests.lambdas
+import credential_cache
+
+class FakeSTS(object):
+    def __init__(self, lifetime):
+        self.lifetime = lifetime
+        self.calls = 0
+
+    def assume_role(self, RoleArn, RoleSessionName):
+        self.calls += 1
+        return {'Credentials': {'AccessKeyId': RoleArn,
+            'Expiration': datetime.now(timezone.utc)+self.lifetime}}
+
+def getCache(maxEntries, lifetime=timedelta(hours=1)):
+    cache = credential_cache.CredentialCache(300, maxEntries)
+    cache.stsClient = FakeSTS(lifetime)
+    return cache
+
+class CredentialCacheTest(unittest.TestCase):
+    def test_hit(self):
+        cache = getCache(4)
+        cache.assumeRole('111111111111', 'role', 'session')
+        cache.assumeRole('111111111111', 'role', 'session')
+        self.assertEqual(cache.stsClient.calls, 1)
+
+    def test_least_recently_used_is_evicted(self):
+        cache = getCache(2)
+        for accountId in ['111111111111', '222222222222', '111111111111', '333333333333']:
+            cache.assumeRole(accountId, 'role', 'session')
+        self.assertEqual([x[0] for x in cache.entries], ['111111111111', '333333333333'])
+        self.assertEqual(set(x[0] for x in cache.keyLocks), {'111111111111', '333333333333'})
+
+    def test_expired_entries_are_dropped(self):
+        cache = getCache(10, lifetime=timedelta(seconds=-1))
+        for i in range(5):
+            cache.assumeRole(str(i)*12, 'role', 'session')
+        self.assertEqual(len(cache.entries), 0)
+        self.assertEqual(len(cache.keyLocks), 0)
+
+    def test_waiting_callers_keep_their_lock(self):
+        cache = getCache(1)
+        key = ('111111111111', 'role')
+        #A caller that has registered for the key but not acquired its lock yet
+        waiter = cache.keyLocks.setdefault(key, [threading.Lock(), 1])
+        cache.assumeRole('222222222222', 'role', 'session')
+        cache.assumeRole('333333333333', 'role', 'session')
+        self.assertIs(cache.keyLocks[key], waiter)
+        self.assertNotIn(('222222222222', 'role'), cache.keyLocks)
+
+if __name__ == '__main__':
+    unittest.main()
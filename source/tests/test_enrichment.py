@@ -0,0 +1,42 @@
+######################################################################################################################
+#  Copyright 2019 Amazon.com, Inc. or its affiliates. All Rights Reserved.                                           #
+#                                                                                                                    #
+#  Licensed under the Apache License Version 2.0 (the "License"). You may not use this file except in compliance     #
+#  with the License. A copy of the License is located at                                                             #
+#                                                                                                                    #
+#      http://www.apache.org/licenses/                                                                               #
+#                                                                                                                    #
+#  or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES #
+#  OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific language governing permissions    #
+#  and limitations under the License.                                                                                #
+######################################################################################################################
+
+import io,json,os,unittest
+from unittest import mock
+from tests.lambdas import loadLambda
+import client_factory
+
+class FakeS3(object):
+    def get_object(self, Bucket, Key):
+        return {'Body': io.BytesIO(b'{"Date": "2026-10-16"}')}
+
+class FakeLambda(object):
+    def __init__(self):
+        self.payloads = []
+
+    def invoke(self, FunctionName, InvocationType, Payload):
+        self.payloads.append(json.loads(Payload))
+
+@mock.patch.dict(os.environ, {'S3BucketName': 'bucket', 'EnrichmentTags': '',
+    'CompactionFunction': 'compact'})
+class EnrichmentTest(unittest.TestCase):
+    def test_day_of_the_latest_run(self):
+        enrich = loadLambda('enrich-ta-data-lambda.py')
+        enrich.lambdaClient = fakeLambda = FakeLambda()
+        with mock.patch.object(client_factory, 'getClient', return_value=FakeS3()):
+            result = enrich.lambda_handler({}, None)
+        self.assertEqual(result['Date'], '2026-10-16')
+        self.assertEqual(fakeLambda.payloads, [{'Date': '2026-10-16'}])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,135 @@
+######################################################################################################################
+#  Copyright 2019 Amazon.com, Inc. or its affiliates. All Rights Reserved.                                           #
+#                                                                                                                    #
+#  Licensed under the Apache License Version 2.0 (the "License"). You may not use this file except in compliance     #
+#  with the License. A copy of the License is located at                                                             #
+#                                                                                                                    #
+#      http://www.apache.org/licenses/                                                                               #
+#                                                                                                                    #
+#  or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES #
+#  OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific language governing permissions    #
+#  and limitations under the License.                                                                                #
+######################################################################################################################
+
+import csv,io,json,os,unittest
+from datetime import datetime,timezone
+from unittest import mock
+from botocore.exceptions import ClientError
+from tests.lambdas import loadLambda
+import client_factory,data_layout
+
+environment = {'S3BucketName': 'bucket', 'IncrementalMode': 'true',
+    'PartitionLayout': 'Legacy', 'OutputFormat': 'CSV', 'Compaction': 'Delete',
+    'Tags': '', 'Header_Summary': 'CheckId,Status,ResourcesProcessed,ResourcesFlagged,'
+    'ResourcesIgnored,ResourcesSuppressed,EstimatedMonthlySavings,EstimatedPercentMonthlySavings',
+    'Header_Z4AUBRNSmz': 'Region,IP Address', 'Schema_Z4AUBRNSmz': 'region,0'}
+
+class FakeS3(object):
+    def __init__(self):
+        self.objects = {}
+
+    def get_object(self, Bucket, Key):
+        if Key not in self.objects:
+            raise ClientError({'Error': {'Code': 'NoSuchKey'}}, 'GetObject')
+        return {'Body': io.BytesIO(self.objects[Key])}
+
+    def put_object(self, Bucket, Key, Body, **kwargs):
+        self.objects[Key] = Body if isinstance(Body, bytes) else Body.encode('utf-8')
+        return {'ResponseMetadata': {'RetryAttempts': 0}}
+
+    def copy_object(self, Bucket, Key, CopySource, **kwargs):
+        self.objects[Key] = self.objects[CopySource['Key']]
+
+    def delete_object(self, Bucket, Key):
+        self.objects.pop(Key, None)
+
+    def delete_objects(self, Bucket, Delete):
+        for x in Delete['Objects']:
+            self.objects.pop(x['Key'], None)
+
+class FakeSupport(object):
+    def describe_trusted_advisor_check_result(self, checkId, language):
+        return {'ResponseMetadata': {'HTTPStatusCode': 200}, 'result': {
+            'checkId': checkId, 'status': 'warning',
+            'resourcesSummary': {'resourcesProcessed': 2, 'resourcesFlagged': 1,
+                'resourcesIgnored': 0, 'resourcesSuppressed': 0},
+            'categorySpecificSummary': {}, 'flaggedResources': [
+                {'status': 'warning', 'region': 'us-east-1', 'metadata': ['10.0.0.1']}]}}
+
+def rows(s3, part):
+    return [row for key, body in sorted(s3.objects.items()) if part in key
+        for row in list(csv.reader(io.StringIO(body.decode('utf-8'))))[1:]]
+
+@mock.patch.dict(os.environ, environment)
+class IncrementalModeTest(unittest.TestCase):
+    def setUp(self):
+        self.extract = loadLambda('extract-ta-data-lambda.py')
+        self.compact = loadLambda('compact-ta-data-lambda.py')
+        self.s3 = self.extract.s3Client = self.compact.s3Client = FakeS3()
+        patcher = mock.patch.object(client_factory, 'getClient', return_value=self.s3)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def extractCheck(self, dateTime):
+        return self.extract.genericTAParse(FakeSupport(), 'Z4AUBRNSmz', '123456789012',
+            'name', 'email', 'en', '10-17-2026', dateTime, 'Unassociated Elastic IP Addresses',
+            'cost_optimizing')
+
+    def test_unchanged_details_are_pointed_at(self):
+        first = self.extractCheck('2026-10-17 01:00:00')
+        #Both runs may write their files in the same second
+        pointers = rows(self.s3, '/Incremental/')
+        second = self.extractCheck('2026-10-17 02:00:00')
+        pointers += rows(self.s3, '/Incremental/')[-1:]
+        self.assertEqual(len(rows(self.s3, '/check_Z4AUBRNSmz/')), 1)
+        self.assertIsNone(second['fileDetails'][1]['DetailsFileName'])
+        self.assertTrue(second['fileDetails'][1]['Unchanged'])
+        manifest = json.loads(self.s3.objects['Manifests/Z4AUBRNSmz/123456789012.json'])
+        self.assertEqual(second['fileDetails'][1]['ReusedDetailsKey'], manifest['DetailsKey'])
+        self.assertIn(first['fileDetails'][1]['DetailsFileName'], manifest['DetailsKey'])
+        #Both runs point at the Details rows of the first one
+        self.assertEqual([(x[1], x[4], x[5]) for x in pointers],
+            [('2026-10-17 01:00:00', '10-17-2026', '2026-10-17 01:00:00'),
+            ('2026-10-17 02:00:00', '10-17-2026', '2026-10-17 01:00:00')])
+        self.assertEqual(pointers[1][6], manifest['DetailsKey'][len(
+            'TA-Reports/cost_optimizing/check_Z4AUBRNSmz/'):].rsplit('/', 1)[0]+'/')
+
+    def test_compaction_updates_the_manifest(self):
+        patcher = mock.patch.object(data_layout, 'listObjects', lambda prefix: [{'Key': x,
+            'LastModified': datetime.now(timezone.utc)} for x in self.s3.objects
+            if x.startswith(prefix) and '/' not in x[len(prefix):]])
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.extractCheck('2026-10-17 01:00:00')
+        manifestKey = 'Manifests/Z4AUBRNSmz/123456789012.json'
+        detailsKey = json.loads(self.s3.objects[manifestKey])['DetailsKey']
+        prefix = detailsKey.rsplit('/', 1)[0]+'/'
+        self.assertEqual(self.compact.compactPrefix(prefix), 1)
+        manifest = json.loads(self.s3.objects[manifestKey])
+        self.assertNotIn(detailsKey, self.s3.objects)
+        self.assertTrue(manifest['DetailsKey'].startswith(prefix+'compacted_'))
+        self.assertIn(manifest['DetailsKey'], self.s3.objects)
+
+    def test_views_resolve_the_incremental_rows(self):
+        views = loadLambda('create-athena-views-lambda.py')
+        query = views.resolveIncremental('CREATE OR REPLACE VIEW v AS SELECT '
+            '"check_z4aubrnsmz".* FROM "check_z4aubrnsmz"', 'Z4AUBRNSmz')
+        self.assertIn('SELECT "incremental"."date", "incremental"."datetime", '
+            '"d"."checkname", "d"."region", "d"."ip address"', query)
+        self.assertIn('("incremental"."detailsdate" = "d"."date")', query)
+        self.assertIn('("incremental"."detailsdatetime" = "d"."datetime"))', query)
+        self.assertNotIn('"d"."shard"', query)
+        #Rows written before the first incremental run
+        self.assertIn('OR "d"."datetime" < (SELECT min("datetime") FROM "incremental")) '
+            '"check_z4aubrnsmz"', query)
+        self.assertIn('FROM ((SELECT', views.resolveIncremental(
+            'SELECT 1 FROM (check_z4aubrnsmz LEFT JOIN tags ON x)', 'Z4AUBRNSmz'))
+
+    def test_views_read_the_partition_of_the_details_file(self):
+        with mock.patch.dict(os.environ, {'PartitionLayout': 'Hive'}):
+            query = loadLambda('create-athena-views-lambda.py').incrementalSource('Z4AUBRNSmz')
+        self.assertIn('("d"."shard" = CAST(regexp_extract("incremental"."detailspath", '
+            "'shard=(\\d+)', 1) AS integer))", query)
+
+if __name__ == '__main__':
+    unittest.main()
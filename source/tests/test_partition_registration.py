@@ -0,0 +1,113 @@
+######################################################################################################################
+#  Copyright 2019 Amazon.com, Inc. or its affiliates. All Rights Reserved.                                           #
+#                                                                                                                    #
+#  Licensed under the Apache License Version 2.0 (the "License"). You may not use this file except in compliance     #
+#  with the License. A copy of the License is located at                                                             #
+#                                                                                                                    #
+#      http://www.apache.org/licenses/                                                                               #
+#                                                                                                                    #
+#  or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES #
+#  OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific language governing permissions    #
+#  and limitations under the License.                                                                                #
+######################################################################################################################
+
+import os,unittest
+from datetime import date
+from unittest import mock
+import client_factory,glue_catalog
+
+class FakePaginator(object):
+    def __init__(self, glue):
+        self.glue = glue
+
+    def paginate(self, DatabaseName):
+        yield {'TableList': self.glue.tables}
+
+class FakeGlue(object):
+    def __init__(self, failures=None):
+        self.tables = []
+        self.partitions = set()
+        self.calls = []
+        #Error code returned for the next calls, one per call
+        self.failures = list(failures or [])
+
+    def get_paginator(self, name):
+        return FakePaginator(self)
+
+    def batch_create_partition(self, DatabaseName, TableName, PartitionInputList):
+        self.calls.append(len(PartitionInputList))
+        failure = self.failures.pop(0) if self.failures else None
+        errors = []
+        for i, x in enumerate(PartitionInputList):
+            key = (TableName, tuple(x['Values']))
+            if failure != None and i % 2 == 0:
+                errors.append({'PartitionValues': x['Values'],
+                    'ErrorDetail': {'ErrorCode': failure, 'ErrorMessage': 'failed'}})
+            elif key in self.partitions:
+                errors.append({'PartitionValues': x['Values'],
+                    'ErrorDetail': {'ErrorCode': 'AlreadyExistsException'}})
+            else:
+                self.partitions.add(key)
+        return {'Errors': errors}
+
+def table(name, projection=False):
+    return {'Name': name, 'PartitionKeys': glue_catalog.partitionKeys,
+        'Parameters': {'projection.enabled': 'true'} if projection else {},
+        'StorageDescriptor': {'Location': 's3://bucket/'+name}}
+
+@mock.patch.dict(os.environ, {'AthenaDb': 'db', 'PartitionShards': '16'})
+@mock.patch.object(glue_catalog.time, 'sleep')
+class PartitionRegistrationTest(unittest.TestCase):
+    def setUp(self):
+        patcher = mock.patch.object(glue_catalog, 'registeredPartitions', set())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def register(self, glue, days):
+        with mock.patch.object(client_factory, 'getClient', return_value=glue):
+            glue_catalog.registerRunPartitions(days)
+
+    def test_batches_of_100_once_per_run(self, sleep):
+        glue = FakeGlue()
+        glue.tables = [table('checks'), table('projected', projection=True),
+            {'Name': 'legacy', 'PartitionKeys': [], 'StorageDescriptor': {'Location': ''}}]
+        days = [date(2026, 10, d) for d in range(1, 9)]
+        self.register(glue, days)
+        self.assertEqual(glue.calls, [100, 28])
+        self.assertEqual(len(glue.partitions), 128)
+        self.assertIn(('checks', ('2026', '10', '8', '15')), glue.partitions)
+        self.register(glue, days)
+        self.assertEqual(glue.calls, [100, 28])
+
+    def test_only_created_partitions_are_registered(self, sleep):
+        glue = FakeGlue(['ThrottlingException'])
+        glue.tables = [table('checks')]
+        self.register(glue, [date(2026, 10, 17)])
+        self.assertEqual(glue.calls, [16, 8])
+        self.assertEqual(sleep.call_count, 1)
+        self.assertEqual(len(glue_catalog.registeredPartitions), 16)
+
+    def test_existing_partitions_count_as_registered(self, sleep):
+        glue = FakeGlue()
+        glue.tables = [table('checks')]
+        glue.partitions.add(('checks', ('2026', '10', '17', '0')))
+        self.register(glue, [date(2026, 10, 17)])
+        self.assertEqual(len(glue_catalog.registeredPartitions), 16)
+
+    def test_errors_are_raised(self, sleep):
+        glue = FakeGlue(['ThrottlingException']*(glue_catalog.partitionRetries+1))
+        glue.tables = [table('checks')]
+        with self.assertRaises(glue_catalog.PartitionRegistrationError):
+            self.register(glue, [date(2026, 10, 17)])
+        self.assertEqual(len(glue.calls), glue_catalog.partitionRetries+1)
+        #Each retry creates half of the failed partitions, the last one fails
+        self.assertEqual(len(glue_catalog.registeredPartitions), 15)
+        self.assertNotIn(('checks', ('2026', '10', '17', '0')), glue_catalog.registeredPartitions)
+        glue = FakeGlue(['AccessDeniedException'])
+        glue.tables = [table('other')]
+        with self.assertRaises(glue_catalog.PartitionRegistrationError):
+            self.register(glue, [date(2026, 10, 17)])
+        self.assertEqual(glue.calls, [16])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,49 @@
+######################################################################################################################
+#  Copyright 2019 Amazon.com, Inc. or its affiliates. All Rights Reserved.                                           #
+#                                                                                                                    #
+#  Licensed under the Apache License Version 2.0 (the "License"). You may not use this file except in compliance     #
+#  with the License. A copy of the License is located at                                                             #
+#                                                                                                                    #
+#      http://www.apache.org/licenses/                                                                               #
+#                                                                                                                    #
+#  or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES #
+#  OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific language governing permissions    #
+#  and limitations under the License.                                                                                #
+######################################################################################################################
+
+
+
+import io,json,unittest
+from unittest import mock
+import tests.lambdas
+import phase_metrics
+
+class PhaseMetricsTest(unittest.TestCase):
+    def setUp(self):
+        self.stream = io.StringIO()
+        patches = [mock.patch.object(phase_metrics, 'enabled', True),
+            mock.patch.object(phase_metrics, 'stream', self.stream),
+            mock.patch('pii_masking.maskPII', True)]
+        for x in patches:
+            x.start()
+            self.addCleanup(x.stop)
+
+    def test_only_low_cardinality_keys_are_dimensions(self):
+        with phase_metrics.context(ExtractionMode='Account', AccountId='123456789012'):
+            with phase_metrics.phase('BuildRows', CheckId='Qch7DwouX1') as phase:
+                phase.add('Rows', 3)
+        record = json.loads(self.stream.getvalue())
+        self.assertEqual(record['_aws']['CloudWatchMetrics'][0]['Dimensions'],
+            [['Phase', 'ExtractionMode']])
+        self.assertEqual((record['Phase'], record['ExtractionMode'], record['CheckId'],
+            record['AccountId'], record['Rows']),
+            ('BuildRows', 'Account', 'Qch7DwouX1', '2XXXXXXX9012', 3))
+
+    def test_phase_without_mode_has_the_phase_dimension(self):
+        with phase_metrics.phase('AssumeRole', AccountId='123456789012'):
+            pass
+        record = json.loads(self.stream.getvalue())
+        self.assertEqual(record['_aws']['CloudWatchMetrics'][0]['Dimensions'], [['Phase']])
+
+if __name__ == '__main__':
+    unittest.main()
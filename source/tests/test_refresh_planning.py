@@ -0,0 +1,90 @@
+######################################################################################################################
+#  Copyright 2019 Amazon.com, Inc. or its affiliates. All Rights Reserved.                                           #
+#                                                                                                                    #
+#  Licensed under the Apache License Version 2.0 (the "License"). You may not use this file except in compliance     #
+#  with the License. A copy of the License is located at                                                             #
+#                                                                                                                    #
+#      http://www.apache.org/licenses/                                                                               #
+#                                                                                                                    #
+#  or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES #
+#  OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific language governing permissions    #
+#  and limitations under the License.                                                                                #
+######################################################################################################################
+
+
+
+import unittest
+from unittest import mock
+from tests.lambdas import loadLambda
+import client_factory,credential_cache,refresh_planner
+
+class FakeSupport(object):
+    def __init__(self):
+        self.calls = []
+
+    def describe_trusted_advisor_check_summaries(self, checkIds):
+        self.calls.append('summaries')
+        return {'summaries': [{'checkId': x, 'timestamp': '2000-01-01T00:00:00Z'}
+            for x in checkIds]}
+
+    def describe_trusted_advisor_check_refresh_statuses(self, checkIds):
+        self.calls.append('statuses')
+        return {'statuses': [{'checkId': x, 'status': 'processing' if x == 'b' else 'none',
+            'millisUntilNextRefreshable': 0} for x in checkIds]}
+
+    def refresh_trusted_advisor_check(self, checkId):
+        self.calls.append('refresh')
+        return {'status': {'checkId': checkId, 'status': 'enqueued'}}
+
+roleCredentials = {'Credentials': {'AccessKeyId': 'a', 'SecretAccessKey': 'b',
+    'SessionToken': 'c'}}
+
+class RefreshPlanningTest(unittest.TestCase):
+    def setUp(self):
+        self.support = FakeSupport()
+        patches = [mock.patch.object(credential_cache, 'assumeRole',
+                return_value=roleCredentials),
+            mock.patch.object(client_factory, 'getClient',
+                return_value=self.support)]
+        for x in patches:
+            x.start()
+            self.addCleanup(x.stop)
+
+    def test_checks_of_an_account_are_planned_at_once(self):
+        refreshTACheck = loadLambda('refresh-ta-check-lambda.py', {'IAMRoleName': 'role'})
+        checks = refreshTACheck.lambda_handler([{'AccountId': '111111111111', 'CheckId': x}
+            for x in ['a', 'b', 'c']], None)
+        self.assertEqual(self.support.calls, ['summaries', 'statuses'])
+        self.assertEqual([(x['RefreshAction'], x['RefreshStatus']) for x in checks],
+            [(refresh_planner.REFRESH, 'none'), (refresh_planner.POLL, 'processing'),
+             (refresh_planner.REFRESH, 'none')])
+
+    def test_refresh_uses_the_planned_action(self):
+        refreshTACheck = loadLambda('refresh-ta-check-lambda.py', {'IAMRoleName': 'role'})
+        event = refreshTACheck.lambda_handler({'AccountId': '111111111111',
+            'CheckId': 'a', 'RefreshAction': refresh_planner.REFRESH,
+            'RefreshStatus': 'none'}, None)
+        self.assertEqual(self.support.calls, ['refresh'])
+        self.assertEqual(event['RefreshStatus'], 'enqueued')
+        event = refreshTACheck.lambda_handler({'AccountId': '111111111111',
+            'CheckId': 'b', 'RefreshAction': refresh_planner.POLL,
+            'RefreshStatus': 'processing'}, None)
+        self.assertEqual(self.support.calls, ['refresh'])
+        self.assertEqual((event['RefreshStatus'], event['RefreshSkipped']),
+            ('processing', False))
+
+    def test_failed_planning_leaves_the_checks_unplanned(self):
+        refreshTACheck = loadLambda('refresh-ta-check-lambda.py', {'IAMRoleName': 'role'})
+        with mock.patch.object(credential_cache, 'assumeRole', side_effect=Exception('denied')):
+            checks = refreshTACheck.lambda_handler([{'AccountId': '111111111111',
+                'CheckId': 'a'}], None)
+        self.assertEqual(checks, [{'AccountId': '111111111111', 'CheckId': 'a'}])
+        self.assertEqual(self.support.calls, [])
+
+    def test_unplanned_check_is_planned_by_the_refresh(self):
+        refreshTACheck = loadLambda('refresh-ta-check-lambda.py', {'IAMRoleName': 'role'})
+        refreshTACheck.lambda_handler({'AccountId': '111111111111', 'CheckId': 'a'}, None)
+        self.assertEqual(self.support.calls, ['summaries', 'statuses', 'refresh'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+######################################################################################################################
+#  Copyright 2019 Amazon.com, Inc. or its affiliates. All Rights Reserved.                                           #
+#                                                                                                                    #
+#  Licensed under the Apache License Version 2.0 (the "License"). You may not use this file except in compliance     #
+#  with the License. A copy of the License is located at                                                             #
+#                                                                                                                    #
+#      http://www.apache.org/licenses/                                                                               #
+#                                                                                                                    #
+#  or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES #
+#  OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific language governing permissions    #
+#  and limitations under the License.                                                                                #
+######################################################################################################################
+
+
+
+import json,os,unittest
+from unittest import mock
+from tests.lambdas import loadLambda
+import client_factory
+
+class FakeS3(object):
+    def __init__(self):
+        self.keys = []
+
+    def get_paginator(self, name):
+        return self
+
+    def paginate(self, Bucket, Prefix):
+        return [{'Contents': []}]
+
+    def put_object(self, Bucket, Key, **kwargs):
+        self.keys.append(Key)
+
+class FakeSFN(object):
+    def __init__(self):
+        self.inputs = []
+
+    def start_execution(self, stateMachineArn, input):
+        self.inputs.append(json.loads(input))
+        return {'executionArn': 'arn', 'ResponseMetadata': {'HTTPStatusCode': 200}}
+
+account = {'AccountId': '111111111111', 'AccountName': 'name', 'AccountEmail': 'email',
+    'Date': '10-17-2026', 'DateTime': '2026-10-17 09:00:00'}
+
+class RegionSweepTest(unittest.TestCase):
+    def setUp(self):
+        environment = mock.patch.dict(os.environ, {'S3BucketName': 'bucket',
+            'RegionSweepIntervalInDays': '7', 'ResourceTypes': 'ec2:instance',
+            'TAG_DATA_EXTRACT_SFN_ARN': 'arn', 'CustomerKeys': 'Owner'})
+        environment.start()
+        self.addCleanup(environment.stop)
+        self.s3 = FakeS3()
+        getClient = mock.patch.object(client_factory, 'getClient', return_value=self.s3)
+        getClient.start()
+        self.addCleanup(getClient.stop)
+
+    def test_sweep_is_marked_by_the_state_machine(self):
+        getTags = loadLambda('get-tags-lambda.py')
+        getTags.sfn = FakeSFN()
+        getTags.regionsCache.update({'Regions': ['us-east-1', 'eu-west-1'],
+            'ExpiresAt': float('inf')})
+        getTags.lambda_handler(dict(account), None)
+        self.assertEqual(self.s3.keys, [])
+        sfnInput = getTags.sfn.inputs[0]
+        self.assertEqual(sfnInput['SweepAccountId'], '111111111111')
+        self.assertEqual([x['Region'] for x in sfnInput['Resources']], ['us-east-1', 'eu-west-1'])
+        extractTagData = loadLambda('extract-tag-data-lambda.py')
+        extractTagData.lambda_handler({'SweepAccountId': '111111111111'}, None)
+        self.assertEqual(self.s3.keys, ['RegionIndex/111111111111/_sweep'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,121 @@
+######################################################################################################################
+#  Copyright 2019 Amazon.com, Inc. or its affiliates. All Rights Reserved.                                           #
+#                                                                                                                    #
+#  Licensed under the Apache License Version 2.0 (the "License"). You may not use this file except in compliance     #
+#  with the License. A copy of the License is located at                                                             #
+#                                                                                                                    #
+#      http://www.apache.org/licenses/                                                                               #
+#                                                                                                                    #
+#  or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES #
+#  OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific language governing permissions    #
+#  and limitations under the License.                                                                                #
+######################################################################################################################
+
+
+
+import re,unittest
+from decimal import ROUND_HALF_UP,Decimal
+from tests.lambdas import loadLambda
+
+#Evaluates the percentage expressions of summary_view the way Athena does:
+#decimal division is rounded half up to the larger scale of its operands,
+#+, - and * are exact
+tokenPattern=re.compile(r'\s*(?:"(\w+)"|\'([^\']*)\'|(\d+)|(\w+)|(\S))')
+
+class Expression(object):
+    def __init__(self, sql, row):
+        self.tokens = [x for x in tokenPattern.findall(sql)]
+        self.position = 0
+        self.row = row
+
+    def peek(self):
+        return self.tokens[self.position] if self.position < len(self.tokens) else None
+
+    def next(self):
+        self.position += 1
+        return self.tokens[self.position-1]
+
+    def expect(self, text):
+        token = self.next()
+        assert text in token, (text, token)
+
+    def evaluate(self):
+        value = self.sum()
+        assert self.peek() is None
+        return value
+
+    def sum(self):
+        value = self.product()
+        while self.peek() is not None and self.peek()[4] in ('+', '-'):
+            operator = self.next()[4]
+            right = self.product()
+            value = (value[0]+right[0] if operator == '+' else value[0]-right[0],
+                max(value[1], right[1]))
+        return value
+
+    def product(self):
+        value = self.term()
+        while self.peek() is not None and self.peek()[4] in ('*', '/'):
+            operator = self.next()[4]
+            right = self.term()
+            if operator == '*':
+                value = (value[0]*right[0], value[1]+right[1])
+            else:
+                scale = max(value[1], right[1])
+                value = ((value[0]/right[0]).quantize(Decimal(1).scaleb(-scale),
+                    ROUND_HALF_UP), scale)
+        return value
+
+    def term(self):
+        column, string, number, word, symbol = self.next()
+        if symbol == '(':
+            value = self.sum()
+            self.expect(')')
+            return value
+        if number:
+            return Decimal(number), 0
+        if string:
+            return string, None
+        if word == 'CAST':
+            self.expect('(')
+            value = self.sum()
+            self.expect('AS')
+            target = self.next()[3]
+            if target == 'varchar':
+                self.expect(')')
+                return str(value[0]), None
+            self.expect('(')
+            self.next()
+            self.expect(',')
+            scale = int(self.next()[2])
+            self.expect(')')
+            self.expect(')')
+            return Decimal(value[0]).quantize(Decimal(1).scaleb(-scale)), scale
+        if column == 'replace':
+            self.expect('(')
+            value = self.sum()[0]
+            self.expect(',')
+            old = self.next()[1]
+            self.expect(',')
+            new = self.next()[1]
+            self.expect(')')
+            return value.replace(old, new), None
+        return Decimal(self.row[column]), 0
+
+class RollupPercentagesTest(unittest.TestCase):
+    def test_rollup_percentages_match_summary_view(self):
+        views = loadLambda('create-athena-views-lambda.py')
+        rollup = loadLambda('rollup-ta-data-lambda.py')
+        expressions = dict((alias, sql) for sql, alias in
+            re.findall(r'\n\s*, (\(.*\)) "(\w+)"', views.summaryViewQuery))
+        self.assertEqual(sorted(expressions), ['optimizationPercent', 'trueoptimizationPercent'])
+        for counts in [(3, 1, 0, 0), (0, 0, 0, 0), (1, 1, 0, 0), (10, 3, 1, 0),
+                (7, 2, 1, 1), (105, 17, 3, 2), (20, 20, 5, 5), (2000, 999, 1, 0),
+                (12345, 6789, 12, 34)]:
+            row = dict(zip(rollup.countColumns, counts))
+            view = tuple(float(Expression(expressions[x], row).evaluate()[0])
+                for x in ['optimizationPercent', 'trueoptimizationPercent'])
+            self.assertEqual(rollup.optimizationPercents(counts), view, counts)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+######################################################################################################################
+#  Copyright 2019 Amazon.com, Inc. or its affiliates. All Rights Reserved.                                           #
+#                                                                                                                    #
+#  Licensed under the Apache License Version 2.0 (the "License"). You may not use this file except in compliance     #
+#  with the License. A copy of the License is located at                                                             #
+#                                                                                                                    #
+#      http://www.apache.org/licenses/                                                                               #
+#                                                                                                                    #
+#  or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES #
+#  OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific language governing permissions    #
+#  and limitations under the License.                                                                                #
+######################################################################################################################
+
+import os,unittest
+from unittest import mock
+from decimal import Decimal
+from tests.lambdas import loadLambda
+import glue_catalog
+
+extract=loadLambda('extract-ta-data-lambda.py')
+rollup=loadLambda('rollup-ta-data-lambda.py')
+
+class ParseNumberTest(unittest.TestCase):
+    def test_numbers_are_kept(self):
+        self.assertEqual(glue_catalog.parseNumber(5e-05),5e-05)
+        self.assertEqual(glue_catalog.parseNumber(42),42)
+        self.assertEqual(glue_catalog.parseNumber(Decimal('-1.25')),Decimal('-1.25'))
+
+    def test_scientific_notation(self):
+        self.assertEqual(glue_catalog.parseNumber('5e-05'),Decimal('0.00005'))
+        self.assertEqual(glue_catalog.parseNumber('1.5e-07'),Decimal('1.5e-07'))
+        self.assertEqual(glue_catalog.parseNumber('1.2E+3'),Decimal('1200'))
+
+    def test_currency_and_separators(self):
+        self.assertEqual(glue_catalog.parseNumber('-$12.50'),Decimal('-12.50'))
+        self.assertEqual(glue_catalog.parseNumber('$-12.50'),Decimal('-12.50'))
+        self.assertEqual(glue_catalog.parseNumber('$1,234.00'),Decimal('1234.00'))
+        self.assertEqual(glue_catalog.parseNumber('12.5%'),Decimal('12.5'))
+        self.assertEqual(glue_catalog.parseNumber('Up to 5 instances'),Decimal('5'))
+
+    def test_not_a_number(self):
+        for value in [None,True,'','-','abc','NaN','Infinity',float('inf')]:
+            self.assertIsNone(glue_catalog.parseNumber(value),value)
+
+class ConvertValueTest(unittest.TestCase):
+    def test_double(self):
+        self.assertEqual(extract.convertValue(5e-05,'double'),5e-05)
+        self.assertEqual(extract.convertValue('5e-05','double'),5e-05)
+        self.assertEqual(extract.convertValue('-$12.50','double'),-12.5)
+
+    def test_decimal(self):
+        self.assertEqual(extract.convertValue('1.5e-07','decimal'),Decimal('0.00'))
+        self.assertEqual(extract.convertValue(1234.5,'decimal'),Decimal('1234.50'))
+        self.assertEqual(extract.convertValue('-$1,234.567','decimal'),Decimal('-1234.57'))
+
+    def test_bigint(self):
+        self.assertEqual(extract.convertValue('1.2E+3','bigint'),1200)
+        self.assertEqual(extract.convertValue(7,'bigint'),7)
+        self.assertEqual(extract.convertValue('1,234','bigint'),1234)
+        self.assertIsNone(extract.convertValue('n/a','bigint'))
+
+    def test_untyped(self):
+        self.assertEqual(extract.convertValue('$1,234','string'),'$1,234')
+        self.assertIsNone(extract.convertValue(None,'double'))
+
+class RollupToNumberTest(unittest.TestCase):
+    def test_to_number(self):
+        self.assertEqual(rollup.toNumber('-$12.50',Decimal),Decimal('-12.50'))
+        self.assertEqual(rollup.toNumber(1.5e-07,float),1.5e-07)
+        self.assertEqual(rollup.toNumber('1.2E+3',int),1200)
+        self.assertEqual(rollup.toNumber('',int),0)
+        self.assertEqual(rollup.toNumber(None,Decimal),Decimal(0))
+
+class IsNormalizedTest(unittest.TestCase):
+    def test_normalize_values_requires_the_hive_layout(self):
+        for layout,outputFormat,normalized in [('Hive','CSV',True),('Legacy','CSV',False),
+                ('Legacy','Parquet',True)]:
+            with mock.patch.dict(os.environ,{'NormalizeValues':'true',
+                    'PartitionLayout':layout,'OutputFormat':outputFormat}):
+                self.assertEqual(glue_catalog.isNormalized(),normalized)
+
+if __name__ == '__main__':
+    unittest.main()
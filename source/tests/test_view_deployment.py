@@ -0,0 +1,80 @@
+######################################################################################################################
+#  Copyright 2019 Amazon.com, Inc. or its affiliates. All Rights Reserved.                                           #
+#                                                                                                                    #
+#  Licensed under the Apache License Version 2.0 (the "License"). You may not use this file except in compliance     #
+#  with the License. A copy of the License is located at                                                             #
+#                                                                                                                    #
+#      http://www.apache.org/licenses/                                                                               #
+#                                                                                                                    #
+#  or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES #
+#  OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific language governing permissions    #
+#  and limitations under the License.                                                                                #
+######################################################################################################################
+
+import unittest
+from tests.lambdas import loadLambda
+
+class EntityNotFoundException(Exception): pass
+
+class FakeGlue(object):
+    class exceptions(object):
+        EntityNotFoundException = EntityNotFoundException
+
+    def __init__(self):
+        self.tables = {}
+
+    def get_table(self, DatabaseName, Name):
+        if Name not in self.tables:
+            raise EntityNotFoundException(Name)
+        return {'Table': self.tables[Name]}
+
+    def update_table(self, DatabaseName, TableInput):
+        self.tables[TableInput['Name']] = TableInput
+
+class FakeAthena(object):
+    def __init__(self, glue):
+        self.glue = glue
+        self.queries = []
+
+    def start_query_execution(self, QueryString, **kwargs):
+        self.queries.append(QueryString)
+        self.glue.tables['v'] = {'Name': 'v', 'StorageDescriptor': {'Columns': []}}
+        return {'QueryExecutionId': str(len(self.queries))}
+
+    def get_query_execution(self, QueryExecutionId):
+        return {'QueryExecution': {'Status': {'State': 'SUCCEEDED'}}}
+
+def table(name, columns):
+    return {'Name': name, 'StorageDescriptor': {'Columns': [{'Name': x, 'Type': 'string'}
+        for x in columns]}, 'PartitionKeys': []}
+
+class ViewDeploymentTest(unittest.TestCase):
+    def setUp(self):
+        self.views = loadLambda('create-athena-views-lambda.py')
+        self.views.glueClient = self.glue = FakeGlue()
+        self.views.athenaClient = self.athena = FakeAthena(self.glue)
+        self.glue.tables['check_x'] = table('check_x', ['date', 'datetime'])
+        self.glue.tables['tags'] = table('tags', ['resourceid'])
+
+    def deploy(self):
+        return self.views.deployView('db', 's3://bucket/', 'CREATE OR REPLACE VIEW v AS '
+            'SELECT "check_x".* FROM (check_x LEFT JOIN tags ON x)', 'wg')['Status']
+
+    def test_tables_of_the_view(self):
+        self.assertEqual(sorted(self.views.getViewTableColumns('db', 'SELECT * FROM '
+            '((SELECT "d"."date" FROM "check_x" "d" JOIN "tags" ON x) "check_x"')),
+            ['check_x', 'tags'])
+
+    def test_unchanged_view_is_skipped(self):
+        self.assertEqual(self.deploy(), 'SUCCEEDED')
+        self.assertEqual(self.deploy(), 'UNCHANGED')
+        self.assertEqual(len(self.athena.queries), 1)
+
+    def test_new_table_column_redeploys_the_view(self):
+        self.deploy()
+        self.glue.tables['tags'] = table('tags', ['resourceid', 'owner'])
+        self.assertEqual(self.deploy(), 'SUCCEEDED')
+        self.assertEqual(len(self.athena.queries), 2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -11,8 +11,10 @@
 #  and limitations under the License.                                                                                #
 ######################################################################################################################
 
-import json,re,boto3,logging,os
+import json,logging,os
 from botocore.exceptions import ClientError
+import client_factory,credential_cache
+from pii_masking import lazy,sanitize_json,sanitize_string
 
 class AWSTrustedAdvisorExplorerGenericException(Exception): pass
 
@@ -23,53 +25,28 @@ if "LOG_LEVEL" in os.environ:
         raise ValueError('Invalid log level: %s' % loglevel)
     logger.setLevel(level=numeric_level) 
 
-def sanitize_json(x):
-    d = x.copy()
-    if os.environ['MASK_PII'].lower() == 'true':
-        for k, v in d.items():
-            if 'AccountId' in k:
-                d[k] = sanitize_string(v)
-            if 'AccountName' in k:
-                d[k] = v[:3]+'-MASKED-'+v[-3:]
-            if 'AccountEmail' in k:
-                d[k] = v[:3]+'-MASKED-'+v[-3:]
-    return d
-
-def sanitize_string(x):
-    y = str(x)
-    if os.environ['MASK_PII'].lower() == 'true':
-        pattern=re.compile('\d{12}')
-        y = re.sub(pattern,lambda match: ((match.group()[1])+'XXXXXXX'+(match.group()[-4:])), y)
-    return y
-
 def verify_trusted_advisor_check_status(supportClient,checkId):
     logger.info("Verify status of Check:"+checkId)
     response = supportClient.describe_trusted_advisor_check_refresh_statuses(
         checkIds=[checkId]
     )
-    logger.info(sanitize_json(response))
+    logger.info('%s', lazy(sanitize_json, response))
     return response
     
-#Assume Role in Child Account
+#Assume Role in Child Account (credentials are cached across invocations)
 def assumeRole(accountId):
     logger.info('Variables passed to assumeRole(): '+sanitize_string(accountId))
-    roleArn="arn:aws:iam::"+str(accountId)+":role/"+os.environ['IAMRoleName']
-    #STS assume role call
-    stsClient = boto3.client('sts')
-    roleCredentials = stsClient.assume_role(RoleArn=roleArn, RoleSessionName="AWSTrustedAdvisorExplorerAssumeRole")
-    return roleCredentials
+    #STS assume role call, served from the container's credential cache
+    return credential_cache.assumeRole(accountId)
         
 def lambda_handler(event, context):
     try:
-        logger.info(sanitize_json(event))
+        logger.info('%s', lazy(sanitize_json, event))
         logger.info("Assume role in child account")
         roleCredentials=assumeRole(event['AccountId'])       
-        logger.info("Create boto3 support client using the temporary credentials")
-        supportClient=boto3.client("support",region_name="us-east-1",
-            aws_access_key_id = roleCredentials['Credentials']['AccessKeyId'],
-            aws_secret_access_key = 
-                roleCredentials['Credentials']['SecretAccessKey'],
-            aws_session_token=roleCredentials['Credentials']['SessionToken'])
+        logger.info("Get the pooled boto3 support client for the temporary credentials")
+        supportClient=client_factory.getClient("support","us-east-1",
+            roleCredentials['Credentials'])
         response = verify_trusted_advisor_check_status(supportClient, 
                     event['CheckId']) 
         logger.info("Append the Refresh Status '"+response['statuses'][0]['status']+"' to response." +